@@ -7,17 +7,33 @@ from .semanticanalysis import IfWrapper, SemanticAnalysisError, \
     Scope, ClassDefinition, InterfaceDefinition, creates_new_variable_scope, VariableDefinition, \
     LocalVariableDefinition, GlobalVariableDefinition, ParameterDefinition, type_node_to_list_of_types, \
     list_to_typed_node, list_to_attribute_access_node, is_call_lambda, \
-    nested_same_binop_to_list, gensym, FieldDefinition
+    nested_same_binop_to_list, gensym, FieldDefinition, find_defs, find_def
 from .abstractsyntaxtree import Node, Module, Call, Block, UnOp, BinOp, TypeOp, Assign, Identifier, ListLiteral, TupleLiteral, BracedLiteral, ArrayAccess, BracedCall, StringLiteral, AttributeAccess, Template, ArrowOp, ScopeResolution, LeftAssociativeUnOp, IntegerLiteral, FloatLiteral, NamedParameter, SyntaxTypeOp
 
 from collections import defaultdict
 import re
 import textwrap
+import os
+import threading
 
 
 mut_by_default = False
 
 
+class _CodegenOptions(threading.local):
+    # Set by codegen from the CompilationContext (per thread so that concurrent
+    # compiles don't share it).
+    # selfhost: generate the C++ the selfhost headers are built from: class
+    # instances as plain std::shared_ptr / std::unique_ptr (as held by the
+    # pybind bindings of _abstractsyntaxtree) and range based for loops.
+
+    def __init__(self):
+        self.selfhost = False
+
+
+codegen_options = _CodegenOptions()
+
+
 class CodeGenError(Exception):
     pass
 
@@ -41,15 +57,16 @@ cpp_preamble = r"""
 """
 
 
-def codegen(expr: Node):
+def codegen(expr: Node, context=None):
     assert isinstance(expr, Module)
     cx = Scope()
-    s = codegen_module(expr, cx)
+    codegen_options.selfhost = bool(context and context.selfhost_codegen)
+    s = codegen_module(expr, cx, context.partially_loaded_headers if context else ())
     print(s)
     return s
 
 
-def codegen_module(module: Module, cx: Scope):
+def codegen_module(module: Module, cx: Scope, partially_loaded_headers=()):
     assert isinstance(module, Module)
     modcpp = ""
 
@@ -70,12 +87,31 @@ def codegen_module(module: Module, cx: Scope):
             modcpp += modarg_code
 
     for path, include_code in included_module_code.items():
-        with open(path, "w") as include_file:
-            include_file.write("#pragma once\n" + cpp_preamble + include_code)
+        if path in partially_loaded_headers:
+            # up to date (unreferenced definitions weren't loaded from the parse cache)
+            continue
+        _write_header(path, "#pragma once\n" + cpp_preamble + include_code)
 
     return cpp_preamble + modcpp
 
 
+def _write_header(path, code):
+    # A macro dll being built in the background may be reading the current version
+    # of this header. Only touch it if changed and never leave it partially written.
+    try:
+        with open(path) as f:
+            unchanged = f.read() == code
+        if unchanged:
+            os.utime(path)  # (up to date: see parser._header_source_time)
+            return
+    except FileNotFoundError:
+        pass
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(code)
+    os.replace(tmp_path, path)
+
+
 def codegen_block(block: Block, cx):
     assert isinstance(block, Block)
     cpp = ""
@@ -96,6 +132,8 @@ def codegen_block_item(b : Node, cx):
 
     if isinstance(b, Call):
         if b.func.name == "for":
+            if codegen_options.selfhost:
+                return codegen_range_based_for(b, cx)
             return codegen_for(b, cx)
         elif b.func.name in ["class", "struct"]:
             return codegen_class(b, cx)
@@ -541,7 +579,7 @@ def codegen_lambda(node, cx):
                     capture_this_by_ref = True
                     return "&"
                 elif a.name == "val":
-                    if a.scope.find_def(a):
+                    if find_def(a):
                         raise CodeGenError("no generic 'val' capture allowed because a variable named 'val' has been defined.", a)
                     return "="
                 return codegen_node(a, cx)
@@ -569,7 +607,7 @@ def codegen_lambda(node, cx):
                 possible_captures.append(i.name)
             elif isinstance(i.parent, Call) and i.parent.func.name in ["def", "lambda"]:
                 pass  # don't capture a lambda parameter
-            elif (d := i.scope.find_def(i)) and isinstance(d, (LocalVariableDefinition, ParameterDefinition)):
+            elif (d := find_def(i)) and isinstance(d, (LocalVariableDefinition, ParameterDefinition)):
                 defnode = d.defined_node
                 is_capture = True
                 while defnode is not None:
@@ -1372,7 +1410,7 @@ def _is_unique_var(node: Identifier, cx: Scope):
         # nodes on rhs of TypeOp currently don't have a scope
         return False
 
-    for defn in node.scope.find_defs(node):
+    for defn in find_defs(node):
         if isinstance(defn, (LocalVariableDefinition, ParameterDefinition)):
             if _is(defn.defining_node):
                 return True
@@ -1454,7 +1492,7 @@ def codegen_attribute_access(node: AttributeAccess, cx: Scope):
             scope_resolution_list.append(leading.rhs)
             leading = leading.lhs
 
-        if isinstance(leading, Identifier) and leading.name != "self" and not leading.scope.find_def(leading):
+        if isinstance(leading, Identifier) and leading.name != "self" and not find_def(leading):
 
             # I think we can get away without overparenthesizing chained scope resolutions (in C++ :: binds tightest so is not actually left associative - https://learn.microsoft.com/en-us/cpp/cpp/cpp-built-in-operators-precedence-and-associativity?view=msvc-170 is a better reference than https://en.cppreference.com/w/cpp/language/operator_precedence here)
             scope_resolution_code = leading.name
@@ -1713,11 +1751,17 @@ def _shared_ptr_str_for_type(type_node, cx):
         return None
 
     if classdef := cx.lookup_class(type_node):
-        shared_ptr_str_begin = "ceto::propagate_const<std::shared_ptr<<"
-        shared_ptr_str_end = ">>"
-        # unique_ptr could use std::experimental::propagate_const but needs autoderef handling in ceto.h:
-        unique_ptr_str_begin = "ceto::propagate_const<std::unique_ptr<<"
-        unique_ptr_str_end = ">>"
+        if codegen_options.selfhost:
+            shared_ptr_str_begin = "std::shared_ptr<"
+            shared_ptr_str_end = ">"
+            unique_ptr_str_begin = "std::unique_ptr<"
+            unique_ptr_str_end = ">"
+        else:
+            shared_ptr_str_begin = "ceto::propagate_const<std::shared_ptr<"
+            shared_ptr_str_end = ">>"
+            # unique_ptr could use std::experimental::propagate_const but needs autoderef handling in ceto.h:
+            unique_ptr_str_begin = "ceto::propagate_const<std::unique_ptr<"
+            unique_ptr_str_end = ">>"
 
         if isinstance(classdef, InterfaceDefinition):
             # TODO this clearly needs a revisit (or just scrap current 'interface' handling)
@@ -1750,6 +1794,8 @@ def _sublist_indices(sublist, lst : typing.List):
 
 
 def _propagate_const_str(string: str) -> str:
+    if codegen_options.selfhost:
+        return string
     return "ceto::propagate_const<" + string + ">"
 
 
@@ -1767,9 +1813,9 @@ def _codegen_compound_class_type(types, cx):
     if class_def.is_unique:
         # we should perhaps remove these
         if indices := _sublist_indices(["const", class_name, "ref"], typenames):
-            return "const ceto::propagate_const<std::unique_ptr<const " + class_name + ">>&", indices
+            return "const " + _propagate_const_str("std::unique_ptr<const " + class_name + ">") + "&", indices
         if indices := _sublist_indices([class_name, "const", "ref"], typenames):
-            return "const ceto::propagate_const<std::unique_ptr<const " + class_name + ">>&", indices
+            return "const " + _propagate_const_str("std::unique_ptr<const " + class_name + ">") + "&", indices
     if not class_def.is_struct and ("ref" in typenames or "ptr" in typenames or "rref" in typenames):
         raise CodeGenError("no ref/ptr specifiers allowed for class. Use Foo.class instead, or make your class a struct", types[0])
     if indices := _sublist_indices(["shared", "mut", class_name], typenames):
@@ -1987,7 +2033,7 @@ def codegen_assign(node: Assign, cx: Scope):
                     assign_str = "decltype(" + rhs_str + ") " + codegen_node(node.lhs, cx) + " = " + rhs_str
                 else:
                     assign_str = codegen_node(node.lhs, cx) + " = " + rhs_str
-                    if not node.lhs.scope.find_def(node.lhs):
+                    if not find_def(node.lhs):
                         # just auto not const auto
                         assign_str = "auto " + assign_str
                 node.lhs.declared_type = old_type
@@ -2073,7 +2119,7 @@ def codegen_assign(node: Assign, cx: Scope):
         is_tie = False
 
         for a in node.lhs.args:
-            if not isinstance(a, Identifier) or a.scope.find_def(a):
+            if not isinstance(a, Identifier) or find_def(a):
                 if node.lhs.declared_type:
                     raise CodeGenError('typed tuple unpacking ("structured bindings" in C++) can\'t redefine variable: ', a)
                 is_tie = True
@@ -2286,10 +2332,13 @@ def codegen_call(node: Call, cx: Scope):
 
                     const_part = "const " if _is_const_make(node) else ""
 
-                    if class_def.is_unique:
-                        func_str = "ceto::make_unique_propagate_const<" + const_part + class_name + ">"
+                    if codegen_options.selfhost:
+                        make = "std::make_unique" if class_def.is_unique else "std::make_shared"
+                    elif class_def.is_unique:
+                        make = "ceto::make_unique_propagate_const"
                     else:
-                        func_str = "ceto::make_shared_propagate_const<" + const_part + class_name + ">"
+                        make = "ceto::make_shared_propagate_const"
+                    func_str = make + "<" + const_part + class_name + ">"
 
                 return func_str + args_str
 
@@ -2655,7 +2704,7 @@ def _decltype_str(node, cx):
 
     # defs = list(find_defs(node))   # fails because only 1 (uncompleted) pass over ast to build scopes
     # defs = list(cx.find_defs(node))   # fails because only 1 (uncompleted) pass over ast to build scopes
-    defs = list(node.scope.find_defs(node))
+    defs = list(find_defs(node))
     if not defs:
         return True, node.name
 
@@ -2817,7 +2866,7 @@ def codegen_node(node: Node, cx: Scope):
         # elif name == "object":
         #     return "std::shared_ptr<object>"
 
-        if cx.in_function_body and not (isinstance(node.parent, (AttributeAccess, ScopeResolution, ArrowOp)) and node is node.parent.rhs) and isinstance(node.scope.find_def(node), FieldDefinition):
+        if cx.in_function_body and not (isinstance(node.parent, (AttributeAccess, ScopeResolution, ArrowOp)) and node is node.parent.rhs) and isinstance(find_def(node), FieldDefinition):
             raise CodeGenError(f"no direct access to fields - use self.{node.name} instead of just {node.name}", node)
 
         if not (isinstance(node.parent, (AttributeAccess, ScopeResolution)) and
@@ -2826,9 +2875,8 @@ def codegen_node(node: Node, cx: Scope):
             ptr_begin, ptr_end = ptr_name
             return ptr_begin + ("const " if not mut_by_default else "") + name + ptr_end
 
-        is_last_use = is_last_use_of_identifier(node)
-
-        if is_last_use and _is_unique_var(node, cx):
+        # (the last use check scans the rest of each enclosing block)
+        if _is_unique_var(node, cx) and is_last_use_of_identifier(node):
             return "std::move(" + name + ")"
 
         return name
@@ -1,6 +1,7 @@
-from .parser import parse, parse_from_cmdargs, Node, Module
-from .parser import ParseException
-from .semanticanalysis import semantic_analysis, macro_expansion, SemanticAnalysisError
+from .parser import parse, parse_from_cmdargs, CompilationContext, Node, Module
+from .parser import ParseException, DEFAULT_PACKRAT_CACHE_SIZE
+from .semanticanalysis import semantic_analysis, macro_expansion, wait_for_macro_builds, clear_resolved_definitions, SemanticAnalysisError
+from ._abstractsyntaxtree import close_macro_libraries
 from .codegen import codegen, CodeGenError
 
 import os
@@ -34,28 +35,37 @@ def safe_unique_filename(name, extension, basepath=""):
 perf_messages = []
 
 
-def compile_node(node) -> (str, Module):
+def compile_node(node, context=None) -> (str, Module):
     t = perf_counter()
     node = macro_expansion(node)
     perf_messages.append(f"macro time {perf_counter() - t}")
     print("after macro expand", node)
     t = perf_counter()
-    node = semantic_analysis(node)
+    semantic_perf_messages = []
+    node = semantic_analysis(node, semantic_perf_messages)
     perf_messages.append(f"semantic time {perf_counter() - t}")
+    perf_messages.extend(semantic_perf_messages)
     print("semantic", node)
     t = perf_counter()
-    code = codegen(node)
+    try:
+        code = codegen(node, context)
+    finally:
+        clear_resolved_definitions()
     code = code.replace("CETO_PRIVATE_ESCAPED_UNICODE", "\\u")
     perf_messages.append(f"codegen time {perf_counter() - t}")
+    t = perf_counter()
+    wait_for_macro_builds()
+    perf_messages.append(f"waiting for unused macro builds time {perf_counter() - t}")
     print("\n".join(perf_messages))
     return code, node
 
 
 def compile(cmdargs):
+    context = CompilationContext.from_cmdargs(cmdargs)
     t = perf_counter()
-    node = parse_from_cmdargs(cmdargs)
+    node = parse_from_cmdargs(cmdargs, context)
     perf_messages.append(f"parse time {perf_counter() - t}")
-    return compile_node(node)
+    return compile_node(node, context)
 
 
 def report_error(e):
@@ -111,7 +121,16 @@ def main():
     ap.add_argument("-m", "--compileonly", action='store_true', help="Compile ceto code only. Do not compile C++. Do not run program.")
     ap.add_argument("--donotexecute", action='store_true', help="If compiling C++, do not attempt to run an executable")
     ap.add_argument("--_nostandardlibmacros", action='store_true', help="Do not include standard lib macros during compilation (not recommended unless compiling the standard lib macros themselves)")
+    ap.add_argument("--_selfhost", action='store_true', help="Generate the C++ the selfhost headers (selfhost/*.donotedit.autogenerated.h) are built from: class instances as plain std::shared_ptr/std::unique_ptr (not ceto::propagate_const) and range based for loops. For regenerating the selfhost headers only.")
     ap.add_argument("--_norefs", action='store_true', help="Enable experimental mode to ban unsafe use of C++ references (without unsafe annotation). Currently implemented: ban all C++ references from subexpressions: An expression returning a reference must either be discarded or must be on the lhs of an Assignment (requiring a 'ref' type annotion if the reference is to be preserved instead of a copy). TODO: additional unsafe annotation for const:ref / mut:ref locals/members and mut:ref params")
+    ap.add_argument("-j", "--jobs", type=int, nargs="?", const=0, default=1, help="Number of macro dlls to build in parallel (no value: one per cpu). Macro expansion only waits for a dll when its macro is matched. Default: build each macro dll when its defmacro is encountered.")
+    ap.add_argument("--parsejobs", type=int, nargs="?", const=0, default=1, help="Number of processes parsing the top level blocks (e.g. each def/class) of a source file in parallel (no value: one per cpu). Default: parse serially.")
+    ap.add_argument("--eagerincludes", action='store_true', help="Load every definition of an included header from its parse cache. Default: a definition is only loaded if referenced by name (if the header's generated .h is up to date).")
+    ap.add_argument("--pyparsing", action='store_true', help="Parse with the pyparsing grammar instead of the (equivalent but much faster) native parser. Syntax errors are always reported by pyparsing.")
+    ap.add_argument("--packratcachesize", type=int, default=DEFAULT_PACKRAT_CACHE_SIZE, help=f"Maximum number of entries in the pyparsing packrat cache (least recently used entries are evicted). The cache is cleared after parsing each top level block. 0: unbounded. Default: {DEFAULT_PACKRAT_CACHE_SIZE}")
+    ap.add_argument("--sharedmacrodll", action='store_true', help="Compile all macros of a source file into a single dll, built when one of them is first used (instead of one dll per macro, built when the defmacro is encountered).")
+    ap.add_argument("--compiledmacros", action='store_true', help="Compile every defmacro body to a dll (by default macros are interpreted unless they use something the macro interpreter doesn't support).")
+    ap.add_argument("--includeindex", action='store_true', help="Save the listings of the header search directories (and the include graph) next to the transpiled file. The next build reuses the listings of the directories that haven't changed.")
     ap.add_argument("-I", "--include", type=str, nargs="*", help="Additional search directory for ceto headers (.cth files). Directory of transpiled file (first positional arg) takes priority in search.")
     ap.add_argument("filename")
     ap.add_argument("args", nargs="*")
@@ -135,14 +154,19 @@ def main():
         report_error(e)
         sys.exit(-1)
 
+    has_main_function = module.has_main_function
+    # nodes created by macro code may depend on the macro dlls
+    del module
+    close_macro_libraries()
+
     ext = ".h"
-    if module.has_main_function:
+    if has_main_function:
         ext = ".cpp"
 
     if cmdargs.filename:
         if cmdargs.filename.endswith("cth"):
             ext = ".h"
-            if module.has_main_function:
+            if has_main_function:
                 print("don't put 'main' function in a header", sys.stderr)
                 sys.exit(-1)
         elif cmdargs.filename.endswith("ctp"):
@@ -158,7 +182,7 @@ def main():
     with open(cppfilename, "w") as output:
         output.write(code)
 
-    if not module.has_main_function or cmdargs.compileonly:
+    if not has_main_function or cmdargs.compileonly:
         sys.exit(0)
 
     is_msvc = sys.platform == "win32" #CXX.startswith("cl") and not CXX.startswith("clang")
@@ -0,0 +1,537 @@
+# Evaluates defmacro bodies in-process (no macro dll / C++ compiler needed).
+#
+# A defmacro body (after quote expansion) is translated into python closures. Only the
+# subset of ceto typical macros use is supported: assignments, if / for / return,
+# lambdas, isinstance / asinstance, gensym, construction of ast nodes, and a few methods
+# on nodes, vectors and strings. Anything else (including calls to functions defined
+# elsewhere in the module) raises MacroNotInterpretable and the macro is compiled to a
+# dll as before. So does a MacroInterpreterError raised while the macro runs (e.g. a
+# method the interpreter doesn't model, which can only be told from the node's class,
+# or a TypeError / AttributeError from the ast node api).
+
+import typing
+
+from . import _abstractsyntaxtree as _ast
+from .abstractsyntaxtree import Node, Call, Block, UnOp, BinOp, TypeOp, Assign, Identifier, ListLiteral, ArrayAccess, StringLiteral, AttributeAccess, IntegerLiteral, FloatLiteral, EqualsCompareOp, BitwiseOrOp
+
+
+class MacroNotInterpretable(Exception):
+    pass
+
+
+class MacroInterpreterError(Exception):
+    pass
+
+
+node_classes = {name: getattr(_ast, name) for name in [
+    "Node", "UnOp", "LeftAssociativeUnOp", "BinOp", "TypeOp", "SyntaxTypeOp", "AttributeAccess",
+    "ArrowOp", "ScopeResolution", "BitwiseOrOp", "EqualsCompareOp", "Assign", "NamedParameter", "Call",
+    "ArrayAccess", "BracedCall", "Template", "Identifier", "StringLiteral", "IntegerLiteral",
+    "FloatLiteral", "ListLike_", "ListLiteral", "TupleLiteral", "BracedLiteral", "Block", "Module",
+    "RedundantParens", "InfixWrapper_"]}
+
+_constants = {"None": None, "nullptr": None, "True": True, "true": True, "False": False, "false": False}
+
+_gensym_counter = 0
+
+
+def _gensym():
+    global _gensym_counter
+    # distinct from the names generated by the (per dll) C++ gensym
+    name = "ceto__private__interpreted__ident__" + str(_gensym_counter)
+    _gensym_counter += 1
+    return Identifier(name)
+
+
+class _Return(Exception):
+    def __init__(self, value):
+        self.value = value
+
+
+class _Iterator:
+    """a vector iterator (only for insert(pos, first, last))"""
+
+    def __init__(self, vector, index):
+        self.vector = vector
+        self.index = index
+
+
+class _Optional:
+    """a std::optional (e.g. of Node.name())"""
+
+    def __init__(self, value):
+        self._value = value
+
+    def __bool__(self):
+        return self._value is not None
+
+    def __eq__(self, other):
+        # like C++: an empty optional is equal only to another empty one
+        if isinstance(other, _Optional):
+            return self._value == other._value
+        return self._value is not None and self._value == other
+
+    def __repr__(self):
+        return f"optional({self._value!r})"
+
+    def value(self):
+        if self._value is None:
+            raise MacroInterpreterError("bad optional access")
+        return self._value
+
+
+def _copy(value):
+    # C++ value semantics for vectors
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+
+def _at(container, index):
+    if not isinstance(index, int) or not 0 <= index < len(container):
+        raise MacroInterpreterError(f"index {index} out of bounds (size {len(container)})")
+    return container[index]
+
+
+def _nodes_equal(a, b):
+    if a is None or b is None:
+        return a is b
+    return a.ast_repr(preserve_source_loc=False, ceto_evalable=False) == b.ast_repr(preserve_source_loc=False, ceto_evalable=False)
+
+
+def _insert(vector, position, first, last):
+    if position.vector is not vector:
+        raise MacroInterpreterError("insert position is not an iterator of the vector")
+    vector[position.index:position.index] = first.vector[first.index:last.index]
+
+
+_node_methods = {
+    "name": lambda n: _Optional(n.name),
+    "equals": _nodes_equal,
+    "clone": lambda n: n.clone(),
+    "repr": lambda n: repr(n),
+    "classname": lambda n: type(n).__name__,
+    "lhs": lambda n: n.lhs,
+    "rhs": lambda n: n.rhs,
+    "parent": lambda n: n.parent,
+}
+
+_vector_methods = {
+    "size": len,
+    "empty": lambda v: not v,
+    "at": _at,
+    "front": lambda v: _at(v, 0),
+    "back": lambda v: _at(v, len(v) - 1),
+    "append": list.append,
+    "push_back": list.append,
+    "pop_back": lambda v: v.pop(),
+    "reserve": lambda v, n: None,
+    "begin": lambda v: _Iterator(v, 0),
+    "end": lambda v: _Iterator(v, len(v)),
+    "cbegin": lambda v: _Iterator(v, 0),
+    "cend": lambda v: _Iterator(v, len(v)),
+    "insert": _insert,
+}
+
+_optional_methods = {
+    "value": _Optional.value,
+    "has_value": bool,
+    "value_or": lambda o, default: default if o._value is None else o._value,
+}
+
+_string_methods = {
+    "size": len,
+    "length": len,
+    "empty": lambda s: not s,
+    "starts_with": str.startswith,
+    "ends_with": str.endswith,
+}
+
+_node_attributes = ["args", "func", "op", "integer_string", "float_string", "str", "prefix", "suffix", "declared_type"]
+
+_binops = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    ">": lambda a, b: a > b,
+    "<=": lambda a, b: a <= b,
+    ">=": lambda a, b: a >= b,
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+}
+
+_range_algorithms = {
+    "any_of": any,
+    "all_of": all,
+    "none_of": lambda values: not any(values),
+}
+
+
+def _call_method(obj, method, args):
+    if isinstance(obj, Node):
+        methods = _node_methods
+    elif isinstance(obj, list):
+        methods = _vector_methods
+    elif isinstance(obj, str):
+        methods = _string_methods
+    elif isinstance(obj, _Optional):
+        methods = _optional_methods
+    else:
+        raise MacroInterpreterError(f"can't call method {method} on {obj!r}")
+    if method not in methods:
+        raise MacroInterpreterError(f"unsupported method {method} for {type(obj).__name__}")
+    try:
+        return methods[method](obj, *args)
+    except (TypeError, AttributeError) as e:
+        # e.g. wrong args or x.lhs() of an Identifier (a C++ compile error in a dll)
+        raise MacroInterpreterError(f"can't call method {method} on {obj!r}: {e}")
+
+
+def _dotted_name(node):
+    if isinstance(node, Identifier):
+        return node.name
+    if isinstance(node, AttributeAccess) and isinstance(node.rhs, Identifier):
+        lhs = _dotted_name(node.lhs)
+        if lhs is not None:
+            return lhs + "." + node.rhs.name
+    return None
+
+
+class _Compiler:
+
+    def __init__(self, parameters: typing.Iterable[str]):
+        self.names = set(parameters)
+
+    def block(self, block: Block):
+        """:return: a callable evaluating the statements of block (returning the value of the last)"""
+        statements = [self.statement(s) for s in block.args]
+
+        def run(env):
+            value = None
+            for s in statements:
+                value = s(env)
+            return value
+
+        return run
+
+    def statement(self, node: Node):
+        if isinstance(node, Identifier) and node.name == "pass":
+            return lambda env: None
+
+        if isinstance(node, Identifier) and node.name == "return":
+            def return_none(env):
+                raise _Return(None)
+            return return_none
+
+        if isinstance(node, UnOp) and node.op == "return":
+            value = self.expression(node.args[0])
+
+            def return_value(env):
+                raise _Return(value(env))
+            return return_value
+
+        if isinstance(node, Assign) and node.op == "=" and not isinstance(node, _ast.NamedParameter):
+            target = node.lhs
+            while isinstance(target, TypeOp):
+                # type annotations don't matter here
+                target = target.lhs
+            if not isinstance(target, Identifier):
+                raise MacroNotInterpretable("unsupported assignment", node)
+            name = target.name
+            value = self.expression(node.rhs)
+            self.names.add(name)
+
+            def assign(env):
+                env[name] = _copy(value(env))
+            return assign
+
+        if isinstance(node, Call) and isinstance(node.func, Identifier):
+            if node.func.name == "for":
+                return self.for_loop(node)
+            if node.func.name == "unsafe" and len(node.args) == 1 and isinstance(node.args[0], Block):
+                return self.block(node.args[0])
+
+        return self.expression(node)
+
+    def for_loop(self, node: Call):
+        if len(node.args) != 2 or not isinstance(node.args[0], BinOp) or node.args[0].op != "in" or not isinstance(node.args[1], Block):
+            raise MacroNotInterpretable("unsupported for loop", node)
+        target = node.args[0].lhs
+        while isinstance(target, TypeOp):
+            target = target.lhs
+        if not isinstance(target, Identifier):
+            raise MacroNotInterpretable("unsupported for loop variable", node)
+        name = target.name
+        iterable = self.expression(node.args[0].rhs)
+        self.names.add(name)
+        body = self.block(node.args[1])
+
+        def for_loop(env):
+            for value in iterable(env):
+                env[name] = value
+                body(env)
+        return for_loop
+
+    def if_expression(self, node: Call):
+        branches = []
+        else_branch = None
+        args = list(node.args)
+        condition = args.pop(0)
+        while args:
+            block = args.pop(0)
+            if not isinstance(block, Block):
+                raise MacroNotInterpretable("unsupported if", node)
+            branches.append((self.expression(condition), self.block(block)))
+            if not args:
+                break
+            keyword = args.pop(0)
+            if isinstance(keyword, Identifier) and keyword.name == "else" and len(args) == 1 and isinstance(args[0], Block):
+                else_branch = self.block(args.pop(0))
+            elif isinstance(keyword, TypeOp) and isinstance(keyword.lhs, Identifier) and keyword.lhs.name == "elif":
+                condition = keyword.rhs
+            else:
+                raise MacroNotInterpretable("unsupported if", node)
+
+        def if_expression(env):
+            for condition, block in branches:
+                if condition(env):
+                    return block(env)
+            if else_branch:
+                return else_branch(env)
+            return None
+        return if_expression
+
+    def lambda_expression(self, node: Call):
+        if not node.args:
+            raise MacroNotInterpretable("unsupported lambda", node)
+        names = []
+        for param in node.args[:-1]:
+            while isinstance(param, TypeOp):
+                param = param.lhs
+            if not isinstance(param, Identifier):
+                raise MacroNotInterpretable("unsupported lambda param", node)
+            names.append(param.name)
+        self.names.update(names)
+        body = node.args[-1]
+        if isinstance(body, Block):
+            body = self.block(body)
+        else:
+            body = self.expression(body)
+
+        def make_lambda(env):
+            # captured by value when the lambda is created (a later assignment doesn't change it)
+            captured = dict(env)
+
+            def call(*args):
+                if len(args) != len(names):
+                    raise MacroInterpreterError("wrong number of lambda args")
+                lambda_env = dict(captured)
+                lambda_env.update(zip(names, args))
+                try:
+                    return body(lambda_env)
+                except _Return as r:
+                    return r.value
+            return call
+        return make_lambda
+
+    def call(self, node: Call):
+        func = node.func
+        name = _dotted_name(func)
+
+        if name == "if":
+            return self.if_expression(node)
+        if name == "lambda":
+            return self.lambda_expression(node)
+
+        if name in ["isinstance", "asinstance"] and len(node.args) == 2:
+            class_name = _dotted_name(node.args[1])
+            if class_name not in node_classes:
+                raise MacroNotInterpretable("unsupported isinstance type", node)
+            cls = node_classes[class_name]
+            value = self.expression(node.args[0])
+            if name == "isinstance":
+                return lambda env: isinstance(value(env), cls)
+
+            def asinstance(env):
+                v = value(env)
+                return v if isinstance(v, cls) else None
+            return asinstance
+
+        args = [self.expression(a) for a in node.args]
+
+        if name == "gensym" and not args:
+            return lambda env: _gensym()
+
+        if name == "ceto.macros.Skip" and not args:
+            return lambda env: _ast.MacroSkip()
+
+        if name == "ceto.bounds_check" and len(args) == 2:
+            container, index = args
+            return lambda env: _at(container(env), index(env))
+
+        if name in node_classes and name not in self.names:
+            cls = node_classes[name]
+
+            def construct(env):
+                values = [a(env) for a in args]
+                try:
+                    return cls(*values)
+                except TypeError as e:
+                    # no constructor overload for the args
+                    raise MacroInterpreterError(f"can't construct {name}: {e}")
+            return construct
+
+        if name and name.startswith("std.ranges.") and name[len("std.ranges."):] in _range_algorithms and len(args) == 2:
+            algorithm = _range_algorithms[name[len("std.ranges."):]]
+            values, predicate = args
+            return lambda env: algorithm(predicate(env)(v) for v in values(env))
+
+        if isinstance(func, AttributeAccess) and isinstance(func.rhs, Identifier) and not (name and name.split(".")[0] not in self.names):
+            obj = self.expression(func.lhs)
+            method = func.rhs.name
+
+            def call_method(env):
+                return _call_method(obj(env), method, [a(env) for a in args])
+            return call_method
+
+        if isinstance(func, Identifier) and func.name in self.names:
+            callee = self.expression(func)
+            return lambda env: callee(env)(*[a(env) for a in args])
+
+        raise MacroNotInterpretable("unsupported call", node)
+
+    def expression(self, node: Node):
+        if isinstance(node, Identifier):
+            name = node.name
+            if name in _constants:
+                value = _constants[name]
+                return lambda env: value
+            if name not in self.names:
+                raise MacroNotInterpretable("unknown name " + name, node)
+
+            def lookup(env):
+                if name not in env:
+                    raise MacroInterpreterError(name + " used before assignment")
+                return env[name]
+            return lookup
+
+        if isinstance(node, IntegerLiteral):
+            if node.suffix is not None:
+                raise MacroNotInterpretable("unsupported integer literal", node)
+            value = int(node.integer_string.replace("'", ""), 0)
+            return lambda env: value
+
+        if isinstance(node, FloatLiteral):
+            if node.suffix is not None:
+                raise MacroNotInterpretable("unsupported float literal", node)
+            value = float(node.float_string.replace("'", ""))
+            return lambda env: value
+
+        if isinstance(node, StringLiteral):
+            if node.prefix is not None or node.suffix is not None or "\\" in node.str:
+                raise MacroNotInterpretable("unsupported string literal", node)
+            value = node.str
+            return lambda env: value
+
+        if isinstance(node, ListLiteral):
+            elements = [self.expression(a) for a in node.args]
+            return lambda env: [e(env) for e in elements]
+
+        if isinstance(node, TypeOp) and not isinstance(node, _ast.SyntaxTypeOp) and isinstance(node.lhs, ListLiteral):
+            # e.g. [a, b] : Node
+            return self.expression(node.lhs)
+
+        if isinstance(node, Call):
+            return self.call(node)
+
+        if isinstance(node, UnOp):
+            operand = self.expression(node.args[0])
+            if node.op == "not":
+                return lambda env: not operand(env)
+            if node.op == "-":
+                return lambda env: -operand(env)
+            if node.op == "*":
+                def dereference(env):
+                    o = operand(env)
+                    if not isinstance(o, _Optional):
+                        raise MacroInterpreterError(f"can't dereference {o!r}")
+                    return o.value()
+                return dereference
+            raise MacroNotInterpretable("unsupported unary operator " + node.op, node)
+
+        if isinstance(node, AttributeAccess) and isinstance(node.rhs, Identifier) and node.rhs.name in _node_attributes:
+            obj = self.expression(node.lhs)
+            attribute = node.rhs.name
+
+            def get_attribute(env):
+                o = obj(env)
+                if not isinstance(o, Node):
+                    raise MacroInterpreterError(f"can't access .{attribute} of {o!r}")
+                try:
+                    return getattr(o, attribute)
+                except AttributeError:
+                    # e.g. .op of an Identifier
+                    raise MacroInterpreterError(f"{type(o).__name__} has no attribute {attribute}")
+            return get_attribute
+
+        if isinstance(node, ArrayAccess) and len(node.args) == 1:
+            container = self.expression(node.func)
+            index = self.expression(node.args[0])
+            return lambda env: _at(container(env), index(env))
+
+        if type(node) in [BinOp, EqualsCompareOp]:
+            lhs = self.expression(node.lhs)
+            rhs = self.expression(node.rhs)
+            if node.op == "and":
+                return lambda env: lhs(env) and rhs(env)
+            if node.op == "or":
+                return lambda env: lhs(env) or rhs(env)
+            if node.op in _binops:
+                op = _binops[node.op]
+                return lambda env: op(lhs(env), rhs(env))
+            raise MacroNotInterpretable("unsupported binary operator " + node.op, node)
+
+        raise MacroNotInterpretable("unsupported expression", node)
+
+
+def _parameter_initializer(name: str, defmacro_node: Call):
+    """the python equivalent of the parameter initialization in the macro impl generated by semanticanalysis.on_macro_def"""
+    for param in defmacro_node.args[1:-1]:
+        if not (isinstance(param, TypeOp) and isinstance(param.lhs, Identifier) and param.lhs.name == name):
+            continue
+        if isinstance(param.rhs, Identifier):
+            if param.rhs.name not in node_classes:
+                raise MacroNotInterpretable("unsupported macro param type", param)
+            cls = node_classes[param.rhs.name]
+            return lambda match: match[name] if isinstance(match[name], cls) else None
+        elif isinstance(param.rhs, ListLiteral):
+            return lambda match: match[name].args
+        elif isinstance(param.rhs, BitwiseOrOp):
+            non_none = [b.name for b in param.rhs.args if isinstance(b, Identifier) and b.name != "None"]
+            cls = node_classes.get(non_none[0]) if len(non_none) == 1 else Node
+            if cls is None:
+                raise MacroNotInterpretable("unsupported macro param type", param)
+            return lambda match: match[name] if name in match and isinstance(match[name], cls) else None
+        break
+    return lambda match: match[name]
+
+
+def interpret_macro(defmacro_node: Call, parameters: typing.Iterable[str], body: Block):
+    """:return: a callable implementing the macro given the (quote expanded) body (raises MacroNotInterpretable if unsupported)"""
+
+    initializers = {name: _parameter_initializer(name, defmacro_node) for name in parameters}
+    run = _Compiler(initializers.keys()).block(body)
+
+    def macro_impl(match):
+        env = {name: initialize(match) for name, initialize in initializers.items()}
+        try:
+            run(env)
+            result = None
+        except _Return as r:
+            result = r.value
+        if result is not None and not isinstance(result, (Node, _ast.MacroSkip)):
+            raise MacroInterpreterError(f"macro must return a Node, None or ceto.macros.Skip() (not {result!r})")
+        return result
+
+    return macro_impl
@@ -6,8 +6,15 @@ import typing
 import io
 import sys
 import os
+import json
+import mmap
 import pathlib
 import concurrent.futures
+import threading
+import bisect
+import collections
+import functools
+import tracemalloc
 from time import perf_counter
 import shutil
 
@@ -16,6 +23,9 @@ from .abstractsyntaxtree import Node, UnOp, LeftAssociativeUnOp, BinOp, TypeOp,
     Identifier, AttributeAccess, ScopeResolution, ArrowOp, BitwiseOrOp, EqualsCompareOp, Call, ArrayAccess, \
     BracedCall, IntegerLiteral, FloatLiteral, ListLiteral, TupleLiteral, BracedLiteral, \
     Block, Module, StringLiteral, RedundantParens, Assign, Template, InfixWrapper_, Source, SourceLoc
+from ._abstractsyntaxtree import parse_preprocessed as _native_parse_preprocessed, \
+    preprocess_source as _native_preprocess_source, serialize_ast, deserialize_ast, load_serialized_ast, \
+    referenced_names
 
 try:
     import cPyparsing as pp
@@ -26,8 +36,92 @@ except ImportError:
     from pyparsing import ParseException
 
 
+class PackratCache:
+    """Bounded (least recently used) replacement for the pyparsing/cPyparsing packrat cache.
+
+    pyparsing looks up entries with get, cPyparsing with cache.get (and both store with set).
+    Peak memory is only reported when tracemalloc is tracing (e.g. python -X tracemalloc).
+    """
+
+    class _LRUDict(collections.OrderedDict):
+        def __init__(self):
+            super().__init__()
+            self.hits = 0
+            self.misses = 0
+
+        def get(self, key, default=None):
+            try:
+                value = self[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.move_to_end(key)
+            return value
+
+    def __init__(self, size: typing.Optional[int]):
+        self.size = size
+        self.cache = PackratCache._LRUDict()
+        self.not_in_cache = object()
+        self.peak_entries = 0
+        self.peak_memory = None
+
+    def get(self, key):
+        return self.cache.get(key, self.not_in_cache)
+
+    def set(self, key, value):
+        self.cache[key] = value
+        if self.size is not None and len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+        self.peak_entries = max(self.peak_entries, len(self.cache))
+
+    def resize(self, size: typing.Optional[int]):
+        self.size = size
+        if size is not None:
+            while len(self.cache) > size:
+                self.cache.popitem(last=False)
+
+    def clear(self):
+        self.cache.clear()
+
+    def __len__(self):
+        return len(self.cache)
+
+    def reset_stats(self):
+        self.cache.hits = 0
+        self.cache.misses = 0
+        self.peak_entries = 0
+        self.peak_memory = None
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+    def report_stats(self):
+        hits, misses = self.cache.hits, self.cache.misses
+        if not hits + misses:
+            return
+        if tracemalloc.is_tracing():
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+        print("packrat cache hits", hits, "misses", misses, "hit rate", f"{hits / (hits + misses):.1%}",
+              "peak entries", self.peak_entries,
+              *(["peak memory", self.peak_memory] if self.peak_memory is not None else []))
+
+
 pp.ParserElement.enablePackrat(None)
 
+DEFAULT_PACKRAT_CACHE_SIZE = 100000  # entries (the largest selfhost block peaks at ~170000)
+_packrat_cache = None
+
+
+def _install_packrat_cache(size: int) -> PackratCache:
+    global _packrat_cache
+    if _packrat_cache is None:
+        _packrat_cache = PackratCache(size or None)
+        pp.ParserElement.packrat_cache = _packrat_cache
+    elif _packrat_cache.size != (size or None):
+        # (each context may ask for a different size)
+        _packrat_cache.resize(size or None)
+    return _packrat_cache
+
 
 def _build_grammar():
 
@@ -192,11 +286,60 @@ class ParserError(Exception):
     pass
 
 
-main_source = Source()
+class CompilationContext:
+    """The options and state of parsing a source file (and the headers it includes).
+
+    Separate contexts may be used concurrently e.g. to transpile several files from different threads.
+    """
+
+    def __init__(self, filename: typing.Optional[str] = None, include_dirs: typing.Sequence[str] = (),
+                 standard_lib_macros: bool = False, lazy_includes: bool = False, include_index: bool = False,
+                 native_parser: bool = True, parse_jobs: int = 1,
+                 packrat_cache_size: int = DEFAULT_PACKRAT_CACHE_SIZE, selfhost_codegen: bool = False):
+        self.filename = filename  # (its directory is searched first for included headers)
+        self.include_dirs = list(include_dirs)
+        self.standard_lib_macros = standard_lib_macros
+        self.lazy_includes = lazy_includes
+        self.include_index = include_index
+        self.native_parser = native_parser
+        self.parse_jobs = parse_jobs  # 0: one per cpu
+        self.packrat_cache_size = packrat_cache_size
+        self.selfhost_codegen = selfhost_codegen  # see codegen.codegen_options
+
+        self.source = Source()
+        self.seen_modules = set()
+        self.include_resolver = _IncludeResolver()
+        self.lazy_definitions = {}  # placeholder name -> _LazyDefinition
+        self.referenced_names = set()  # names referred to by the loaded nodes
+        self.source_times = {}  # included module name -> see _header_source_time (None if codegen must write its header)
+
+        # generated headers that codegen must leave alone (up to date, but not every definition was loaded)
+        self.partially_loaded_headers = set()
+
+    @classmethod
+    def from_cmdargs(cls, cmdargs, **options):
+        """A context with the options given on the command line (if any) overridden by options."""
+        if cmdargs is not None:
+            options = dict(dict(filename=cmdargs.filename,
+                                include_dirs=cmdargs.include or [],
+                                standard_lib_macros=not cmdargs._nostandardlibmacros,
+                                lazy_includes=not cmdargs.eagerincludes,
+                                include_index=cmdargs.includeindex,
+                                native_parser=not cmdargs.pyparsing,
+                                parse_jobs=cmdargs.parsejobs,
+                                packrat_cache_size=cmdargs.packratcachesize,
+                                selfhost_codegen=cmdargs._selfhost), **options)
+        return cls(**options)
+
+
+# The pyparsing grammar (and its packrat cache) is shared. Parse with it (and use the below) only when holding the lock.
+_pyparsing_lock = threading.RLock()
+_pyparsing_source = None
+last_location = None
 
 
 def _source_loc(s: str, l: int) -> SourceLoc:
-    sl = SourceLoc(main_source, l)
+    sl = SourceLoc(_pyparsing_source, l)
     return sl
 
 
@@ -381,79 +524,155 @@ def _parse_infix_wrapper(s, l, t):
     return InfixWrapper_(args, source)
 
 
-def _build_elif_kludges_grammar():
-    elif_kw, else_kw, except_kw = [pp.Keyword(k) for k in ["elif", "else", "except"]]
+grammar = _build_grammar()
 
-    # officially an if stmt is of the form:
-    # if (condition:
-    #    pass
-    # elif: other_condition:
-    #    pass
-    # else:
-    #    pass
-    # )
-    # but the extra ":" after "elif" is annoying and unlike python (so we'll optionally insert it for you)
 
-    # An alternative is making "elif" "else" and "except" genuine UnOps (sometimes identifiers in the 'else' case)
-    patterns = [(k + ~pp.FollowedBy(pp.Literal(":") | pp.Literal("\n"))) for k in [elif_kw, except_kw]]
-    pattern = None
-    for p in patterns:
-        p = p.setParseAction(lambda t: t[0] + ":")
-        if pattern is None:
-            pattern = p
-        pattern |= p
+def _parse_preprocessed(source: str, context: CompilationContext):
+    global _pyparsing_source
 
-    # similarly for "if one liners"
-    # e.g. if (cond: pass else: pass)
-    # the official syntax is if (cond: pass, else: pass)
-    # but we want a multiline if to be convertable to a one-liner simply by joining lines without inserting ","
+    # print(source.replace("\x07", "!!!").replace("\x06", "&&&"))
 
-    patterns = [elif_kw, else_kw]
-    for p in patterns:
-        p = p.addParseAction(lambda t: "," + t[0])
-        pattern |= p
+    if context.native_parser:
+        # same grammar (see selfhost/parser.cth). None if the source doesn't
+        # parse - in which case pyparsing below raises the error
+        res = _native_parse_preprocessed(source.expandtabs(), context.source)
+        if res is not None:
+            return res
+
+    with _pyparsing_lock:
+        _pyparsing_source = context.source
+        cache = _install_packrat_cache(context.packrat_cache_size)
+        try:
+            res = grammar.parseString(source, parseAll=True)
+        finally:
+            # entries are keyed on the block text (no use for the next block)
+            cache.clear()
+    return res[0]
 
-    qs = pp.QuotedString('"', multiline=True, escChar="\\") | pp.QuotedString("'", multiline=True, escChar="\\")
-    pattern = pattern.ignore(qs)
-    return pattern
 
+def _parse_block_serialized(block_source: str, native_parser: bool, packrat_cache_size: int) -> bytes:
+    # runs in a worker process (nodes aren't picklable)
+    context = CompilationContext(native_parser=native_parser, packrat_cache_size=packrat_cache_size)
+    return serialize_ast(_parse_preprocessed(block_source.strip(), context))
 
-grammar = _build_grammar()
-elif_kludges = _build_elif_kludges_grammar()
 
+_parse_executor = None
+_parse_executor_lock = threading.Lock()
 
-def _parse_preprocessed(source: str):
-    source = elif_kludges.transformString(source)
 
-    # print(source.replace("\x07", "!!!").replace("\x06", "&&&"))
+def _parse_jobs(context: CompilationContext):
+    if sys.platform == "win32":
+        # parsing on windows needs the large stack thread below
+        return 1
+    return context.parse_jobs or os.cpu_count() or 1
 
-    res = grammar.parseString(source, parseAll=True)
-    return res[0]
 
+def _parse_blocks(blocks: typing.List[str], context: CompilationContext) -> typing.List[Module]:
+    global _parse_executor
+
+    jobs = _parse_jobs(context)
+    if jobs == 1 or len(blocks) < 2:
+        return [_parse_preprocessed(b.strip(), context) for b in blocks]
+
+    with _parse_executor_lock:
+        if _parse_executor is None:
+            _parse_executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+
+    # largest first so the pool isn't left waiting on a big block submitted last
+    futures = [None] * len(blocks)
+    for i in sorted(range(len(blocks)), key=lambda i: len(blocks[i]), reverse=True):
+        futures[i] = _parse_executor.submit(_parse_block_serialized, blocks[i], context.native_parser, context.packrat_cache_size)
+
+    return [deserialize_ast(f.result(), context.source) for f in futures]
 
-def parse_string(source: str):
-    from textwrap import dedent
 
+def _line_starts(source: str) -> typing.List[int]:
+    starts = [0]
+    index = source.find("\n")
+    while index != -1:
+        starts.append(index + 1)
+        index = source.find("\n", index + 1)
+    starts.append(len(source) + 1)
+    return starts
+
+
+def _relocate_block(module: Module, block_source: str, line_starts: typing.List[int]):
+    """Make the source locations of nodes parsed from the stripped block_source offsets into the whole source.
+
+    The block (see preprocess) has a newline for every line of the source preceding its last line so the line
+    of a location is exact. The column is that of the preprocessed line.
+    """
+    stripped_start = len(block_source) - len(block_source.lstrip())
+    newlines = [i for i, c in enumerate(block_source) if c == "\n"]
+    num_lines = len(line_starts) - 1
+
+    def relocate(loc):
+        pos = loc + stripped_start
+        line = bisect.bisect_left(newlines, pos)  # line n (from 1) is preceded by n newlines
+        col = pos - newlines[line - 1] - 1 if line > 0 else pos
+        line = min(max(line, 1), num_lines)
+        return min(line_starts[line - 1] + col, line_starts[line] - 1)
+
+    def visit(node):
+        node.source.loc = relocate(node.source.loc)
+        for a in node.args:
+            visit(a)
+        if node.func is not None:
+            visit(node.func)
+
+    for a in module.args:
+        visit(a)
+
+
+def _preprocess(source: str, context: CompilationContext) -> typing.Tuple[str, typing.List[str]]:
+    """The source after the escape replacements (what locations are offsets into) and its non-empty preprocessed
+    blocks.
+    """
+    preprocessed = _native_preprocess_source(source) if context.native_parser else None
+    if preprocessed is not None:
+        # the same in one pass (see selfhost/preprocessor.cth)
+        source, blocks = preprocessed
+        return source, [b for b in blocks if b.strip()]
+
+    # (also when the source doesn't preprocess - this raises the error)
     source = source.replace("\\\\", "CETO_PRIVATE_ESCAPED_ESCAPED")
     source = source.replace("\\U", "CETO_PRIVATE_ESCAPED_UNICODE")
     source = source.replace("\\u", "CETO_PRIVATE_ESCAPED_UNICODE")
     sio = io.StringIO(source)
-    preprocessed, _, subblocks = preprocess(sio, reparse=False)
+    _, _, subblocks = preprocess(sio, reparse=False)
+    return source, [block[1] for block in subblocks if block[1].strip()]
+
+
+def parse_string(source: str, context: typing.Optional[CompilationContext] = None):
+    from textwrap import dedent
+
+    if context is None:
+        from .compiler import cmdargs
+        context = CompilationContext.from_cmdargs(cmdargs)
+
+    source, blocks = _preprocess(source, context)
 
     parsed_nodes = []
 
-    futures = []
-    results = {}
+    line_starts = _line_starts(source)
 
-    for block in subblocks:
-        block_source = block[-1]
-        if not block_source.strip():
-            continue
-        m = _parse_preprocessed(block[1].strip())
+    if context.native_parser:
+        # no lock (pyparsing is only used for a block the native parser rejects - see _parse_preprocessed)
+        modules = _parse_blocks(blocks, context)
+    else:
+        with _pyparsing_lock:
+            # (the stats are those of this source)
+            packrat_cache = _install_packrat_cache(context.packrat_cache_size)
+            packrat_cache.reset_stats()
+            modules = _parse_blocks(blocks, context)
+            packrat_cache.report_stats()
+
+    for block_source, m in zip(blocks, modules):
         assert isinstance(m, Module)
+        _relocate_block(m, block_source, line_starts)
         parsed_nodes.extend(m.args)
 
-    main_source.source = source
+    context.source.source = source
 
     res = Module(parsed_nodes)
 
@@ -560,36 +779,121 @@ def expand_namespace_calls(module: Module):
     return module
 
 
-def parse_included_module(module: Identifier) -> typing.Tuple[str, str, Module]:
-    from .compiler import cmdargs
+class _IncludeResolver:
+    """Finds included headers and the files they're cached or generated in. Each search directory is
+    listed once (and each file stat'd once) for the lifetime of the resolver: a single build."""
+
+    INDEX_VERSION = 1
+
+    def __init__(self):
+        self._listings = {}  # directory -> names of its entries
+        self._listing_times = {}  # directory -> its mtime (ns) when listed
+        self._mtimes = {}
+        self._index = {}  # directory -> (mtime, entries) from a previous build
+        self.graph = {}  # included module name -> (.cth path, names of the modules it includes)
 
+    def _listing(self, dirname):
+        listing = self._listings.get(dirname)
+        if listing is None:
+            try:
+                dir_time = os.stat(dirname).st_mtime_ns
+            except OSError:
+                dir_time = None
+                listing = set()
+            else:
+                indexed = self._index.get(dirname)
+                if indexed is not None and indexed[0] == dir_time:
+                    listing = set(indexed[1])
+                else:
+                    listing = set(os.listdir(dirname))
+            self._listings[dirname] = listing
+            self._listing_times[dirname] = dir_time
+        return listing
+
+    def find(self, filename, dirs):
+        """The first directory in dirs containing filename (or None)."""
+        for dirname in dirs:
+            if filename in self._listing(dirname):
+                return dirname
+        return None
+
+    def isfile(self, path):
+        dirname, filename = os.path.split(path)
+        return filename in self._listing(dirname)
+
+    def getmtime(self, path):
+        mtime = self._mtimes.get(path)
+        if mtime is None:
+            mtime = self._mtimes[path] = os.path.getmtime(path)
+        return mtime
+
+    def written(self, path):
+        """Update what's known about path (just written)."""
+        dirname, filename = os.path.split(path)
+        self._listing(dirname).add(filename)
+        self._listing_times[dirname] = None  # (the listing can't be reused by the next build)
+        self._mtimes.pop(path, None)
+
+    def load_index(self, index_path):
+        """Reuse the directory listings saved by save_index for the directories that haven't changed since."""
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if index.get("version") == self.INDEX_VERSION:
+            self._index = {d: (listing["mtime"], listing["entries"]) for d, listing in index["directories"].items()}
+
+    def save_index(self, index_path):
+        index = {
+            "version": self.INDEX_VERSION,
+            "directories": {d: {"mtime": self._listing_times[d], "entries": sorted(listing)}
+                            for d, listing in self._listings.items() if self._listing_times[d] is not None},
+            # (not read back: the include dependencies e.g. for a build system)
+            "includes": {name: {"path": path, "includes": includes} for name, (path, includes) in self.graph.items()},
+        }
+        # rewritten in place: replacing it would change the directory's mtime (a partially written index is ignored)
+        with open(index_path, "w") as f:
+            json.dump(index, f, indent=1)
+
+
+def parse_included_module(module: Identifier, context: CompilationContext) -> typing.Tuple[str, str, Module]:
     module_name = module.name
-    maindir = os.path.dirname(os.path.realpath(cmdargs.filename))
     package_dir = os.path.dirname(__file__)
     include_dir = os.path.join(package_dir, os.pardir, "include")
-    dirs = [maindir, package_dir] + cmdargs.include  # include_dir?
-    cpp_module_path = None
-    for dirname in dirs:
-        module_path = os.path.join(dirname, module_name + ".cth")
-        if os.path.isfile(module_path):
-            cpp_module_path = os.path.join(dirname, module_name + ".donotedit.autogenerated.h")
-            repr_path = os.path.join(dirname, module_name + "cth.donotedit.danger_passed_to_python_eval.cetorepr")
-            break
-
-    if cpp_module_path is None:
+    dirs = [package_dir] + context.include_dirs  # include_dir?
+    if context.filename is not None:
+        dirs.insert(0, os.path.dirname(os.path.realpath(context.filename)))
+    if module_name.startswith("ceto__private__"):
+        from .semanticanalysis import private_selfhost_dir
+        dirs = [private_selfhost_dir()]
+
+    dirname = context.include_resolver.find(module_name + ".cth", dirs)
+    if dirname is None:
         raise ParserError("can't find .cth header for include", module)
 
-    return module_path, cpp_module_path, _parse_maybe_cached(module_path, repr_path)
+    module_path = os.path.join(dirname, module_name + ".cth")
+    cpp_module_path = os.path.join(dirname, module_name + ".donotedit.autogenerated.h")
+    cache_path = os.path.join(dirname, module_name + "cth.donotedit.autogenerated.cetoast")
 
+    module_ast = _parse_maybe_cached(module_path, cache_path, context, lazily=context.lazy_includes)
+    included_modules = [a.args[0].name for a in module_ast.args if _is_module_include(a)]
+    context.include_resolver.graph[module_name] = (module_path, included_modules)
+    for a in module_ast.args:
+        _set_header_paths(a, module_path, cpp_module_path)
 
-def _add_standard_lib_macro_imports(module: Module):
-    from .compiler import cmdargs
+    module_ast = expand_includes(module_ast, context)
 
-    if not cmdargs:
-        return
+    source_time = _header_source_time(module_path, cpp_module_path, included_modules, context)
+    context.source_times[module_name] = source_time
+    if source_time is None:
+        # codegen writes the whole header
+        _load_lazy_definitions(module_ast, lambda lazy: lazy.cache_path == cache_path, context)
+
+    return module_path, cpp_module_path, module_ast
 
-    if cmdargs._nostandardlibmacros:
-        return
+
+def _add_standard_lib_macro_imports(module: Module):
 
 #    destination_dir = os.path.dirname(os.path.realpath(cmdargs.filename))
 #    print(destination_dir)
@@ -622,100 +926,266 @@ def _add_standard_lib_macro_imports(module: Module):
     module.args = extra_includes + module.args
 
 
-add_standard_lib_macros = True
+class _LazyDefinition:
+    """A top level def/class/struct of an included header, in the module as a placeholder Identifier until loaded."""
+
+    def __init__(self, serialized, index: int, cache_path: str, context: CompilationContext):
+        self.serialized = serialized
+        self.index = index
+        self.cache_path = cache_path
+        self.context = context
+        self.name = serialized.definition_name(index)
+        self.placeholder = Identifier(f"ceto_private_lazy_definition_{len(context.lazy_definitions)}")
+        self.node = None
 
-def _parse_maybe_cached(filepath, repr_path):
-    if os.path.isfile(repr_path):
-        module_time = os.path.getmtime(filepath)
-        repr_time = os.path.getmtime(repr_path)
-        if repr_time > module_time:
-            with open(repr_path) as f:
-                repr_file = f.read()
+    def load(self) -> Node:
+        if self.node is None:
             try:
-                return expand_includes(eval(repr_file))
-            except SyntaxError:
-                pass
+                node = self.serialized.load_definition(self.index)
+                names = self.serialized.referenced_names(self.index)
+            except UnicodeDecodeError:
+                node = None
+            if node is None:
+                raise ParserError(f"corrupt parse cache {self.cache_path} (delete it)", self.placeholder)
+            self.node = node
+            _set_header_paths(self.node, self.placeholder.source.header_file_cth, self.placeholder.source.header_file_h)
+            self.context.referenced_names.update(names)
+        return self.node
+
+
+def _map_parse_cache(cache_path):
+    with open(cache_path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty
+            return None
+    serialized = load_serialized_ast(data)  # keeps the mapping alive
+    if not serialized.valid:  # truncated or written by another version
+        return None
+    return serialized
+
+
+def _load_lazily(serialized, cache_path, context: CompilationContext) -> Module:
+    args = []
+    for i in range(serialized.num_definitions()):
+        if serialized.definition_name(i):
+            args.append(None)
+            continue
+        node = serialized.load_definition(i)
+        if node is None:
+            return None
+        context.referenced_names.update(serialized.referenced_names(i))
+        args.append(node)
 
-    with open(filepath) as f:
-        source = f.read()
+    for i, node in enumerate(args):
+        if node is None:
+            lazy = _LazyDefinition(serialized, i, cache_path, context)
+            context.lazy_definitions[lazy.placeholder.name] = lazy
+            args[i] = lazy.placeholder
 
-    parsed_module = parse_string(source)
+    return serialized.root(args)
 
-    if add_standard_lib_macros: # and not any("ceto_private_" + m in filepath for m in slm_modules):
-        _add_standard_lib_macro_imports(parsed_module)
 
-    with open(repr_path, "w") as f:
-        if hasattr(parsed_module, "ast_repr"):  # not implemented in pure python ast
-            f.write(parsed_module.ast_repr())
+def _lazy_definition(node, context: CompilationContext):
+    if isinstance(node, Identifier):
+        return context.lazy_definitions.get(node.name)
+    return None
 
-    return expand_includes(parsed_module)
 
+def _load_lazy_definitions(module: Module, should_load, context: CompilationContext):
+    args = []
+    changed = False
+    for a in module.args:
+        lazy = _lazy_definition(a, context)
+        if lazy is not None and should_load(lazy):
+            a = lazy.load()
+            changed = True
+        args.append(a)
+    if changed:
+        module.args = args
+
+
+def _load_referenced_definitions(module: Module, context: CompilationContext):
+    """Load the lazily loaded definitions (transitively) referred to by name. The others are dropped."""
+    lazy_definitions = context.lazy_definitions
+    unloaded = collections.defaultdict(list)
+    for lazy in lazy_definitions.values():
+        if lazy.node is None:
+            unloaded[lazy.name].append(lazy)
+
+    worklist = [name for name in unloaded if name in context.referenced_names]
+    while worklist:
+        for lazy in unloaded.pop(worklist.pop(), []):
+            lazy.load()
+            worklist.extend(n for n in lazy.serialized.referenced_names(lazy.index) if n in unloaded)
+
+    args = []
+    for a in module.args:
+        lazy = _lazy_definition(a, context)
+        if lazy is None:
+            args.append(a)
+        elif lazy.node is not None:
+            args.append(lazy.node)
+        else:
+            context.partially_loaded_headers.add(a.source.header_file_h)
 
-seen_modules = set()
+    if lazy_definitions:
+        num_loaded = sum(lazy.node is not None for lazy in lazy_definitions.values())
+        print(f"lazily included definitions loaded {num_loaded} of {len(lazy_definitions)}")
+
+    module.args = args
+    lazy_definitions.clear()  # (unmaps the caches)
+    return module
+
+
+@functools.lru_cache(maxsize=None)
+def _compiler_time():
+    package_dir = os.path.dirname(__file__)
+    return max(os.path.getmtime(os.path.join(package_dir, f)) for f in os.listdir(package_dir)
+               if f.endswith((".py", ".so", ".pyd")))
+
+
+def _is_module_include(node):
+    return isinstance(node, Call) and node.func.name == "include" and len(node.args) == 1 and isinstance(node.args[0], Identifier)
 
-def expand_includes(node: Module):
-    def set_header_paths(node, cth_path, h_path):
-        if node.source.header_file_cth:
-            # avoid setting include path for nodes from a sub-include
-            return
-        node.source.header_file_cth = cth_path
-        node.source.header_file_h = h_path
-        for a in node.args:
-            set_header_paths(a, cth_path, h_path)
-        if node.func:
-            set_header_paths(node.func, cth_path, h_path)
-
-    while True:
-        new_args = None
-
-        for call in node.args:
-            if isinstance(call, Call) and call.func.name == "include":
-                if len(call.args) != 1:
-                    raise ParserError("include call must have a single arg", call)
-                module = call.args[0]
-                if not isinstance(module, Identifier):
-                    raise ParserError('module names must be valid identifiers', call)
-                if module.name not in seen_modules:
-                    seen_modules.add(module.name)  # self inclusion fine
-                    module_path_cth, module_path_h, module_ast = parse_included_module(module)
-                    call.args = [module]
-                    index = node.args.index(call)
-                    for a in module_ast.args:
-                        set_header_paths(a, module_path_cth, module_path_h)
-                    new_args = node.args[0:index] + module_ast.args + [Call(Identifier("ceto_private_module_boundary"), [])] + node.args[index:]
-                    break
-
-        if new_args:
-            node.args = new_args
-        else:
-            break
+
+def _header_source_time(cth_path, h_path, included_modules, context: CompilationContext):
+    """The latest mtime of cth_path and the .cth files (transitively) included.
+    None if the generated header h_path is older than that or the compiler (or an included header is out of date)."""
+    source_time = context.include_resolver.getmtime(cth_path)
+
+    for module_name in included_modules:
+        if module_name not in context.source_times:
+            continue  # (an include cycle e.g. the standard library headers)
+        included_time = context.source_times[module_name]
+        if included_time is None:
+            return None
+        source_time = max(source_time, included_time)
+
+    try:
+        header_time = context.include_resolver.getmtime(h_path)
+    except OSError:
+        return None
+
+    if header_time < max(source_time, _compiler_time()):
+        return None
+
+    return source_time
+
+
+def _parse_maybe_cached(filepath, cache_path, context: CompilationContext, lazily=False):
+    module = None
+    resolver = context.include_resolver
+
+    if resolver.isfile(cache_path) and resolver.getmtime(cache_path) > resolver.getmtime(filepath):
+        serialized = _map_parse_cache(cache_path)
+        if serialized is not None:
+            try:
+                if lazily:
+                    module = _load_lazily(serialized, cache_path, context)
+                else:
+                    module = serialized.load()
+                    if module is not None:
+                        context.referenced_names.update(referenced_names(module))
+            except UnicodeDecodeError:  # a corrupt name
+                module = None
+
+    if module is None:
+        with open(filepath) as f:
+            source = f.read()
+
+        module = parse_string(source, context)
+
+        if context.standard_lib_macros: # and not any("ceto_private_" + m in filepath for m in slm_modules):
+            _add_standard_lib_macro_imports(module)
+
+        # replaced rather than rewritten: the previous version may still be mapped
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(serialize_ast(module))
+        os.replace(tmp_path, cache_path)
+        resolver.written(cache_path)
+
+        context.referenced_names.update(referenced_names(module))
+
+    return module
+
+
+def _set_header_paths(node, cth_path, h_path):
+    if node.source.header_file_cth:
+        # avoid setting include path for nodes from a sub-include
+        return
+    node.source.header_file_cth = cth_path
+    node.source.header_file_h = h_path
+    for a in node.args:
+        _set_header_paths(a, cth_path, h_path)
+    if node.func:
+        _set_header_paths(node.func, cth_path, h_path)
+
+
+def expand_includes(node: Module, context: typing.Optional[CompilationContext] = None):
+    if context is None:
+        from .compiler import cmdargs
+        context = CompilationContext.from_cmdargs(cmdargs)
+
+    # The included modules are already expanded (and their includes are in seen_modules)
+    # so each include is spliced in place in a single pass.
+    new_args = []
+    expanded = False
+
+    for call in node.args:
+        if isinstance(call, Call) and call.func.name == "include":
+            if len(call.args) != 1:
+                raise ParserError("include call must have a single arg", call)
+            module = call.args[0]
+            if not isinstance(module, Identifier):
+                raise ParserError('module names must be valid identifiers', call)
+            if module.name not in context.seen_modules:
+                context.seen_modules.add(module.name)  # self inclusion fine
+                _, _, module_ast = parse_included_module(module, context)
+                call.args = [module]
+                new_args.extend(module_ast.args)
+                boundary = Call(Identifier("ceto_private_module_boundary"), [])
+                _set_header_paths(boundary, call.source.header_file_cth, call.source.header_file_h)
+                new_args.append(boundary)
+                expanded = True
+        new_args.append(call)
+
+    if expanded:
+        node.args = new_args
 
     return node
 
 
-def parse_from_cmdargs(cmdargs):
+def parse_from_cmdargs(cmdargs, context: typing.Optional[CompilationContext] = None):
+    if context is None:
+        context = CompilationContext.from_cmdargs(cmdargs)
+
     filename = cmdargs.filename
     dirname = os.path.dirname(os.path.realpath(cmdargs.filename))
-    repr_path = os.path.join(dirname, pathlib.Path(filename).name + ".donotedit.danger_passed_to_python_eval.cetorepr")
+    cache_path = os.path.join(dirname, pathlib.Path(filename).name + ".donotedit.autogenerated.cetoast")
+
+    index_path = os.path.join(dirname, pathlib.Path(filename).name + ".donotedit.autogenerated.includes.json")
+    if context.include_index:
+        context.include_resolver.load_index(index_path)
 
-    global add_standard_lib_macros
-    add_standard_lib_macros = True
+    result = expand_includes(_parse_maybe_cached(filename, cache_path, context), context)
+    result = _load_referenced_definitions(result, context)
 
-    result = _parse_maybe_cached(filename, repr_path)
+    if context.include_index:
+        context.include_resolver.save_index(index_path)
 
-    global seen_modules
-    seen_modules = set()
     return result
 
 
-def parse(source: str):
-    global add_standard_lib_macros
-    add_standard_lib_macros = False
+def parse(source: str, context: typing.Optional[CompilationContext] = None):
+    if context is None:
+        from .compiler import cmdargs
+        context = CompilationContext.from_cmdargs(cmdargs, standard_lib_macros=False, lazy_includes=False,
+                                                  include_index=False)
 
-    p = parse_string(source)
-    result = expand_includes(p)
-    global seen_modules
-    seen_modules = set()
+    p = parse_string(source, context)
+    result = expand_includes(p, context)
     return result
 
 
@@ -724,22 +1194,22 @@ if sys.platform != "win32":
 else:
     _parse_orig = parse_string
 
-    def parse_string(*args):
+    def parse_string(*args, **kwargs):
         result = None
         exc = None
 
-        def doit(args):
+        def doit(*a, **kw):
             nonlocal result
             nonlocal exc
             try:
-                result = _parse_orig(args)
+                result = _parse_orig(*a, **kw)
             except BaseException as e:
                 exc = e
 
         import threading
         sys.setrecursionlimit(5000)
         threading.stack_size(2**22)
-        thread = threading.Thread(target=doit, args=args)
+        thread = threading.Thread(target=doit, args=args, kwargs=kwargs)
         thread.start()
         thread.join()
 
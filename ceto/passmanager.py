@@ -0,0 +1,155 @@
+# Runs the python side AST passes with as few walks of the tree as possible.
+#
+# A pass is a pair of hooks called at each node of a pre-order walk (node, then args,
+# func, declared_type): visit (before the node's subtrees, may return a replacement
+# node) and leave (after them). Consecutive passes share one walk, each pass's hooks
+# running in list order at every node. A pass that needs another to have finished
+# over the whole tree first (e.g. it looks at grandchildren or the rest of the tree)
+# names it in requires, which ends the shared walk there.
+#
+# Time is accumulated per pass (just its hooks) plus the walking itself.
+
+from collections import defaultdict
+from time import perf_counter
+
+from .abstractsyntaxtree import Node
+
+
+class Pass:
+    name: str = None
+    # names of passes that must have been run over the whole tree first
+    requires: tuple = ()
+    # whether the pass walks into the .func / .declared_type of a node (args always)
+    visits_func = True
+    visits_declared_type = True
+
+    def skips(self, node: Node) -> bool:
+        # leave node and its subtree alone (for this pass only)
+        return False
+
+    def visit(self, node: Node):
+        return None
+
+    def leave(self, node: Node):
+        pass
+
+
+class VisitorPass(Pass):
+    # Adapts a visitor with visit_<NodeClass> / visit_Node methods (see apply_replacers)
+
+    def __init__(self, visitor, name: str = None, requires: tuple = ()):
+        self.visitor = visitor
+        self.name = name or visitor.__class__.__name__
+        self.requires = requires
+        self._methods = {}
+
+    def visit(self, node: Node):
+        cls = node.__class__
+        try:
+            method = self._methods[cls]
+        except KeyError:
+            method = getattr(self.visitor, "visit_" + cls.__name__, None) or getattr(self.visitor, "visit_Node", None)
+            self._methods[cls] = method
+        if method is not None:
+            return method(node)
+        return None
+
+
+def fuse(passes: list) -> list:
+    # Split passes into the groups that can share a walk
+    groups = []
+    group = []
+    seen = set()
+    for p in passes:
+        names = [q.name for q in group]
+        if any(r in names for r in p.requires):
+            groups.append(group)
+            group = []
+        later = [q.name for q in passes if q.name not in seen and q is not p]
+        for r in p.requires:
+            if r in later:
+                raise ValueError(f"pass {p.name} requires {r} which runs after it")
+        group.append(p)
+        seen.add(p.name)
+    if group:
+        groups.append(group)
+    return groups
+
+
+class PassManager:
+
+    def __init__(self, passes: list):
+        self.groups = fuse(passes)
+        self.pass_times = defaultdict(float)
+        self.walk_time = 0.0
+
+    def run(self, node: Node) -> Node:
+        for group in self.groups:
+            t = perf_counter()
+            before = sum(self.pass_times[p.name] for p in group)
+            node = self._walk(node, group)
+            self.walk_time += perf_counter() - t - (sum(self.pass_times[p.name] for p in group) - before)
+        return node
+
+    def _walk(self, node: Node, group: list) -> Node:
+        times = self.pass_times
+        skipping = [p for p in group if type(p).skips is not Pass.skips]
+        # the passes that carry on into a node's func / declared_type, and those with a leave hook
+        subsets = {}
+
+        def narrowed(active):
+            try:
+                return subsets[active]
+            except KeyError:
+                subsets[active] = (tuple(p for p in active if p.visits_func),
+                                   tuple(p for p in active if p.visits_declared_type),
+                                   tuple(p for p in active if type(p).leave is not Pass.leave))
+                return subsets[active]
+
+        def walk(node, active):
+            if skipping:
+                active = tuple(p for p in active if not (p in skipping and p.skips(node)))
+
+            for p in active:
+                t = perf_counter()
+                new = p.visit(node)
+                times[p.name] += perf_counter() - t
+                if new is not None:
+                    node = new
+
+            if not active:
+                return node
+
+            args = node.args
+            rebuilt = [walk(a, active) for a in args]
+            if any(a is not r for a, r in zip(args, rebuilt)):
+                node.args = rebuilt
+
+            func_active, declared_type_active, leaving = narrowed(active)
+
+            func = node.func
+            if func is not None and func_active:
+                new = walk(func, func_active)
+                if new is not func:
+                    node.func = new
+
+            declared_type = node.declared_type
+            if declared_type is not None and declared_type_active:
+                new = walk(declared_type, declared_type_active)
+                if new is not declared_type:
+                    node.declared_type = new
+
+            for p in leaving:
+                t = perf_counter()
+                p.leave(node)
+                times[p.name] += perf_counter() - t
+
+            return node
+
+        return walk(node, tuple(group))
+
+    def perf_messages(self) -> list:
+        walks = len(self.groups)
+        messages = [f"  {name} time {t}" for name, t in self.pass_times.items()]
+        messages.append(f"  walking the tree ({walks} walk{'s' if walks != 1 else ''}) time {self.walk_time}")
+        return messages
@@ -2,6 +2,7 @@
 # https://github.com/aakash1104/IndentationChecker Written By: Aakash Prabhu, December 2016 (University of California, Davis)
 
 import sys
+import string
 from io import StringIO
  
 TAB_WIDTH = 4
@@ -21,6 +22,24 @@ OpenAngle = 6
 
 expected_close = {OpenParen: ")", SquareOpen: "]", CurlyOpen: "}", SingleQuote: "'", DoubleQuote: '"', OpenAngle: '>'}
 
+# "elif kludges":
+# officially an if stmt is of the form:
+# if (condition:
+#    pass
+# elif: other_condition:
+#    pass
+# else:
+#    pass
+# )
+# but the extra ":" after "elif" is annoying and unlike python (so we'll insert it for you - also after "except").
+# Similarly for "if one liners" e.g. if (cond: pass else: pass) the official syntax is if (cond: pass, else: pass)
+# but we want a multiline if to be convertable to a one-liner simply by joining lines without inserting ","
+# (so a "," goes before "elif" and "else").
+# An alternative is making "elif" "else" and "except" genuine UnOps (sometimes identifiers in the 'else' case).
+# These keywords are matched as a pyparsing Keyword would (not part of a longer identifier) outside of string literals.
+kludge_keywords = ["elif", "else", "except"]
+keyword_chars = frozenset(string.ascii_letters + string.digits + "_$")
+
 
 def current_indent(parsing_stack):
     return (parsing_stack.count(Indent) - 1) * TAB_WIDTH
@@ -52,6 +71,22 @@ def preprocess(file_object, reparse = False):
 
     blocks = [[(0, 0), ""]]
 
+    # The ":" of an elif kludge is added unless the next char (skipping whitespace and string literals) is a ":".
+    # Until that char is seen the position after the "elif" is pending - (None, index) into line_to_write or
+    # (rarely, when the line ends first) (block, index) into the block the line was written to.
+    pending_colon = None
+
+    def resolve_pending_colon(line_to_write, insert):
+        nonlocal pending_colon
+        if pending_colon is not None and insert:
+            block, index = pending_colon
+            if block is None:
+                line_to_write = line_to_write[:index] + ":" + line_to_write[index:]
+            else:
+                block[1] = block[1][:index] + ":" + block[1][index:]
+        pending_colon = None
+        return line_to_write
+
     while parsing_stack:
 
         for line_number, line in enumerate(file_object, start=1):
@@ -59,6 +94,8 @@ def preprocess(file_object, reparse = False):
 
             if line == '':
                 rewritten.write("\n")
+                # keep the block's line count in step with the source (see parser._relocate_block)
+                blocks[-1][1] += "\n"
                 continue
 
             # leading spaces
@@ -123,6 +160,22 @@ def preprocess(file_object, reparse = False):
                 if char == BEL:
                     raise PreprocessorError("no BEL", line_number)
 
+                if pending_colon is not None and char not in " \t\r#'\"":
+                    line_to_write = resolve_pending_colon(line_to_write, char != ":")
+
+                if char == "e" and (n == 0 or line[n - 1] not in keyword_chars):
+                    keyword = next((k for k in kludge_keywords
+                                    if line.startswith(k, n) and line[n + len(k):n + len(k) + 1] not in keyword_chars), None)
+                    if keyword is not None:
+                        if keyword != "except":
+                            line_to_write += ","
+                        line_to_write += keyword
+                        if keyword != "else":
+                            pending_colon = (None, len(line_to_write))
+                        colon_eol = False
+                        n += len(keyword) - 1
+                        continue
+
                 if char == "#":
                     if not reparse:
                         comment = line[n + 1:]
@@ -233,6 +286,7 @@ def preprocess(file_object, reparse = False):
             if parsing_stack[-1] == OpenParen and colon_eol:
                 parsing_stack.append(Indent)
                 # block_start
+                line_to_write = resolve_pending_colon(line_to_write, True)
                 line_to_write += BEL
                 began_indent = True
                 ok_to_hide = False
@@ -241,11 +295,13 @@ def preprocess(file_object, reparse = False):
 
                 if parsing_stack[-1] == Indent and line_to_write.strip():
                     # block_line_end
+                    line_to_write = resolve_pending_colon(line_to_write, True)
                     line_to_write += ";"
 
                     if len(parsing_stack) == 1:
                         # blocks.append([(line_number, 0), "\n" * rewritten.getvalue().count("\n")])
-                        blocks.append([(line_number, 0), "\n" * rewritten.getvalue().count("\n")])
+                        # (a newline has been written for each line)
+                        blocks.append([(line_number, 0), "\n" * line_number])
                         block_to_write_index = -2
 
                     while len(is_it_a_template_stack) > 0:
@@ -257,6 +313,11 @@ def preprocess(file_object, reparse = False):
 
             line_to_write += comment_to_write
 
+            if pending_colon is not None and pending_colon[0] is None:
+                # the elif is followed by the next line
+                block = blocks[block_to_write_index]
+                pending_colon = (block, len(block[1]) + pending_colon[1])
+
             # if reparse:
             blocks[block_to_write_index][1] += line_to_write
 
@@ -267,6 +328,8 @@ def preprocess(file_object, reparse = False):
             else:
                 rewritten.write(line_to_write)
 
+        resolve_pending_colon("", True)
+
         if top := parsing_stack.pop() != Indent:
             # TODO states as real objects (error should point to the opening)
             raise PreprocessorError(f"EOF: expected a closing {expected_close[top]}", line_number)
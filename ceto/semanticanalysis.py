@@ -4,7 +4,12 @@ import sys
 import os
 import subprocess
 import concurrent.futures
-import shutil
+import threading
+import hashlib
+import functools
+import json
+import importlib.metadata
+from time import perf_counter
 
 from .abstractsyntaxtree import *#Node, Module, Call, Block, UnOp, BinOp, TypeOp, Assign, RedundantParens, Identifier, SyntaxTypeOp, AttributeAccess, ArrayAccess, NamedParameter, TupleLiteral, StringLiteral, Template
 
@@ -13,7 +18,9 @@ from .scope import ClassDefinition, InterfaceDefinition, VariableDefinition, Loc
 # from ._abstractsyntaxtree import visit_macro_definitions, MacroDefinition, MacroScope
 # from ._abstractsyntaxtree import macro_matches, macro_trampoline
 
-from ._abstractsyntaxtree import MacroDefinition, expand_macros
+from ._abstractsyntaxtree import MacroDefinition, MacroDispatchStats, expand_macros, call_compiled_macro_impl
+from .macrointerpreter import interpret_macro, MacroNotInterpretable, MacroInterpreterError
+from .passmanager import Pass, VisitorPass, PassManager
 
 def isa_or_wrapped(node, NodeClass):
     return isinstance(node, NodeClass) or (isinstance(node, TypeOp) and isinstance(node.args[0], NodeClass))
@@ -67,30 +74,46 @@ class SemanticAnalysisError(Exception):
     pass
 
 
-def build_parents(node: Node):
+class BuildParents(Pass):
+    name = "build_parents"
 
-    def visitor(node):
+    def visit(self, node):
         if isinstance(node, Module):
             node.parent = None
-        if not isinstance(node, Node):
-            return node
-        rebuilt = []
         for arg in node.args:
-            if isinstance(arg, Node):
-                arg.parent = node
-                arg = visitor(arg)
-            rebuilt.append(arg)
-        node.args = rebuilt
-        if isinstance(node.func, Node):
+            arg.parent = node
+        if node.func is not None:
             node.func.parent = node
-            node.func = visitor(node.func)
-        if node.declared_type:
+        if node.declared_type is not None:
             node.declared_type.parent = node
-            node.declared_type = visitor(node.declared_type)
-        return node
-    return visitor(node)
 
 
+def build_parents(node: Node):
+    return PassManager([BuildParents()]).run(node)
+
+
+preorder_counter = 0
+
+class NumberNodes(Pass):
+    # Number nodes in the order comes_before walks them (node, args, func) so
+    # that it's an integer comparison. The counter is never reset: nodes
+    # numbered by an earlier call are outside the new range of the root and
+    # comes_before falls back to walking the tree for them.
+    name = "number_nodes"
+    visits_declared_type = False
+
+    def visit(self, node):
+        global preorder_counter
+        node.preorder_index = preorder_counter
+        preorder_counter += 1
+
+    def leave(self, node):
+        node.subtree_end = preorder_counter
+
+
+def number_nodes(node: Node):
+    return PassManager([NumberNodes()]).run(node)
+
 
 def _ban_references_lambda(node):
 #    code = """(lambda[ref] (:
@@ -120,7 +143,9 @@ def _ban_references_lambda(node):
     return ban_references_lambda
 
 
-def safety_checks(node):
+def safety_checks(node, rewritten: list):
+    # rewritten collects the root of each subtree replaced here (inner rewrites
+    # first) so that only those regions need fresh scopes and parents.
 
     #from ceto.compiler import cmdargs
     #if not cmdargs._norefs:
@@ -238,12 +263,13 @@ def safety_checks(node):
         iterable = _ban_references_lambda(iterable)
         if iterable:
             node.args = [iter_var, iterable]
+            rewritten.append(iterable)
         return node
 
     new_args = []
     found_new = False
     for a in node.args:
-        new = safety_checks(a)
+        new = safety_checks(a, rewritten)
         if new:
             new_args.append(new)
             found_new = True
@@ -254,7 +280,7 @@ def safety_checks(node):
         node.args = new_args
 
     if node.func:
-        new = safety_checks(node.func)
+        new = safety_checks(node.func, rewritten)
         if new:
             node.func = new
 
@@ -281,6 +307,9 @@ def safety_checks(node):
         # (we want to avoid the scoping machinery / leave unsafe scopes to codegen for now)
         block_args = [Call(Identifier("unsafe"), [])] + block_args
         unsafe_if = Call(Identifier("if"), [IntegerLiteral("1", None), Block(block_args)])
+        unsafe_if.parent = node.parent
+        unsafe_if.scope = node.scope
+        rewritten.append(unsafe_if)
         return unsafe_if
 
     return node
@@ -571,105 +600,122 @@ def is_call_lambda(node: Call):
     return node.func.name == "lambda" or (isinstance(node.func, ArrayAccess) and node.func.func.name == "lambda")
 
 
-def build_types(node: Node):
+def _is_type_op(node):
+    return isinstance(node, TypeOp) and not isinstance(node, SyntaxTypeOp)
 
-    if not isinstance(node, Node):
-        return node
 
-    if isinstance(node, TypeOp) and not isinstance(node, SyntaxTypeOp):
-        lhs, rhs = node.args
-        # node = build_types(lhs)
-        node = lhs
-        node.declared_type = rhs  # leaving open possibility this is still a TypeOp
-        # node.declared_type = build_types(rhs)
+def _lower_type_op(node: TypeOp):
+    lhs, rhs = node.args
+    # node = build_types(lhs)
+    node = lhs
+    node.declared_type = rhs  # leaving open possibility this is still a TypeOp
+    # node.declared_type = build_types(rhs)
 
-        types = type_node_to_list_of_types(rhs)
-        rebuilt = []
-        for t in types:
-            # we still have cases e.g. lambda with args inside a decltype on rhs of ':' that should build a .declared_type
+    types = type_node_to_list_of_types(rhs)
+    rebuilt = []
+    for t in types:
+        # we still have cases e.g. lambda with args inside a decltype on rhs of ':' that should build a .declared_type
 
-            # TODO see if this fixed any outstanding issues with nested templates on rhs of operator ':'. Need more testcases but note problems with 'typename assigns' e.g. in def(foo:template<typename:t = typename:blahblah> etc
-            t = build_types(t)
-            rebuilt.append(t)
+        # TODO see if this fixed any outstanding issues with nested templates on rhs of operator ':'. Need more testcases but note problems with 'typename assigns' e.g. in def(foo:template<typename:t = typename:blahblah> etc
+        t = build_types(t)
+        rebuilt.append(t)
 
-        if rebuilt:
-            r = list_to_typed_node(rebuilt)
-            assert r
-            node.declared_type = r
+    if rebuilt:
+        r = list_to_typed_node(rebuilt)
+        assert r
+        node.declared_type = r
 
-    node.args = [build_types(arg) for arg in node.args]
-    node.func = build_types(node.func)
+    return node
 
-    # TODO this can perhaps be removed (build_parents call before/after macro expansion is new - we're undoing it here so that latter existing stages are unaffected)
-    node.parent = None
 
-    return node
+class BuildTypes(Pass):
+    # Lowers the TypeOp children of each node (so that a pass sharing the walk
+    # sees e.g. the typed Identifier params of a def when visiting the def).
+    # Types are built only once: existing .declared_types aren't walked.
+    name = "build_types"
+    requires = ("warn_and_remove_redundant_parenthesese",)  # (x:int) isn't a TypeOp
+    visits_declared_type = False
 
+    def visit(self, node):
+        args = node.args
+        if any(_is_type_op(a) for a in args):
+            node.args = [_lower_type_op(a) if _is_type_op(a) else a for a in args]
+        if _is_type_op(node.func):
+            node.func = _lower_type_op(node.func)
 
-def one_liner_expander(parsed):
 
-    def ifreplacer(ifop):
+def build_types(node: Node):
+    # (node.parent is stale afterwards for the nodes that moved. build_parents follows this)
+    if not isinstance(node, Node):
+        return node
+    if _is_type_op(node):
+        node = _lower_type_op(node)
+    return PassManager([BuildTypes()]).run(node)
+
 
-        if len(ifop.args) < 1:
-            raise SemanticAnalysisError("not enough if args")
+def _expand_one_liner_if(ifop):
+
+    if len(ifop.args) < 1:
+        raise SemanticAnalysisError("not enough if args")
+
+    if len(ifop.args) == 1 or not isinstance(ifop.args[1],
+                                             Block):
+        if isinstance(ifop.args[0], TypeOp):
+            # convert second arg of outermost colon to one element block
+            block_arg = ifop.args[0].args[1]
+            if isinstance(block_arg, Assign):
+                raise SemanticAnalysisError("no assignment statements in if one liners")
+            rebuilt = [ifop.args[0].args[0], Block([block_arg])] + ifop.args[1:]
+            return Call(ifop.func, rebuilt, ifop.source)
+        else:
+            raise SemanticAnalysisError("bad first if-args")
 
-        if len(ifop.args) == 1 or not isinstance(ifop.args[1],
-                                                 Block):
-            if isinstance(ifop.args[0], TypeOp):
-                # convert second arg of outermost colon to one element block
-                block_arg = ifop.args[0].args[1]
-                if isinstance(block_arg, Assign):
-                    raise SemanticAnalysisError("no assignment statements in if one liners")
-                rebuilt = [ifop.args[0].args[0], Block([block_arg])] + ifop.args[1:]
+    for i, a in enumerate(list(ifop.args[2:]), start=2):
+        if isinstance(a, Block):
+            if not (isinstance(ifop.args[i - 1], Identifier) and ifop.args[i - 1].name == "else") and not (isinstance(ifop.args[i - 1], TypeOp) and (isinstance(elifliteral := ifop.args[i - 1].args[0], Identifier) and elifliteral.name == "elif")):
+                raise SemanticAnalysisError(
+                    f"Unexpected if arg. Found block at position {i} but it's not preceded by 'else' or 'elif'")
+        elif isinstance(a, TypeOp):
+            if not a.args[0].name in ["elif", "else"]:
+                raise SemanticAnalysisError(
+                    f"Unexpected if arg {a} at position {i}")
+            if a.args[0].name == "else":
+                rebuilt = ifop.args[0:i] + [a.args[0], Block([a.args[1]])] + ifop.args[i + 1:]
                 return Call(ifop.func, rebuilt, ifop.source)
-            else:
-                raise SemanticAnalysisError("bad first if-args")
-
-        for i, a in enumerate(list(ifop.args[2:]), start=2):
-            if isinstance(a, Block):
-                if not (isinstance(ifop.args[i - 1], Identifier) and ifop.args[i - 1].name == "else") and not (isinstance(ifop.args[i - 1], TypeOp) and (isinstance(elifliteral := ifop.args[i - 1].args[0], Identifier) and elifliteral.name == "elif")):
-                    raise SemanticAnalysisError(
-                        f"Unexpected if arg. Found block at position {i} but it's not preceded by 'else' or 'elif'")
-            elif isinstance(a, TypeOp):
-                if not a.args[0].name in ["elif", "else"]:
-                    raise SemanticAnalysisError(
-                        f"Unexpected if arg {a} at position {i}")
-                if a.args[0].name == "else":
-                    rebuilt = ifop.args[0:i] + [a.args[0], Block([a.args[1]])] + ifop.args[i + 1:]
+            elif a.args[0].name == "elif":
+                if i == len(ifop.args) - 1 or not isinstance(ifop.args[i + 1], Block):
+                    c = a.args[1]
+                    if not isinstance(c, TypeOp):
+                        raise SemanticAnalysisError("bad if args")
+                    cond, rest = c.args
+                    new_elif = TypeOp(a.op, [a.args[0], cond], a.source)
+                    new_block = Block([rest])
+                    rebuilt = ifop.args[0:i] + [new_elif, new_block] + ifop.args[i + 1:]
                     return Call(ifop.func, rebuilt, ifop.source)
-                elif a.args[0].name == "elif":
-                    if i == len(ifop.args) - 1 or not isinstance(ifop.args[i + 1], Block):
-                        c = a.args[1]
-                        if not isinstance(c, TypeOp):
-                            raise SemanticAnalysisError("bad if args")
-                        cond, rest = c.args
-                        new_elif = TypeOp(a.op, [a.args[0], cond], a.source)
-                        new_block = Block([rest])
-                        rebuilt = ifop.args[0:i] + [new_elif, new_block] + ifop.args[i + 1:]
-                        return Call(ifop.func, rebuilt, ifop.source)
-            elif isinstance(a, Identifier) and a.name == "else":
-                if not i == len(ifop.args) - 2:
-                    raise SemanticAnalysisError("bad else placement")
-                if not isinstance(ifop.args[-1], Block):
-                    raise SemanticAnalysisError("bad arg after else")
-            else:
-                raise SemanticAnalysisError(
-                    f"bad if-arg {a} at position {i}")
+        elif isinstance(a, Identifier) and a.name == "else":
+            if not i == len(ifop.args) - 2:
+                raise SemanticAnalysisError("bad else placement")
+            if not isinstance(ifop.args[-1], Block):
+                raise SemanticAnalysisError("bad arg after else")
+        else:
+            raise SemanticAnalysisError(
+                f"bad if-arg {a} at position {i}")
 
-        return ifop
+    return ifop
 
-    def visitor(op):
 
-        if not isinstance(op, Node):
-            return op
+class OneLinerExpander(Pass):
+    name = "one_liner_expander"
+    visits_declared_type = False
 
-        if isinstance(op, Call) and op.func.name == "defmacro":
-            # This is a defmacro that will just be ignored by codegen, transformations are fine but we don't want to
-            # validate the use of "if" appearing in a pattern.
-            # note that for the e.g. if one liners that really do need expanding in a macro body, they will be handled
-            # during separate compilation of the macro_impl module.
-            return op
+    def skips(self, op):
+        # This is a defmacro that will just be ignored by codegen, transformations are fine but we don't want to
+        # validate the use of "if" appearing in a pattern.
+        # note that for the e.g. if one liners that really do need expanding in a macro body, they will be handled
+        # during separate compilation of the macro_impl module.
+        return isinstance(op, Call) and op.func.name == "defmacro"
 
+    def visit(self, op):
         if isinstance(op, TypeOp) and not isinstance(op, SyntaxTypeOp) and isinstance(op.args[0], Identifier) and op.args[0].name in ["except", "return", "else", "elif"]:
             op = SyntaxTypeOp(op.op, op.args, op.source)
 
@@ -687,7 +733,7 @@ def one_liner_expander(parsed):
                     raise SemanticAnalysisError("not enough lambda args")
             elif op.func.name == "if":
                 while True:
-                    new = ifreplacer(op)
+                    new = _expand_one_liner_if(op)
                     if new is not op:
                         op = new
                         op.is_one_liner_if = True
@@ -727,18 +773,19 @@ def one_liner_expander(parsed):
                         # pass # so wait for code generation to 'return {}'
                         # block.args.append(SyntaxTypeOp(func=":", args=[RebuiltIdentifer("return"), RebuiltIdentifer("None")]))
 
-        op.args = [visitor(arg) for arg in op.args]
-        op.func = visitor(op.func)
         return op
 
-    return visitor(parsed)
 
+def one_liner_expander(parsed):
+    return PassManager([OneLinerExpander()]).run(parsed)
 
-def assign_to_named_parameter(expr):
 
-    def replacer(op):
-        if not isinstance(op, Node):
-            return op
+class AssignToNamedParameter(Pass):
+    name = "assign_to_named_parameter"
+    visits_func = False
+    visits_declared_type = False
+
+    def visit(self, op):
         if isinstance(op, Call):
             rebuilt = []
             for arg in op.args:
@@ -755,29 +802,34 @@ def assign_to_named_parameter(expr):
                     rebuilt.append(arg)
             op.args = rebuilt
 
-        op.args = [replacer(arg) for arg in op.args]
-        return op
 
-    return replacer(expr)
+def assign_to_named_parameter(expr):
+    return PassManager([AssignToNamedParameter()]).run(expr)
 
 
-def warn_and_remove_redundant_parenthesese(expr, error=False):
+class RemoveRedundantParentheses(Pass):
+    name = "warn_and_remove_redundant_parenthesese"
+    # the passes before this one would miss the unwrapped node if they shared its walk
+    # (and the warning shows the node as they left it)
+    requires = ("one_liner_expander", "assign_to_named_parameter")
+    visits_declared_type = False
+
+    def __init__(self, error=False):
+        self.error = error
 
-    def replacer(op):
+    def visit(self, op):
         if isinstance(op, RedundantParens):
             op = op.args[0]
             msg = f"warning: redundant parens {op}"
-            if error:
+            if self.error:
                 raise SemanticAnalysisError(msg)
             else:
                 print(msg, file=sys.stderr)
-        if not isinstance(op, Node):
             return op
-        op.args = [replacer(arg) for arg in op.args]
-        op.func = replacer(op.func)
-        return op
 
-    return replacer(expr)
+
+def warn_and_remove_redundant_parenthesese(expr, error=False):
+    return PassManager([RemoveRedundantParentheses(error)]).run(expr)
 
 
 def is_return(node):
@@ -1071,28 +1123,7 @@ class ImplicitLambdaCaptureVisitor:
 
 
 def apply_replacers(module: Module, visitors):
-
-    def replace(node):
-
-        if not isinstance(node, Node):
-            return node
-
-        for v in visitors:
-            func_name = "visit_" + node.__class__.__name__
-            new = None
-            if hasattr(v, func_name):
-                new = getattr(v, func_name)(node)
-            elif hasattr(v, "visit_Node"):
-                new = v.visit_Node(node)
-            if new is not None:
-                node = new
-
-        node.args = [replace(a) for a in node.args]
-        node.func = replace(node.func)
-        node.declared_type = replace(node.declared_type)
-        return node
-
-    return replace(module)
+    return PassManager([VisitorPass(v) for v in visitors]).run(module)
 
 
 counter = 0
@@ -1184,12 +1215,16 @@ def quote_expander(node):
     return node
 
 
-def create_macro_impl_module(node: Node, macro_definition: MacroDefinition, macro_impl: TypeOp):
-    """create a module with the defmacro of `macro_definition` replaced by the `macro_impl` implementing the body of the macro"""
+def create_macro_impl_module(node: Node, macro_impls: typing.Dict[Node, typing.Optional[TypeOp]]):
+    """create a module with each defmacro node in `macro_impls` replaced by the macro impl implementing the body of the macro (or removed if None)"""
 
-    new_args = [macro_impl if a is macro_definition.defmacro_node
-                           else create_macro_impl_module(a, macro_definition, macro_impl)
-                for a in node.args]
+    new_args = []
+    for a in node.args:
+        if a in macro_impls:
+            if macro_impls[a] is not None:
+                new_args.append(macro_impls[a])
+        else:
+            new_args.append(create_macro_impl_module(a, macro_impls))
     if isinstance(node, Module):
         # allow constant evaluation of any other code in module (or included by
         # module) except "main" (even though not strictly necessary to remove from dll)
@@ -1200,58 +1235,452 @@ def create_macro_impl_module(node: Node, macro_definition: MacroDefinition, macr
     return node
 
 
-def prepare_macro_ready_callback(module):
+def _macro_cache_dir():
+    if cache_dir := os.environ.get("CETO_MACRO_CACHE_DIR"):
+        return cache_dir
+    if sys.platform == "win32":
+        cache_root = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        cache_root = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_root, "ceto", "macros")
 
-    macro_number = 0
 
-    def on_macro_def(mcd: MacroDefinition, replacements):
-        from .parser import parse
-        from .codegen import codegen
+@functools.lru_cache(maxsize=None)
+def _ceto_version():
+    try:
+        return importlib.metadata.version("ceto")
+    except importlib.metadata.PackageNotFoundError:
+        return "dev"
 
-        nonlocal macro_number
 
-        mcd.impl_function_name = f"macro_impl{macro_number}"
+@functools.lru_cache(maxsize=None)
+def _compiler_identity(compiler):
+    # the full version banner (not just the name) so that a compiler upgrade invalidates cached dlls
+    version_command = [compiler] if sys.platform == "win32" else [compiler, "--version"]
+    try:
+        result = subprocess.run(version_command, capture_output=True, text=True)
+    except OSError:
+        return compiler
+    return result.stdout + result.stderr
 
-        if mcd.defmacro_node.source.header_file_cth:
-            module_path = mcd.defmacro_node.source.header_file_cth
+
+def _quoted_include_dependencies(code, include_dirs):
+    """yield (path, contents) for each #include "..." reachable from `code` (angle includes are covered by the compiler identity)"""
+
+    seen = set()
+    to_scan = [code]
+
+    while to_scan:
+        for line in to_scan.pop().splitlines():
+            line = line.strip()
+            if not line.startswith("#include") or '"' not in line:
+                continue
+            header = line.split('"')[1]
+            for d in include_dirs:
+                header_path = os.path.realpath(os.path.join(d, header))
+                if os.path.isfile(header_path):
+                    if header_path not in seen:
+                        seen.add(header_path)
+                        with open(header_path) as f:
+                            contents = f.read()
+                        to_scan.append(contents)
+                        yield header_path, contents
+                    break
+
+
+def macro_cache_key(macro_impl_code, build_flags, compiler, include_dirs):
+    """content hash of everything that can affect a compiled macro dll (but not the location of the sources on disk)"""
+
+    h = hashlib.sha256()
+    for part in [_ceto_version(), compiler, _compiler_identity(compiler), build_flags, macro_impl_code]:
+        h.update(part.encode())
+        h.update(b"\0")
+    for _, contents in _quoted_include_dependencies(macro_impl_code, include_dirs):
+        h.update(contents.encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _transpiler_identity():
+    # the version alone doesn't change with an edit to a development checkout
+    h = hashlib.sha256(_ceto_version().encode())
+    package_dir = os.path.dirname(__file__)
+    for name in sorted(os.listdir(package_dir)):
+        if name.endswith(".py"):
+            with open(os.path.join(package_dir, name), "rb") as f:
+                h.update(name.encode() + b"\0" + f.read() + b"\0")
+    return h.hexdigest()
+
+
+def macro_source_key(macro_impl_module, build_flags, compiler):
+    """hash of the inputs to a macro dll known before codegen (its quoted header dependencies are only known after; see _lookup_macro_index)"""
+
+    h = hashlib.sha256()
+    for part in [_transpiler_identity(), compiler, _compiler_identity(compiler), build_flags, os.path.basename(private_selfhost_dir()),
+                 macro_impl_module.ast_repr(preserve_source_loc=False, ceto_evalable=False)]:
+        h.update(part.encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _macro_index_path(source_key):
+    return os.path.join(_macro_cache_dir(), "index-" + source_key + ".json")
+
+
+def _record_macro_index(source_key, cache_key, macro_impl_code, include_dirs):
+    headers = {path: hashlib.sha256(contents.encode()).hexdigest() for path, contents in _quoted_include_dependencies(macro_impl_code, include_dirs)}
+    index_path = _macro_index_path(source_key)
+    tmp_path = f"{index_path}.{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump({"key": cache_key, "headers": headers}, f)
+    os.replace(tmp_path, index_path)
+
+
+def _lookup_macro_index(source_key):
+    """the macro_cache_key recorded for `source_key` (or None if there's none or one of the headers it depends on has changed)"""
+
+    try:
+        with open(_macro_index_path(source_key)) as f:
+            index = json.load(f)
+        for path, digest in index["headers"].items():
+            with open(path) as f:
+                if hashlib.sha256(f.read().encode()).hexdigest() != digest:
+                    return None
+        return index["key"]
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+_macro_build_executor = None
+_macro_builds = {}
+
+
+def _submit_macro_build(dll_path, build):
+    from .compiler import cmdargs
+
+    jobs = cmdargs.jobs if cmdargs else 1
+    if jobs == 1:
+        build()
+        return None
+
+    global _macro_build_executor
+    if _macro_build_executor is None:
+        # threads are enough: the work happens in the compiler subprocess
+        _macro_build_executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count())
+
+    future = _macro_build_executor.submit(build)
+    _macro_builds[dll_path] = future
+    return future
+
+
+def wait_for_macro_builds():
+    """wait for any macro dlls still building in the background (including those for macros that were never used) and raise the first build error"""
+    builds = list(_macro_builds.values())
+    _macro_builds.clear()
+    for future in builds:
+        future.result()
+
+
+@functools.lru_cache(maxsize=None)
+def private_selfhost_dir():
+    """directory of the ceto__private__ copies of the selfhost ast headers included by macro dlls.
+
+    Kept in the macro cache (keyed by the contents of the selfhost sources) so that building
+    macros never writes to the source tree being compiled.
+    """
+    package_dir = os.path.dirname(__file__)
+    selfhost_dir = os.path.join(package_dir, os.pardir, "selfhost")
+
+    sources = {}
+    for orig_name in ["ast.cth", "utility.cth", "range_utility.cth", "visitor.cth"]:
+        for d in [package_dir, selfhost_dir]:
+            orig_path = os.path.join(d, orig_name)
+            if os.path.isfile(orig_path):
+                with open(orig_path) as f:
+                    sources["ceto__private__" + orig_name] = f.read()
+                break
+
+    ast_str = sources["ceto__private__ast.cth"]
+    ast_str = ast_str.replace("include (utility)", "include (ceto__private__utility)")
+    ast_str = ast_str.replace("include (range_utility)", "include (ceto__private__range_utility)")
+    ast_str = ast_str.replace("include (visitor)", "include (ceto__private__visitor)")
+    sources["ceto__private__ast.cth"] = ast_str
+
+    h = hashlib.sha256()
+    for name, source in sources.items():
+        h.update(name.encode() + b"\0" + source.encode() + b"\0")
+    private_dir = os.path.join(_macro_cache_dir(), "selfhost-" + h.hexdigest()[:16])
+    os.makedirs(private_dir, exist_ok=True)
+
+    for name, source in sources.items():
+        destination_path = os.path.join(private_dir, name)
+        if not os.path.isfile(destination_path):
+            tmp_path = f"{destination_path}.{os.getpid()}"
+            with open(tmp_path, "w") as f:
+                f.write(source)
+            os.replace(tmp_path, destination_path)
+
+    return private_dir
+
+
+@functools.lru_cache(maxsize=None)
+def _private_selfhost_ast():
+    """the parsed ceto__private__ ast headers (clone before use)"""
+    from .parser import parse
+    return parse("include (ceto__private__ast)")
+
+
+def _build_macro_impl_module(macro_impl_module, impl_function_names, module_dir):
+    """compile the macro impls named `impl_function_names` (and everything before them in `macro_impl_module`) into a dll.
+
+    :return: the dll path and a callable to wait for the build (None if the dll is already available)
+    """
+    from .codegen import codegen
+
+    impl_index = max(i for i, v in enumerate(macro_impl_module.args) if v.args and v.args[0].args and v.args[0].args[0].args and v.args[0].args[0].args[0].name in impl_function_names)
+    macro_impl_module_args = macro_impl_module.args[0:impl_index + 1]
+    macro_impl_module.args = macro_impl_module_args
+
+    project_dir = os.path.join(os.path.dirname(__file__), os.pardir)
+
+    include_dirs = [private_selfhost_dir(), module_dir, os.path.join(project_dir, 'include'), os.path.join(project_dir, 'include', 'kit_local_shared_ptr'), os.path.join(project_dir, 'selfhost'), os.path.dirname(__file__), os.path.join(os.path.dirname(__file__), 'kit_local_shared_ptr')]
+    include_opts = " ".join("-I" + d for d in include_dirs)
+
+    if sys.platform == "win32":
+        include_opts = include_opts.replace('-I', '/I')
+        compiler = "cl.exe"
+        compile_flags = "/std:c++20 /Wall /permissive- /EHsc"
+        build_flags = compile_flags + " /LD"
+        dll_ext = ".dll"
+    else:
+        compiler = "c++"
+        compile_flags = "-Wall -Wextra -std=c++20 -O2"
+        if sys.platform == "darwin":
+            build_flags = compile_flags + " -dynamiclib"
+            dll_ext = ".dylib"
         else:
-            from .compiler import cmdargs
-            module_path = cmdargs.filename
+            compile_flags += " -fPIC"
+            build_flags = compile_flags + " -shared -ldl"
+            dll_ext = ".so"
 
-        module_name = os.path.basename(module_path)
-        module_dir = os.path.dirname(module_path)
+    cache_dir = _macro_cache_dir()
+
+    # skip macro expansion, semantic analysis and codegen of the dll source if it's already built
+    source_key = macro_source_key(macro_impl_module, build_flags, compiler)
+    if cache_key := _lookup_macro_index(source_key):
+        dll_path = os.path.join(cache_dir, cache_key) + dll_ext
+        if os.path.isfile(dll_path):
+            return dll_path, None
+
+    # the macro dll depends on a few selfhost sources
+    macro_impl_module.args = _private_selfhost_ast().clone().args + macro_impl_module.args
+
+    # Ignore any other defmacro nodes (we don't want to compile them just yet - we're busy with the current defmacro.
+    # (TODO is this necessary now that we're discarding all nodes in module after the current macro impl?)
+    #macro_impl_module.args = [a for a in macro_impl_module.args if not (isinstance(a, Call) and a.func.name == "defmacro")]
+
+    # However, we do want to run macro expansion on the body of our current defmacro:
+    macro_impl_module = macro_expansion(macro_impl_module)
+
+    macro_impl_module = semantic_analysis(macro_impl_module)
+    macro_impl_code = codegen(macro_impl_module)
+
+    cache_key = macro_cache_key(macro_impl_code, build_flags, compiler, include_dirs)
+    impl_path = os.path.join(cache_dir, cache_key)
+    dll_path = impl_path + dll_ext
 
-        impl_path = os.path.join(module_dir, f"{module_name}.macro_impl.{macro_number}")
+    os.makedirs(cache_dir, exist_ok=True)
+    _record_macro_index(source_key, cache_key, macro_impl_code, include_dirs)
 
-        dll_path = impl_path
+    if os.path.isfile(dll_path):
+        return dll_path, None
+
+    if building := _macro_builds.get(dll_path):
+        # an identical macro is already being built
+        return dll_path, building.result
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # build under a unique name then rename so that concurrent builds never load a partially written dll
+    tmp_path = f"{impl_path}.{os.getpid()}"
+    dll_cpp = tmp_path + ".cpp"
+    tmp_dll_path = tmp_path + dll_ext
+
+    with open(dll_cpp, "w") as f:
+        f.write(macro_impl_code)
+
+    def build():
         if sys.platform == "win32":
-            dll_path += ".dll"
-        elif sys.platform == "darwin":
-            dll_path += ".dylib"
+            build_command = f"{compiler} {build_flags} {include_opts} /Fe:{tmp_dll_path} {dll_cpp}"
+        else:
+            soname = "" if sys.platform == "darwin" else f"-Wl,-soname,{os.path.basename(dll_path)}"
+            # only the macro bodies need compiling if the ast is precompiled
+            pch_header = _macro_pch(compiler, compile_flags, include_dirs)
+            pch_opt = f"-include {pch_header}" if pch_header else ""
+            build_command = f"{compiler} {build_flags} {soname} {include_opts} {pch_opt} -o {tmp_dll_path} {dll_cpp}"
+
+        print(build_command)
+        try:
+            output = subprocess.check_output(build_command, stderr=subprocess.STDOUT, shell=True)
+        except subprocess.CalledProcessError as e:
+            print(e.output.decode())
+            print(e)
+            raise
+        finally:
+            os.remove(dll_cpp)
+
+        os.replace(tmp_dll_path, dll_path)
+
+    # expansion only blocks on the build (via dll_ready_callback) once the macro is matched
+    if future := _submit_macro_build(dll_path, build):
+        return dll_path, future.result
+    return dll_path, None
+
+
+class _SharedMacroDll:
+    """The macros of one source file compiled into a single dll (--sharedmacrodll).
+
+    Nothing is built until one of the macros is matched. The dll then contains every
+    macro of the file seen so far; a later defmacro in the same file (if matched) results
+    in another dll.
+    """
+
+    def __init__(self, module_dir):
+        self.module_dir = module_dir
+        self.macro_impls = {}  # defmacro node -> macro impl (None for a duplicate of an earlier defmacro)
+        self.impl_function_names = set()
+        self.unbuilt = []
+        self.ready_callbacks = {}  # dll path -> callable waiting for the build (if still building)
+        self.module = None
+        self.replacements = None
+
+    def add(self, mcd: MacroDefinition, macro_impl: TypeOp, module: Module, replacements):
+        if mcd.impl_function_name in self.impl_function_names:
+            # identical defmacro: its impl is already in the dll
+            macro_impl = None
+        self.impl_function_names.add(mcd.impl_function_name)
+        self.macro_impls[mcd.defmacro_node] = macro_impl
+        self.unbuilt.append(mcd)
+        self.module = module
+        self.replacements = replacements
+        mcd.dll_ready_callback = functools.partial(self.build, mcd)
+
+    def build(self, mcd: MacroDefinition):
+        if mcd in self.unbuilt:
+            module = replace_macro_expansion(self.module, self.replacements)
+            macro_impl_module = create_macro_impl_module(module, self.macro_impls)
+            dll_path, ready_callback = _build_macro_impl_module(macro_impl_module, self.impl_function_names, self.module_dir)
+            self.ready_callbacks[dll_path] = ready_callback
+            for unbuilt in self.unbuilt:
+                unbuilt.dll_path = dll_path
+            self.unbuilt = []
+        if ready_callback := self.ready_callbacks.get(mcd.dll_path):
+            ready_callback()
+
+
+_macro_pch_lock = threading.Lock()
+_failed_macro_pchs = set()
+
+
+def _macro_pch(compiler, compile_flags, include_dirs):
+    """a precompiled header of ceto.h and the selfhost ast for macro dlls to -include (or None if unavailable).
+
+    Shared by every macro dll built with the same compiler, flags and ast header.
+    """
+    if sys.platform == "win32":
+        return None
+
+    pch_source = ""
+    for header in ["ceto.h", "ceto__private__ast.donotedit.autogenerated.h"]:
+        for d in include_dirs:
+            header_path = os.path.realpath(os.path.join(d, header))
+            if os.path.isfile(header_path):
+                # by absolute path so that the macro dll's own include of the (pragma once) header is recognized as the same file
+                pch_source += f'#include "{header_path}"\n'
+                break
         else:
-            dll_path += ".so"
+            return None
 
-        mcd.dll_path = dll_path
+    pch_key = macro_cache_key(pch_source, compile_flags, compiler, include_dirs)
+    if pch_key in _failed_macro_pchs:
+        return None
 
-        macro_number += 1
+    pch_dir = os.path.join(_macro_cache_dir(), "pch-" + pch_key)
+    pch_header = os.path.join(pch_dir, "ceto_macro_pch.h")
+    # found by both gcc and clang when pch_header is -included
+    pch_path = pch_header + (".pch" if "clang" in _compiler_identity(compiler) else ".gch")
 
-        if os.path.isfile(dll_path):
-            # TODO this doesn't handle changes in dependent headers
-            # - To fix we should be checking the mtime of the header path of all preceding
-            #   nodes in the module. Note comment in parser.py about not setting header path 
-            #   on nodes from a subinclude (easier caching??) - may interfere with fix
-            module_time = os.path.getmtime(module_path)
-            dll_time = os.path.getmtime(dll_path)
-            if dll_time >= module_time:
-                return
-            elif "ceto_private" in module_name:
-                # hack to avoid unnecessary recompilation of standard library macros: module_path mtime updated after dll mtime (due to pip install moving files after macro compilation)
-                return
+    with _macro_pch_lock:
+        if os.path.isfile(pch_path):
+            return pch_header
+
+        os.makedirs(pch_dir, exist_ok=True)
+        tmp_header = f"{pch_header}.{os.getpid()}"
+        with open(tmp_header, "w") as f:
+            f.write(pch_source)
+        os.replace(tmp_header, pch_header)
+
+        tmp_path = f"{pch_path}.{os.getpid()}"
+
+        include_opts = " ".join("-I" + d for d in include_dirs)
+        pch_command = f"{compiler} {compile_flags} {include_opts} -x c++-header {pch_header} -o {tmp_path}"
+        print(pch_command)
+        try:
+            subprocess.check_output(pch_command, stderr=subprocess.STDOUT, shell=True)
+        except subprocess.CalledProcessError as e:
+            # not fatal: the macro dll compiles (or reports the same errors) without it
+            print(e.output.decode())
+            print(e)
+            _failed_macro_pchs.add(pch_key)
+            return None
+        os.replace(tmp_path, pch_path)
+
+    return pch_header
+
+
+def _with_compiled_fallback(interpreted_impl, mcd: MacroDefinition, impl_block: Block, expanded: Block, build_dll):
+    # The interpreted macro, switching to a dll (for this and every later
+    # expansion) the first time the interpreter fails while the macro runs.
+    compiled = False
+
+    def macro_impl(match):
+        nonlocal compiled
+        if not compiled:
+            try:
+                return interpreted_impl(match)
+            except MacroInterpreterError as e:
+                print("macro compiled to a dll (interpreter error):", *e.args)
+                impl_block.args = impl_block.args[:-1] + expanded.args
+                build_dll()
+                compiled = True
+        return call_compiled_macro_impl(mcd, match)
+
+    return macro_impl
+
+
+def prepare_macro_ready_callback(module):
+
+    shared_dlls = {}  # source file path -> _SharedMacroDll
+
+    def on_macro_def(mcd: MacroDefinition, replacements):
+        from .parser import parse
+        from .compiler import cmdargs
+
+        # named by content rather than position so that adding a defmacro doesn't change the code (and cache key) of those following
+        defmacro_hash = hashlib.sha256(mcd.defmacro_node.ast_repr(preserve_source_loc=False, ceto_evalable=False).encode()).hexdigest()
+        mcd.impl_function_name = f"macro_impl_{defmacro_hash[:16]}"
+
+        if mcd.defmacro_node.source.header_file_cth:
+            module_path = mcd.defmacro_node.source.header_file_cth
+        else:
+            module_path = cmdargs.filename
+
+        module_dir = os.path.dirname(module_path)
 
         # apply current replacement decisions at the time of encountering the current macro def (for a defmacro that relies on other defmacros)
         # allowing expand_macros to do the replacements in place (add mutable visitor) would avoid this
         defmacro_node = replace_macro_expansion(mcd.defmacro_node, replacements)
-        new_module = replace_macro_expansion(module, replacements)
         #mcd.pattern = replace_macro_expansion(mcd.pattern, replacements)  # not necessary? or is it too late to even handle this (bug)
         parameters = { k: replace_macro_expansion(v, replacements) for k, v in mcd.parameters.items() }  # not necessary?
 
@@ -1290,138 +1719,188 @@ def prepare_macro_ready_callback(module):
         assert isinstance(defmacro_body, Block)
 
         expanded = quote_expander(defmacro_body)
-        impl_block.args = impl_block.args[:-1] + expanded.args
 
-        macro_impl_module = create_macro_impl_module(new_module, mcd, macro_impl)
+        # the whole module is only needed (with the replacements so far) if a dll is built
+        replacements = dict(replacements)
 
-        impl_index = next(i for i, v in enumerate(macro_impl_module.args) if v.args and v.args[0].args and v.args[0].args[0].args and v.args[0].args[0].args[0].name == mcd.impl_function_name)
-        macro_impl_module_args = macro_impl_module.args[0:impl_index + 1]
-        macro_impl_module.args = macro_impl_module_args
+        def build_dll():
+            if cmdargs and cmdargs.sharedmacrodll:
+                # built (with the other macros of the file) by mcd.dll_ready_callback
+                if module_path not in shared_dlls:
+                    shared_dlls[module_path] = _SharedMacroDll(module_dir)
+                shared_dlls[module_path].add(mcd, macro_impl, module, replacements)
+                return
 
-        package_dir = os.path.dirname(__file__)
-        selfhost_dir = os.path.join(package_dir, os.pardir, "selfhost")
-        toremove = []
+            new_module = replace_macro_expansion(module, replacements)
+            macro_impl_module = create_macro_impl_module(new_module, {mcd.defmacro_node: macro_impl})
+            mcd.dll_path, ready_callback = _build_macro_impl_module(macro_impl_module, {mcd.impl_function_name}, module_dir)
+            if ready_callback:
+                mcd.dll_ready_callback = ready_callback
+
+        if not (cmdargs and cmdargs.compiledmacros):
+            try:
+                interpreted_impl = interpret_macro(defmacro_node, parameters, expanded)
+            except MacroNotInterpretable as e:
+                print("macro compiled to a dll (not interpretable):", *e.args)
+            else:
+                mcd.interpreted_impl = _with_compiled_fallback(interpreted_impl, mcd, impl_block, expanded, build_dll)
+                return
 
-        # prepare dependency of macro dll on a few selfhost sources
-        for orig_name in ["ast.cth", "utility.cth", "range_utility.cth", "visitor.cth"]:
-            destination_name = "ceto__private__" + orig_name
-            destination_path = os.path.join(module_dir, destination_name)
-            if os.path.isfile(destination_path):
-                continue
-            for d in [package_dir, selfhost_dir]:
-                orig_path = os.path.join(d, orig_name)
-                if os.path.isfile(orig_path):
-                    if orig_name == "ast.cth":
-                        with open(orig_path) as f:
-                            ast_str = f.read()
-                        ast_str = ast_str.replace("include (utility)", "include (ceto__private__utility)")
-                        ast_str = ast_str.replace("include (range_utility)", "include (ceto__private__range_utility)")
-                        ast_str = ast_str.replace("include (visitor)", "include (ceto__private__visitor)")
-                        with open(destination_path, "w") as f:
-                            f.write(ast_str)
-                    else:
-                        shutil.copyfile(orig_path, destination_path)
-                    toremove.append(destination_path)
-                    break
+        impl_block.args = impl_block.args[:-1] + expanded.args
+        build_dll()
 
-        include_ast = parse("include (ceto__private__ast)")
+    return on_macro_def
 
-        for f in toremove:
-            os.remove(f)
 
-        macro_impl_module.args = include_ast.args + macro_impl_module.args
+def replace_macro_expansion(node: Node, replacements):
+    if node in replacements:
+        # expand_macros visits each replacement as soon as it's made so any
+        # replacements within (or of) it are also in 'replacements'
+        expanded = replace_macro_expansion(replacements[node], replacements)
+        # only the new subtree needs its parents built
+        return build_parents(expanded.clone())
 
-        # Ignore any other defmacro nodes (we don't want to compile them just yet - we're busy with the current defmacro.
-        # (TODO is this necessary now that we're discarding all nodes in module after the current macro impl?)
-        #macro_impl_module.args = [a for a in macro_impl_module.args if not (isinstance(a, Call) and a.func.name == "defmacro")]
+    node.args = [replace_macro_expansion(a, replacements) for a in node.args]
+    for a in node.args:
+        a.parent = node
+    if node.func:
+        node.func = replace_macro_expansion(node.func, replacements)
+        node.func.parent = node
 
-        # However, we do want to run macro expansion on the body of our current defmacro:
-        macro_impl_module = macro_expansion(macro_impl_module)
+    return node
 
-        macro_impl_module = semantic_analysis(macro_impl_module)
-        macro_impl_code = codegen(macro_impl_module)
 
-        dll_cpp = impl_path + ".cpp"
+def macro_expansion(expr: Module):
+    assert isinstance(expr, Module)
 
-        with open(dll_cpp, "w") as f:
-            f.write(macro_impl_code)
+    expr = build_parents(expr)
+    dispatch_stats = MacroDispatchStats()
 
-        project_dir = os.path.join(os.path.dirname(__file__), os.pardir)
+    # a single pass: nested expansions are found while visiting each replacement
+    # (and a node is offered again, expanded, once there's an expansion within it)
+    replacements = expand_macros(expr, prepare_macro_ready_callback(expr), dispatch_stats)
+    print("macro replacements", replacements)
+    expr = replace_macro_expansion(expr, replacements)
 
-        include_opts = f"-I{os.path.join(project_dir, 'include')} -I{os.path.join(project_dir, 'include', 'kit_local_shared_ptr')} -I{os.path.join(project_dir, 'selfhost')} -I{os.path.dirname(__file__)} -I{os.path.join(os.path.dirname(__file__), 'kit_local_shared_ptr')}"
+    print("macro dispatch hits", dispatch_stats.hits, "misses", dispatch_stats.misses, "skipped", dispatch_stats.skipped)
 
-        if sys.platform == "win32":
-            include_opts = include_opts.replace('-I', '/I')
-            build_command = f"cl.exe /std:c++20 /Wall /permissive- /EHsc {include_opts} /LD /Fe:{dll_path} {dll_cpp}"
-        else:
-            dll_options = f"-fPIC -shared -Wl,-soname,{dll_path}.so -ldl"
-            if sys.platform == "darwin":
-                dll_options = "-dynamiclib"
-            build_command = f"c++ -Wall -Wextra -std=c++20 -O2 {include_opts} {dll_options} -o {dll_path} {dll_cpp}"
+    return expr
 
-        print(build_command)
-        try:
-            output = subprocess.check_output(build_command, stderr=subprocess.STDOUT, shell=True)
-        except subprocess.CalledProcessError as e:
-            print(e.output.decode())
-            print(e)
-            raise
 
-    return on_macro_def
+class _ResolvedDefinitions(threading.local):
+    # node.scope.find_defs(node) for every Identifier with a scope, filled by
+    # resolve_identifiers once the scopes are final (the end of semantic_analysis).
+    # Keyed by node identity. Per thread so that concurrent compiles don't share
+    # it, and dropped by clear_resolved_definitions once codegen is done (it
+    # keeps the nodes alive, which must be gone before close_macro_libraries).
 
+    def __init__(self):
+        self.definitions = {}
 
-def replace_macro_expansion(node: Node, replacements):
-    if node in replacements:
-        return replacements[node].clone()
 
-    node.args = [replace_macro_expansion(a, replacements) for a in node.args]
-    if node.func:
-        node.func = replace_macro_expansion(node.func, replacements)
+resolved = _ResolvedDefinitions()
 
-    return node
 
+def clear_resolved_definitions():
+    resolved.definitions = {}
 
-def macro_expansion(expr: Module):
-    assert isinstance(expr, Module)
 
-    expr = build_parents(expr)
+def resolve_identifiers(expr: Node):
+    definitions = resolved.definitions = {}
 
-    while True:
-        replacements = expand_macros(expr, prepare_macro_ready_callback(expr))
-        print("macro replacements", replacements)
-        if not replacements:
-            break
-        expr = replace_macro_expansion(expr, replacements)
-        expr = build_parents(expr)
+    def visitor(node):
+        if isinstance(node, Identifier) and node.scope:
+            definitions[node] = tuple(node.scope.find_defs(node))
+        for arg in node.args:
+            visitor(arg)
+        if node.func:
+            visitor(node.func)
+        if node.declared_type:
+            visitor(node.declared_type)
 
+    visitor(expr)
     return expr
 
 
+def find_defs(node: Node):
+    # node.scope.find_defs(node) (resolved by semantic analysis unless node was
+    # created afterwards)
+    try:
+        return resolved.definitions[node]
+    except KeyError:
+        return node.scope.find_defs(node)
+
+
+def find_def(node: Node):
+    defs = find_defs(node)
+    return defs[0] if defs else None
+
+
+def basic_semantic_analysis_passes():
+    # (nodes are renumbered after macro expansion)
+    return [BuildTypes(), BuildParents(), NumberNodes(),
+            VisitorPass(ScopeVisitor(), requires=("build_parents",)),  # looks at grandchildren's parents (e.g. for loop vars)
+            VisitorPass(ImplicitLambdaCaptureVisitor(), requires=("ScopeVisitor",))]
+
+
 def basic_semantic_analysis(expr: Module) -> Module:
-    expr = build_types(expr)
-    expr = build_parents(expr)
-    expr = apply_replacers(expr, [ScopeVisitor()])
-    expr = apply_replacers(expr, [ImplicitLambdaCaptureVisitor()])
+    return PassManager(basic_semantic_analysis_passes()).run(expr)
+
+
+def _clearscope(n):
+    n.scope = None
+    return n
+
+
+def _defines_in_scope(node: Node, scope):
+    # whether ScopeVisitor added a definition to scope for a node of this subtree
+    return any(find_all(node, lambda n: n.scope == scope and (isinstance(n, Assign) or (isinstance(n, Identifier) and n.declared_type is not None))))
+
+
+def reanalyze_rewritten(expr: Module, rewritten) -> Module:
+    # Fresh types, parents and scopes for the subtrees replaced by safety_checks.
+    # Each region root was given the parent and scope of the node it replaced.
+    # Everything outside the regions keeps the scopes of the first analysis.
+
+    if any(_defines_in_scope(root, root.scope) for root in rewritten):
+        # a replaced node defined a variable in the enclosing scope (that
+        # definition would now be stale). Start again from scratch.
+        clear_resolved_definitions()
+        expr = replace_node(expr, _clearscope)
+        return basic_semantic_analysis(expr)
+
+    # inner regions come first (they're redone by any enclosing region)
+    for root in rewritten:
+        scope = root.scope
+        root = build_types(root)
+        root = build_parents(root)
+        root = replace_node(root, _clearscope)
+        root.scope = scope
+        root = apply_replacers(root, [ScopeVisitor()])
+        root = apply_replacers(root, [ImplicitLambdaCaptureVisitor()])
+
+    if rewritten:
+        expr = number_nodes(expr)
     return expr
 
 
-def semantic_analysis(expr: Module) -> Module:
+def semantic_analysis(expr: Module, perf_messages=None) -> Module:
     assert isinstance(expr, Module) # enforced by parser
 
-    expr = one_liner_expander(expr)
-    expr = assign_to_named_parameter(expr)
-    expr = warn_and_remove_redundant_parenthesese(expr)
-
-    expr = basic_semantic_analysis(expr)
-    expr = safety_checks(expr)
+    passes = PassManager([OneLinerExpander(), AssignToNamedParameter(), RemoveRedundantParentheses()] + basic_semantic_analysis_passes())
+    expr = passes.run(expr)
 
-    def clearscope(n):
-        n.scope = None
-        return n
+    t = perf_counter()
+    rewritten = []
+    expr = safety_checks(expr, rewritten)
+    expr = reanalyze_rewritten(expr, rewritten)
+    reanalysis_time = perf_counter() - t
 
-    expr = replace_node(expr, clearscope)
+    expr = resolve_identifiers(expr)
 
-    expr = basic_semantic_analysis(expr)
+    if perf_messages is not None:
+        perf_messages.extend(passes.perf_messages())
+        perf_messages.append(f"  safety checks + reanalysis of {len(rewritten)} rewritten regions time {reanalysis_time}")
 
     def debug_defs(node):
         if not isinstance(node, Node):
@@ -52,10 +52,18 @@
 #include "evalable_repr.donotedit.autogenerated.h"
 ;
 
+;
+#include "binary_ast.donotedit.autogenerated.h"
+;
+
 ;
 #include "parser.donotedit.autogenerated.h"
 ;
 
+;
+#include "preprocessor.donotedit.autogenerated.h"
+;
+
 ;
 #include "macro_expansion.donotedit.autogenerated.h"
 ;
@@ -76,7 +84,7 @@ PYBIND11_MODULE(_abstractsyntaxtree, m) {
         using namespace pybind11::literals;
         (*ceto::mad((*ceto::mad(py::class_<Source,std::shared_ptr<Source>>(m, "Source"))).def(py::init<>()))).def_readwrite("source", (&Source::source));
         (*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad(py::class_<SourceLoc>(m, "SourceLoc"))).def(py::init<std::shared_ptr<const Source>,int>(), py::arg("source") = nullptr, py::arg("loc") = 0))).def_readwrite("source", (&SourceLoc::source)))).def_readwrite("loc", (&SourceLoc::loc)))).def_readwrite("header_file_cth", (&SourceLoc::header_file_cth)))).def_readwrite("header_file_h", (&SourceLoc::header_file_h));
-        auto node { (*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad(py::class_<Node,std::shared_ptr<Node>>(m, "Node"))).def_readwrite("func", (&Node::func)))).def_readwrite("args", (&Node::args)))).def_readwrite("declared_type", (&Node::declared_type)))).def_readwrite("scope", (&Node::scope)))).def_readwrite("source", (&Node::source)))).def("clone", (&Node::clone)))).def("__repr__", (&Node::repr)))).def("ast_repr", [](const Node&  n, const bool  preserve_source_loc, const bool  ceto_evalable) {
+        auto node { (*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad(py::class_<Node,std::shared_ptr<Node>>(m, "Node"))).def_readwrite("func", (&Node::func)))).def_readwrite("args", (&Node::args)))).def_readwrite("declared_type", (&Node::declared_type)))).def_readwrite("scope", (&Node::scope)))).def_readwrite("preorder_index", (&Node::preorder_index)))).def_readwrite("subtree_end", (&Node::subtree_end)))).def_readwrite("source", (&Node::source)))).def("clone", (&Node::clone)))).def("__repr__", (&Node::repr)))).def("ast_repr", [](const Node&  n, const bool  preserve_source_loc, const bool  ceto_evalable) {
                 auto vis { EvalableAstReprVisitor{preserve_source_loc, ceto_evalable} } ;
                 (*ceto::mad(n)).accept(vis);
                 if constexpr (!std::is_void_v<decltype((*ceto::mad(vis)).repr)>) { return (*ceto::mad(vis)).repr; } else { static_cast<void>((*ceto::mad(vis)).repr); };
@@ -126,9 +134,25 @@ PYBIND11_MODULE(_abstractsyntaxtree, m) {
         (*ceto::mad(m)).def("creates_new_variable_scope", (&creates_new_variable_scope));
         (*ceto::mad(m)).def("comes_before", (&comes_before));
         (*ceto::mad(m)).def("parse_test", (&parse_test));
-        (*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad(py::class_<MacroDefinition,std::shared_ptr<MacroDefinition>>(m, "MacroDefinition"))).def(py::init<std::shared_ptr<const Node>,std::shared_ptr<const Node>,std::map<std::string,std::shared_ptr<const Node>>>()))).def_readonly("defmacro_node", (&MacroDefinition::defmacro_node)))).def_readonly("pattern_node", (&MacroDefinition::pattern_node)))).def_readonly("parameters", (&MacroDefinition::parameters)))).def_readwrite("dll_path", (&MacroDefinition::dll_path)))).def_readwrite("impl_function_name", (&MacroDefinition::impl_function_name));
+        (*ceto::mad(m)).def("parse_preprocessed", (&parse_preprocessed), py::call_guard<py::gil_scoped_release>());
+        (*ceto::mad(m)).def("preprocess_source", (&preprocess_source));
+        (*ceto::mad(m)).def("serialize_ast", [](const std::shared_ptr<const Node>&  n) {
+                if constexpr (!std::is_void_v<decltype(py::bytes(serialize_ast(n)))>) { return py::bytes(serialize_ast(n)); } else { static_cast<void>(py::bytes(serialize_ast(n))); };
+                });
+        (*ceto::mad(m)).def("deserialize_ast", (&deserialize_ast), py::arg("data"), py::arg("source") = nullptr);
+        (*ceto::mad(m)).def("referenced_names", (&referenced_names));
+        (*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad(py::class_<SerializedAst,std::shared_ptr<SerializedAst>>(m, "SerializedAst"))).def_readonly("valid", (&SerializedAst::valid)))).def("num_definitions", (&SerializedAst::num_definitions)))).def("definition_name", (&SerializedAst::definition_name)))).def("referenced_names", (&SerializedAst::referenced_names)))).def("load_definition", (&SerializedAst::load_definition), py::arg("index"), py::arg("source") = nullptr))).def("root", (&SerializedAst::root), py::arg("args"), py::arg("source") = nullptr))).def("load", (&SerializedAst::load), py::arg("source") = nullptr);
+        (*ceto::mad(m)).def("load_serialized_ast", [](const py::buffer  buffer) {
+                const auto info = (*ceto::mad(buffer)).request();
+                if constexpr (!std::is_void_v<decltype(read_serialized_ast(std::string_view(static_cast<const char *>(info.ptr), static_cast<size_t>((*ceto::mad(info)).size))))>) { return read_serialized_ast(std::string_view(static_cast<const char *>(info.ptr), static_cast<size_t>((*ceto::mad(info)).size))); } else { static_cast<void>(read_serialized_ast(std::string_view(static_cast<const char *>(info.ptr), static_cast<size_t>((*ceto::mad(info)).size)))); };
+                }, py::keep_alive<0,1>());
+        (*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad(py::class_<MacroDefinition,std::shared_ptr<MacroDefinition>>(m, "MacroDefinition"))).def(py::init<std::shared_ptr<const Node>,std::shared_ptr<const Node>,std::map<std::string,std::shared_ptr<const Node>>>()))).def_readonly("defmacro_node", (&MacroDefinition::defmacro_node)))).def_readonly("pattern_node", (&MacroDefinition::pattern_node)))).def_readonly("parameters", (&MacroDefinition::parameters)))).def_readwrite("dll_path", (&MacroDefinition::dll_path)))).def_readwrite("impl_function_name", (&MacroDefinition::impl_function_name)))).def_readwrite("dll_ready_callback", (&MacroDefinition::dll_ready_callback)))).def_readwrite("interpreted_impl", (&MacroDefinition::interpreted_impl));
+        (*ceto::mad(py::class_<ceto::macros::Skip>(m, "MacroSkip"))).def(py::init<>());
+        (*ceto::mad((*ceto::mad((*ceto::mad((*ceto::mad(py::class_<MacroDispatchStats>(m, "MacroDispatchStats"))).def(py::init<>()))).def_readonly("hits", (&MacroDispatchStats::hits)))).def_readonly("misses", (&MacroDispatchStats::misses)))).def_readonly("skipped", (&MacroDispatchStats::skipped));
         (*ceto::mad(m)).def("macro_matches", (&macro_matches));
         (*ceto::mad(m)).def("expand_macros", (&expand_macros));
+        (*ceto::mad(m)).def("close_macro_libraries", (&close_macro_libraries));
+        (*ceto::mad(m)).def("call_compiled_macro_impl", (&call_compiled_macro_impl));
         return;
         }(m);
 };
@@ -80,6 +80,10 @@ struct Node : public ceto::shared_object, public std::enable_shared_from_this<No
 
     std::weak_ptr<const Node> _parent = {};
 
+    int preorder_index = (-1); static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype((-1)), std::remove_cvref_t<decltype(preorder_index)>>);
+
+    int subtree_end = (-1); static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype((-1)), std::remove_cvref_t<decltype(subtree_end)>>);
+
          virtual inline auto classname() const -> std::string {
             return ceto::util::typeid_name((*this));
         }
@@ -0,0 +1,586 @@
+#pragma once
+
+#include <string>
+#include <cstdio>
+#include <cstdlib>
+#include <iostream>
+#include <fstream>
+#include <sstream>
+#include <functional>
+#include <cassert>
+#include <compare> // for <=>
+#include <thread>
+#include <optional>
+
+
+#include "ceto.h"
+
+#include "ceto_private_listcomp.donotedit.autogenerated.h"
+;
+#include "ceto_private_boundscheck.donotedit.autogenerated.h"
+;
+#include "ceto_private_convenience.donotedit.autogenerated.h"
+;
+#include "ceto_private_append_to_pushback.donotedit.autogenerated.h"
+;
+#include <string_view>
+;
+#include <unordered_map>
+;
+#include <unordered_set>
+;
+#include <algorithm>
+;
+#include "visitor.donotedit.autogenerated.h"
+;
+#include "ast.donotedit.autogenerated.h"
+;
+// unsafe;
+constexpr const uint32_t BINARY_AST_MAGIC { 0x54534143 } ; static_assert(std::is_convertible_v<decltype(0x54534143), decltype(BINARY_AST_MAGIC)>);
+constexpr const uint32_t BINARY_AST_VERSION { 2 } ; static_assert(std::is_convertible_v<decltype(2), decltype(BINARY_AST_VERSION)>);
+constexpr const uint32_t BINARY_AST_NO_INDEX { 0xFFFFFFFF } ; static_assert(std::is_convertible_v<decltype(0xFFFFFFFF), decltype(BINARY_AST_NO_INDEX)>);
+    inline auto binary_ast_kinds() -> std::vector<std::string> {
+        const std::vector<std::string> kinds = std::vector<std::string>{"Node", "UnOp", "LeftAssociativeUnOp", "BinOp", "TypeOp", "SyntaxTypeOp", "AttributeAccess", "ArrowOp", "ScopeResolution", "Assign", "NamedParameter", "BitwiseOrOp", "EqualsCompareOp", "Identifier", "Call", "ArrayAccess", "BracedCall", "Template", "StringLiteral", "IntegerLiteral", "FloatLiteral", "ListLike_", "ListLiteral", "TupleLiteral", "BracedLiteral", "Block", "Module", "RedundantParens", "InfixWrapper_"}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::string>{"Node", "UnOp", "LeftAssociativeUnOp", "BinOp", "TypeOp", "SyntaxTypeOp", "AttributeAccess", "ArrowOp", "ScopeResolution", "Assign", "NamedParameter", "BitwiseOrOp", "EqualsCompareOp", "Identifier", "Call", "ArrayAccess", "BracedCall", "Template", "StringLiteral", "IntegerLiteral", "FloatLiteral", "ListLike_", "ListLiteral", "TupleLiteral", "BracedLiteral", "Block", "Module", "RedundantParens", "InfixWrapper_"}), std::remove_cvref_t<decltype(kinds)>>);
+        return kinds;
+    }
+
+    inline auto append_word( std::string &  out, const uint32_t  word) -> void {
+        for(const auto& i : [&]() -> decltype(auto) {
+                static_assert(!(std :: is_reference_v<decltype((ceto::util::range(4)))>));
+                return ceto::util::range(4);
+                }()) {
+            (*ceto::mad(out)).push_back(static_cast<char>((word >> (8 * i)) & 0xFF));
+        }
+    }
+
+    inline auto definition_name(const std::shared_ptr<const Node>&  node) -> std::string {
+        const auto typed = std::dynamic_pointer_cast<const TypeOp>(node);
+        if (typed) {
+            return definition_name((*ceto::mad(typed)).lhs());
+        }
+        const auto call = std::dynamic_pointer_cast<const Call>(node);
+        if ((!call || (*ceto::mad((*ceto::mad(call)).args)).empty()) || !(*ceto::mad((*ceto::mad(call)).func)).name()) {
+            return std::string {""};
+        }
+        const auto func_name = (*ceto::mad_smartptr((*ceto::mad((*ceto::mad(call)).func)).name())).value();
+        const auto head = ceto::bounds_check((*ceto::mad(call)).args, 0);
+        if (((func_name != "def") && (func_name != "class")) && (func_name != "struct")) {
+            return std::string {""};
+        }
+        if ((*ceto::mad(head)).name()) {
+            return (*ceto::mad_smartptr((*ceto::mad(head)).name())).value();
+        }
+        const auto base_class_call = std::dynamic_pointer_cast<const Call>(head);
+        if (((func_name != "def") && base_class_call) && (*ceto::mad((*ceto::mad(base_class_call)).func)).name()) {
+            return (*ceto::mad_smartptr((*ceto::mad((*ceto::mad(base_class_call)).func)).name())).value();
+        }
+        return std::string {""};
+    }
+
+struct ReferencedNamesVisitor : public BaseVisitor<ReferencedNamesVisitor> {
+
+    std::unordered_set<std::string> names = {};
+
+        inline auto visit(const Node&  node) -> void override {
+            if ((*ceto::mad(node)).func) {
+                (*ceto::mad((*ceto::mad(node)).func)).accept((*this));
+            }
+            auto && args { (*ceto::mad(node)).args } ;
+            for(const auto& arg : args) {
+                (*ceto::mad(arg)).accept((*this));
+            }
+        }
+
+        inline auto visit(const Identifier&  node) -> void override {
+            (*ceto::mad(this -> names)).insert((*ceto::mad(node)).repr());
+        }
+
+        inline auto visit(const StringLiteral&  node) -> void override {
+            (*ceto::mad(this -> names)).insert((*ceto::mad(node)).str);
+            if ((*ceto::mad(node)).prefix) {
+                (*ceto::mad((*ceto::mad(node)).prefix)).accept((*this));
+            }
+            if ((*ceto::mad(node)).suffix) {
+                (*ceto::mad((*ceto::mad(node)).suffix)).accept((*this));
+            }
+        }
+
+        inline auto visit(const IntegerLiteral&  node) -> void override {
+            if ((*ceto::mad(node)).suffix) {
+                (*ceto::mad((*ceto::mad(node)).suffix)).accept((*this));
+            }
+        }
+
+        inline auto visit(const FloatLiteral&  node) -> void override {
+            if ((*ceto::mad(node)).suffix) {
+                (*ceto::mad((*ceto::mad(node)).suffix)).accept((*this));
+            }
+        }
+
+};
+
+    inline auto referenced_names(const Node&  node) -> std::unordered_set<std::string> {
+        auto visitor { ReferencedNamesVisitor() } ;
+        (*ceto::mad(node)).accept(visitor);
+        return (*ceto::mad(visitor)).names;
+    }
+
+struct BinaryAstWriter : public BaseVisitor<BinaryAstWriter> {
+
+    std::unordered_map<std::string,uint32_t> kind_tags = {};
+
+    std::unordered_map<std::string,uint32_t> string_indices = {};
+
+    std::vector<std::string> strings = std::vector<std::string>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::string>{}), std::remove_cvref_t<decltype(strings)>>);
+
+    std::vector<uint32_t> node_words = std::vector<uint32_t>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<uint32_t>{}), std::remove_cvref_t<decltype(node_words)>>);
+
+    uint32_t num_nodes { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(num_nodes)>);
+
+    uint32_t last_index = BINARY_AST_NO_INDEX; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(BINARY_AST_NO_INDEX), std::remove_cvref_t<decltype(last_index)>>);
+
+    std::vector<uint32_t> current_refs = std::vector<uint32_t>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<uint32_t>{}), std::remove_cvref_t<decltype(current_refs)>>);
+
+    std::vector<uint32_t> definition_names = std::vector<uint32_t>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<uint32_t>{}), std::remove_cvref_t<decltype(definition_names)>>);
+
+    std::vector<std::vector<uint32_t>> definition_refs = std::vector<std::vector<uint32_t>>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::vector<uint32_t>>{}), std::remove_cvref_t<decltype(definition_refs)>>);
+
+    std::vector<size_t> definition_offsets = std::vector<size_t>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<size_t>{}), std::remove_cvref_t<decltype(definition_offsets)>>);
+
+    decltype(std::string {""}) definitions = std::string {""};
+
+        inline auto intern(const std::string&  s) -> uint32_t {
+            const auto found = (*ceto::mad(this -> string_indices)).find(s);
+            if (found != (*ceto::mad(this -> string_indices)).end()) {
+                return (found -> second);
+            }
+            const uint32_t index = static_cast<uint32_t>((*ceto::mad(this -> strings)).size()); static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(static_cast<uint32_t>((*ceto::mad(this -> strings)).size())), std::remove_cvref_t<decltype(index)>>);
+            (*ceto::mad_smartptr(this -> string_indices)).emplace(s, index);
+            ceto::append_or_push_back(this -> strings, s);
+            return index;
+        }
+
+        inline auto kind_tag(const Node&  node) -> uint32_t {
+            if ((*ceto::mad(this -> kind_tags)).empty()) {
+                const auto kinds = binary_ast_kinds();
+                for(const auto& i : [&]() -> decltype(auto) {
+                        static_assert(!(std :: is_reference_v<decltype((ceto::util::range((*ceto::mad(kinds)).size())))>));
+                        return ceto::util::range((*ceto::mad(kinds)).size());
+                        }()) {
+                    (*ceto::mad_smartptr(this -> kind_tags)).emplace(ceto::bounds_check(kinds, i), static_cast<uint32_t>(i));
+                }
+            }
+            const auto found = (*ceto::mad(this -> kind_tags)).find((*ceto::mad(node)).classname());
+            if (found == (*ceto::mad(this -> kind_tags)).end()) {
+                throw std::runtime_error("no binary ast kind for " + (*ceto::mad(node)).classname());
+            }
+            return (found -> second);
+        }
+
+        inline auto write_child(const std::shared_ptr<const Node>&  child) -> uint32_t {
+            if (!child) {
+                return BINARY_AST_NO_INDEX;
+            }
+            (*ceto::mad(child)).accept((*this));
+            return (this -> last_index);
+        }
+
+        inline auto record(const Node&  node, const uint32_t  string_index, const uint32_t  prefix, const uint32_t  suffix) -> void {
+            const auto func = this -> write_child((*ceto::mad(node)).func);
+            std::vector<uint32_t> arg_indices = std::vector<uint32_t>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<uint32_t>{}), std::remove_cvref_t<decltype(arg_indices)>>);
+            auto && args { (*ceto::mad(node)).args } ;
+            for(const auto& arg : args) {
+                (arg_indices).push_back(this -> write_child(arg));
+            }
+            ceto::append_or_push_back(this -> node_words, this -> kind_tag(node));
+            ceto::append_or_push_back(this -> node_words, static_cast<uint32_t>((*ceto::mad((*ceto::mad(node)).source)).loc));
+            ceto::append_or_push_back(this -> node_words, string_index);
+            ceto::append_or_push_back(this -> node_words, func);
+            ceto::append_or_push_back(this -> node_words, prefix);
+            ceto::append_or_push_back(this -> node_words, suffix);
+            ceto::append_or_push_back(this -> node_words, static_cast<uint32_t>((*ceto::mad(arg_indices)).size()));
+            (*ceto::mad(this -> node_words)).insert((*ceto::mad(this -> node_words)).end(), (*ceto::mad(arg_indices)).begin(), (*ceto::mad(arg_indices)).end());
+            (this -> last_index) = (this -> num_nodes);
+            (this -> num_nodes) += 1;
+        }
+
+        inline auto visit(const Node&  node) -> void override {
+            this -> record(node, BINARY_AST_NO_INDEX, BINARY_AST_NO_INDEX, BINARY_AST_NO_INDEX);
+        }
+
+        inline auto visit(const UnOp&  node) -> void override {
+            this -> record(node, this -> intern((*ceto::mad(node)).op), BINARY_AST_NO_INDEX, BINARY_AST_NO_INDEX);
+        }
+
+        inline auto visit(const LeftAssociativeUnOp&  node) -> void override {
+            this -> record(node, this -> intern((*ceto::mad(node)).op), BINARY_AST_NO_INDEX, BINARY_AST_NO_INDEX);
+        }
+
+        inline auto visit(const BinOp&  node) -> void override {
+            this -> record(node, this -> intern((*ceto::mad(node)).op), BINARY_AST_NO_INDEX, BINARY_AST_NO_INDEX);
+        }
+
+        inline auto visit(const Identifier&  node) -> void override {
+            const auto name = this -> intern((*ceto::mad(node)).repr());
+            ceto::append_or_push_back(this -> current_refs, name);
+            this -> record(node, name, BINARY_AST_NO_INDEX, BINARY_AST_NO_INDEX);
+        }
+
+        inline auto visit(const StringLiteral&  node) -> void override {
+            const auto prefix = this -> write_child((*ceto::mad(node)).prefix);
+            const auto suffix = this -> write_child((*ceto::mad(node)).suffix);
+            const auto text = this -> intern((*ceto::mad(node)).str);
+            ceto::append_or_push_back(this -> current_refs, text);
+            this -> record(node, text, prefix, suffix);
+        }
+
+        inline auto visit(const IntegerLiteral&  node) -> void override {
+            const auto suffix = this -> write_child((*ceto::mad(node)).suffix);
+            this -> record(node, this -> intern((*ceto::mad(node)).integer_string), BINARY_AST_NO_INDEX, suffix);
+        }
+
+        inline auto visit(const FloatLiteral&  node) -> void override {
+            const auto suffix = this -> write_child((*ceto::mad(node)).suffix);
+            this -> record(node, this -> intern((*ceto::mad(node)).float_string), BINARY_AST_NO_INDEX, suffix);
+        }
+
+        inline auto write_definition(const std::shared_ptr<const Node>&  node) -> void {
+            (*ceto::mad(this -> node_words)).clear();
+            (this -> num_nodes) = 0;
+            (*ceto::mad(this -> current_refs)).clear();
+            (*ceto::mad(node)).accept((*this));
+            const auto name = definition_name(node);
+            ceto::append_or_push_back(this -> definition_names, [&]() {if ((*ceto::mad(name)).empty()) {
+                return BINARY_AST_NO_INDEX;
+            } else {
+                return this -> intern(name);
+            }}()
+);
+            std::sort((*ceto::mad(this -> current_refs)).begin(), (*ceto::mad(this -> current_refs)).end());
+            (*ceto::mad(this -> current_refs)).erase(std::unique((*ceto::mad(this -> current_refs)).begin(), (*ceto::mad(this -> current_refs)).end()), (*ceto::mad(this -> current_refs)).end());
+            ceto::append_or_push_back(this -> definition_refs, this -> current_refs);
+            auto out { std::string() } ;
+            append_word(out, this -> num_nodes);
+            for(const auto& word : (this -> node_words)) {
+                append_word(out, word);
+            }
+            append_word(out, this -> last_index);
+            ceto::append_or_push_back(this -> definition_offsets, (*ceto::mad(this -> definitions)).size());
+            (this -> definitions) += out;
+        }
+
+        inline auto serialized(const Node&  root) -> std::string {
+            auto out { std::string() } ;
+            append_word(out, BINARY_AST_MAGIC);
+            append_word(out, BINARY_AST_VERSION);
+            append_word(out, static_cast<uint32_t>((*ceto::mad(this -> strings)).size()));
+            for(const auto& s : (this -> strings)) {
+                append_word(out, static_cast<uint32_t>((*ceto::mad(s)).size()));
+                out += s;
+            }
+            append_word(out, this -> kind_tag(root));
+            append_word(out, static_cast<uint32_t>((*ceto::mad((*ceto::mad(root)).source)).loc));
+            append_word(out, static_cast<uint32_t>((*ceto::mad(this -> definition_names)).size()));
+            size_t table_size { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(table_size)>);
+            for(const auto& refs : (this -> definition_refs)) {
+                table_size += (4 * (3 + (*ceto::mad(refs)).size()));
+            }
+            const auto definitions_start = ((*ceto::mad(out)).size() + table_size);
+            for(const auto& i : [&]() -> decltype(auto) {
+                    static_assert(!(std :: is_reference_v<decltype((ceto::util::range((*ceto::mad(this -> definition_names)).size())))>));
+                    return ceto::util::range((*ceto::mad(this -> definition_names)).size());
+                    }()) {
+                append_word(out, ceto::bounds_check(this -> definition_names, i));
+                append_word(out, static_cast<uint32_t>(definitions_start + ceto::bounds_check(this -> definition_offsets, i)));
+                append_word(out, static_cast<uint32_t>((*ceto::mad(ceto::bounds_check(this -> definition_refs, i))).size()));
+                auto && refs { ceto::bounds_check(this -> definition_refs, i) } ;
+                for(const auto& referenced : refs) {
+                    append_word(out, referenced);
+                }
+            }
+            out += (this -> definitions);
+            return out;
+        }
+
+};
+
+    inline auto serialize_ast(const std::shared_ptr<const Node>&  node) -> std::string {
+        if ((*ceto::mad(node)).func || !std::dynamic_pointer_cast<const ListLike_>(node)) {
+            throw std::invalid_argument("serialize_ast expects a Module (or another ListLike_)");
+        }
+        auto writer { BinaryAstWriter() } ;
+        auto && args { (*ceto::mad(node)).args } ;
+        for(const auto& arg : args) {
+            (*ceto::mad(writer)).write_definition(arg);
+        }
+        return (*ceto::mad(writer)).serialized((*node));
+    }
+
+    inline auto make_binary_ast_node(const std::string&  kind, const std::string&  text, const std::shared_ptr<const Node>&  func, const std::shared_ptr<const Node>&  prefix, const std::shared_ptr<const Node>&  suffix, const std::vector<std::shared_ptr<const Node>>&  args, const SourceLoc&  source) -> std::shared_ptr<const Node> {
+        const auto prefix_identifier = std::dynamic_pointer_cast<const Identifier>(prefix);
+        const auto suffix_identifier = std::dynamic_pointer_cast<const Identifier>(suffix);
+        if ((prefix && !prefix_identifier) || (suffix && !suffix_identifier)) {
+            return nullptr;
+        }
+        if (kind == "Identifier") {
+            return std::make_shared<const Identifier>(text, source);
+        } else if ((kind == "Call")) {
+            return std::make_shared<const Call>(func, args, source);
+        } else if ((kind == "BinOp")) {
+            return std::make_shared<const BinOp>(text, args, source);
+        } else if ((kind == "AttributeAccess")) {
+            return std::make_shared<const AttributeAccess>(text, args, source);
+        } else if ((kind == "TypeOp")) {
+            return std::make_shared<const TypeOp>(text, args, source);
+        } else if ((kind == "SyntaxTypeOp")) {
+            return std::make_shared<const SyntaxTypeOp>(text, args, source);
+        } else if ((kind == "Assign")) {
+            return std::make_shared<const Assign>(text, args, source);
+        } else if ((kind == "NamedParameter")) {
+            return std::make_shared<const NamedParameter>(text, args, source);
+        } else if ((kind == "ScopeResolution")) {
+            return std::make_shared<const ScopeResolution>(text, args, source);
+        } else if ((kind == "ArrowOp")) {
+            return std::make_shared<const ArrowOp>(text, args, source);
+        } else if ((kind == "BitwiseOrOp")) {
+            return std::make_shared<const BitwiseOrOp>(text, args, source);
+        } else if ((kind == "EqualsCompareOp")) {
+            return std::make_shared<const EqualsCompareOp>(text, args, source);
+        } else if ((kind == "UnOp")) {
+            return std::make_shared<const UnOp>(text, args, source);
+        } else if ((kind == "LeftAssociativeUnOp")) {
+            return std::make_shared<const LeftAssociativeUnOp>(text, args, source);
+        } else if ((kind == "Block")) {
+            return std::make_shared<const Block>(args, source);
+        } else if ((kind == "Module")) {
+            return std::make_shared<const Module>(args, source);
+        } else if ((kind == "ArrayAccess")) {
+            return std::make_shared<const ArrayAccess>(func, args, source);
+        } else if ((kind == "BracedCall")) {
+            return std::make_shared<const BracedCall>(func, args, source);
+        } else if ((kind == "Template")) {
+            return std::make_shared<const Template>(func, args, source);
+        } else if ((kind == "StringLiteral")) {
+            return std::make_shared<const StringLiteral>(text, prefix_identifier, suffix_identifier, source);
+        } else if ((kind == "IntegerLiteral")) {
+            return std::make_shared<const IntegerLiteral>(text, suffix_identifier, source);
+        } else if ((kind == "FloatLiteral")) {
+            return std::make_shared<const FloatLiteral>(text, suffix_identifier, source);
+        } else if ((kind == "ListLiteral")) {
+            return std::make_shared<const ListLiteral>(args, source);
+        } else if ((kind == "TupleLiteral")) {
+            return std::make_shared<const TupleLiteral>(args, source);
+        } else if ((kind == "BracedLiteral")) {
+            return std::make_shared<const BracedLiteral>(args, source);
+        } else if ((kind == "ListLike_")) {
+            return std::make_shared<const ListLike_>(args, source);
+        } else if ((kind == "RedundantParens")) {
+            return std::make_shared<const RedundantParens>(args, source);
+        } else if ((kind == "InfixWrapper_")) {
+            return std::make_shared<const InfixWrapper_>(args, source);
+        } else if ((kind == "Node")) {
+            return std::make_shared<const Node>(func, args, source);
+        }
+        return nullptr;
+    }
+
+struct BinaryAstReader : public ceto::object {
+
+    std::string_view data;
+
+    size_t pos;
+
+    bool error { false } ; static_assert(std::is_convertible_v<decltype(false), decltype(error)>);
+
+        inline auto read_word() -> uint32_t {
+            if (((this -> error) || ((this -> pos) > (*ceto::mad(this -> data)).size())) || (((*ceto::mad(this -> data)).size() - (this -> pos)) < 4)) {
+                (this -> error) = true;
+                return static_cast<uint32_t>(0);
+            }
+            uint32_t word { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(word)>);
+            for(const auto& i : [&]() -> decltype(auto) {
+                    static_assert(!(std :: is_reference_v<decltype((ceto::util::range(4)))>));
+                    return ceto::util::range(4);
+                    }()) {
+                word |= (static_cast<uint32_t>(static_cast<unsigned char>(ceto::bounds_check(this -> data, (this -> pos) + i))) << (8 * i));
+            }
+            (this -> pos) += 4;
+            return word;
+        }
+
+        inline auto node_at(const std::vector<std::shared_ptr<const Node>>&  nodes, const uint32_t  index) -> std::shared_ptr<const Node> {
+            if (index == BINARY_AST_NO_INDEX) {
+                return nullptr;
+            }
+            if (index >= (*ceto::mad(nodes)).size()) {
+                (this -> error) = true;
+                return nullptr;
+            }
+            return ceto::bounds_check(nodes, index);
+        }
+
+        inline auto read_definition(const std::vector<std::string>&  kinds, const std::vector<std::string_view>&  strings, const std::shared_ptr<const Source>&  source) -> std::shared_ptr<const Node> {
+            const auto num_nodes = this -> read_word();
+            std::vector<std::shared_ptr<const Node>> nodes = std::vector<std::shared_ptr<const Node>>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::shared_ptr<const Node>>{}), std::remove_cvref_t<decltype(nodes)>>);
+            (*ceto::mad(nodes)).reserve(std::min(static_cast<size_t>(num_nodes), (*ceto::mad(this -> data)).size() / 28));
+            while ((*ceto::mad(nodes)).size() < num_nodes) {                const auto kind = this -> read_word();
+                const auto loc = static_cast<int>(this -> read_word());
+                const auto string_index = this -> read_word();
+                const auto func = this -> node_at(nodes, this -> read_word());
+                const auto prefix = this -> node_at(nodes, this -> read_word());
+                const auto suffix = this -> node_at(nodes, this -> read_word());
+                const auto num_args = this -> read_word();
+                std::vector<std::shared_ptr<const Node>> args = std::vector<std::shared_ptr<const Node>>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::shared_ptr<const Node>>{}), std::remove_cvref_t<decltype(args)>>);
+                while ((*ceto::mad(args)).size() < num_args) {                    (args).push_back(this -> node_at(nodes, this -> read_word()));
+                    if (this -> error) {
+                        return nullptr;
+                    }
+                }
+                if (((this -> error) || (kind >= (*ceto::mad(kinds)).size())) || ((string_index != BINARY_AST_NO_INDEX) && (string_index >= (*ceto::mad(strings)).size()))) {
+                    return nullptr;
+                }
+                const auto text = [&]() {if (string_index == BINARY_AST_NO_INDEX) {
+                    return std::string {""};
+                } else {
+                    return std::string(ceto::bounds_check(strings, string_index));
+                }}()
+;
+                const auto node = make_binary_ast_node(ceto::bounds_check(kinds, kind), text, func, prefix, suffix, args, SourceLoc{source, loc});
+                if (!node) {
+                    return nullptr;
+                }
+                (nodes).push_back(node);
+            }
+            const auto root = this -> node_at(nodes, this -> read_word());
+            if (this -> error) {
+                return nullptr;
+            }
+            return root;
+        }
+
+    explicit BinaryAstReader(std::string_view data, size_t pos) : data(data), pos(pos) {}
+
+    BinaryAstReader() = delete;
+
+};
+
+struct SerializedAst : public ceto::shared_object, public std::enable_shared_from_this<SerializedAst> {
+
+    std::string_view data;
+
+    std::vector<std::string> kinds = binary_ast_kinds(); static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(binary_ast_kinds()), std::remove_cvref_t<decltype(kinds)>>);
+
+    std::vector<std::string_view> strings = std::vector<std::string_view>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::string_view>{}), std::remove_cvref_t<decltype(strings)>>);
+
+    uint32_t root_kind { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(root_kind)>);
+
+    int root_loc { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(root_loc)>);
+
+    std::vector<uint32_t> definition_names = std::vector<uint32_t>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<uint32_t>{}), std::remove_cvref_t<decltype(definition_names)>>);
+
+    std::vector<uint32_t> definition_offsets = std::vector<uint32_t>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<uint32_t>{}), std::remove_cvref_t<decltype(definition_offsets)>>);
+
+    std::vector<std::vector<uint32_t>> definition_refs = std::vector<std::vector<uint32_t>>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::vector<uint32_t>>{}), std::remove_cvref_t<decltype(definition_refs)>>);
+
+    decltype(false) valid = false;
+
+        inline auto read_tables() -> bool {
+            auto reader { BinaryAstReader{this -> data, 0} } ;
+            if (((*ceto::mad(reader)).read_word() != BINARY_AST_MAGIC) || ((*ceto::mad(reader)).read_word() != BINARY_AST_VERSION)) {
+                return false;
+            }
+            const auto num_strings = (*ceto::mad(reader)).read_word();
+            (*ceto::mad(this -> strings)).reserve(std::min(static_cast<size_t>(num_strings), (*ceto::mad(this -> data)).size() / 4));
+            while ((*ceto::mad(this -> strings)).size() < num_strings) {                const auto length = (*ceto::mad(reader)).read_word();
+                if ((*ceto::mad(reader)).error || (((*ceto::mad(this -> data)).size() - (*ceto::mad(reader)).pos) < length)) {
+                    return false;
+                }
+                ceto::append_or_push_back(this -> strings, (*ceto::mad(this -> data)).substr((*ceto::mad(reader)).pos, length));
+                (*ceto::mad(reader)).pos += length;
+            }
+            (this -> root_kind) = (*ceto::mad(reader)).read_word();
+            (this -> root_loc) = static_cast<int>((*ceto::mad(reader)).read_word());
+            const auto num_definitions = (*ceto::mad(reader)).read_word();
+            while ((*ceto::mad(this -> definition_names)).size() < num_definitions) {                const auto name = (*ceto::mad(reader)).read_word();
+                const auto offset = (*ceto::mad(reader)).read_word();
+                const auto num_refs = (*ceto::mad(reader)).read_word();
+                std::vector<uint32_t> refs = std::vector<uint32_t>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<uint32_t>{}), std::remove_cvref_t<decltype(refs)>>);
+                while ((*ceto::mad(refs)).size() < num_refs) {                    const auto referenced = (*ceto::mad(reader)).read_word();
+                    if ((*ceto::mad(reader)).error || (referenced >= (*ceto::mad(this -> strings)).size())) {
+                        return false;
+                    }
+                    (refs).push_back(referenced);
+                }
+                if (((*ceto::mad(reader)).error || (offset >= (*ceto::mad(this -> data)).size())) || ((name != BINARY_AST_NO_INDEX) && (name >= (*ceto::mad(this -> strings)).size()))) {
+                    return false;
+                }
+                ceto::append_or_push_back(this -> definition_names, name);
+                ceto::append_or_push_back(this -> definition_offsets, offset);
+                ceto::append_or_push_back(this -> definition_refs, refs);
+            }
+            return (!(*ceto::mad(reader)).error && ((this -> root_kind) < (*ceto::mad(this -> kinds)).size()));
+        }
+
+        inline auto num_definitions() const -> size_t {
+            return (*ceto::mad(this -> definition_names)).size();
+        }
+
+        inline auto definition_name(const size_t  index) const -> std::string {
+            const auto name = (*ceto::mad(this -> definition_names)).at(index);
+            return [&]() {if (name == BINARY_AST_NO_INDEX) {
+                return std::string {""};
+            } else {
+                return std::string(ceto::bounds_check(this -> strings, name));
+            }}()
+;
+        }
+
+        inline auto referenced_names(const size_t  index) const -> std::vector<std::string> {
+            std::vector<std::string> names = std::vector<std::string>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::string>{}), std::remove_cvref_t<decltype(names)>>);
+            auto && refs { (*ceto::mad(this -> definition_refs)).at(index) } ;
+            for(const auto& referenced : refs) {
+                (names).push_back(std::string(ceto::bounds_check(this -> strings, referenced)));
+            }
+            return names;
+        }
+
+        inline auto load_definition(const size_t  index, const std::shared_ptr<const Source>&  source) const -> std::shared_ptr<const Node> {
+            auto reader { BinaryAstReader{this -> data, (*ceto::mad(this -> definition_offsets)).at(index)} } ;
+            return (*ceto::mad(reader)).read_definition(this -> kinds, this -> strings, source);
+        }
+
+        inline auto root(const std::vector<std::shared_ptr<const Node>>&  args, const std::shared_ptr<const Source>&  source) const -> std::shared_ptr<const Node> {
+            return make_binary_ast_node((*ceto::mad(this -> kinds)).at(this -> root_kind), std::string {""}, nullptr, nullptr, nullptr, args, SourceLoc{source, this -> root_loc});
+        }
+
+        inline auto load(const std::shared_ptr<const Source>&  source) const -> std::shared_ptr<const Node> {
+            std::vector<std::shared_ptr<const Node>> args = std::vector<std::shared_ptr<const Node>>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::shared_ptr<const Node>>{}), std::remove_cvref_t<decltype(args)>>);
+            while ((*ceto::mad(args)).size() < (*ceto::mad(this -> definition_names)).size()) {                const auto arg = this -> load_definition((*ceto::mad(args)).size(), source);
+                if (!arg) {
+                    return nullptr;
+                }
+                (args).push_back(arg);
+            }
+            return this -> root(args, source);
+        }
+
+    explicit SerializedAst(std::string_view data) : data(data) {}
+
+    SerializedAst() = delete;
+
+};
+
+    inline auto read_serialized_ast(const std::string_view  data) -> std::shared_ptr<SerializedAst> {
+        auto serialized { std::make_shared<SerializedAst>(data) } ;
+        (*ceto::mad(serialized)).valid = (*ceto::mad(serialized)).read_tables();
+        return serialized;
+    }
+
+    inline auto deserialize_ast(const std::string&  data, const std::shared_ptr<const Source>&  source) -> std::shared_ptr<const Node> {
+        const auto serialized = read_serialized_ast(data);
+        if (!(*ceto::mad(serialized)).valid) {
+            return nullptr;
+        }
+        return (*ceto::mad(serialized)).load(source);
+    }
+
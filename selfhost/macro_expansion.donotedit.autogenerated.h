@@ -14,7 +14,6 @@
 
 
 #include "ceto.h"
-//#include "ceto_private_boundscheck.donotedit.autogenerated.h"
 
 #include "ceto_private_listcomp.donotedit.autogenerated.h"
 ;
@@ -28,6 +27,8 @@
 ;
 #include <unordered_map>
 ;
+#include <unordered_set>
+;
 #include <ranges>
 ;
 #include <functional>
@@ -50,6 +51,7 @@
     #define CETO_DLSYM GetProcAddress
     #define CETO_DLOPEN LoadLibraryA
     #define CETO_DLCLOSE FreeLibrary
+    #define CETO_DLHANDLE HMODULE
     ;
 #else
     #include <dlfcn.h>
@@ -58,6 +60,7 @@
     #define CETO_DLSYM dlsym
     #define CETO_DLOPEN(L) dlopen(L, RTLD_NOW)
     #define CETO_DLCLOSE dlclose
+    #define CETO_DLHANDLE void*
     ;
 #endif
 
@@ -79,22 +82,85 @@ struct MacroDefinition : public ceto::shared_object, public std::enable_shared_f
 
     std::string impl_function_name = {};
 
+    std::function<void()> dll_ready_callback = {};
+
+    std::function<std::variant<std::shared_ptr<const Node>,ceto::macros::Skip>(const std::map<std::string,std::shared_ptr<const Node>> &)> interpreted_impl = {};
+
     explicit MacroDefinition(std::shared_ptr<const Node> defmacro_node, std::shared_ptr<const Node> pattern_node, std::map<std::string,std::shared_ptr<const Node>> parameters) : defmacro_node(std::move(defmacro_node)), pattern_node(std::move(pattern_node)), parameters(parameters) {}
 
     MacroDefinition() = delete;
 
 };
 
+struct MacroDispatchStats : public ceto::object {
+
+    size_t hits = {};
+
+    size_t misses = {};
+
+    size_t skipped = {};
+
+};
+
+    inline auto _is_macro_param(const std::shared_ptr<const Node>&  node,  const std::map<std::string,std::shared_ptr<const Node>> &  parameters) -> auto {
+        return ((std::dynamic_pointer_cast<const Identifier>(node) != nullptr) && (*ceto::mad(parameters)).contains((*ceto::mad_smartptr((*ceto::mad(node)).name())).value()));
+    }
+
+    inline auto macro_dispatch_key(const std::shared_ptr<const Node>&  pattern,  const std::map<std::string,std::shared_ptr<const Node>> &  parameters) -> std::string {
+        if (_is_macro_param(pattern, parameters)) {
+            return std::string {""};
+        }
+        if ((std::dynamic_pointer_cast<const BinOp>(pattern) != nullptr)) {
+            auto && pattern_args { (*ceto::mad(pattern)).args } ;
+            for(const auto& a : pattern_args) {
+                if (_is_macro_param(a, parameters)) {
+                    const auto typed_param = std::dynamic_pointer_cast<const TypeOp>((*ceto::mad(parameters)).at((*ceto::mad_smartptr((*ceto::mad(a)).name())).value()));
+                    if (typed_param && (std::dynamic_pointer_cast<const BitwiseOrOp>((*ceto::mad(typed_param)).rhs()) != nullptr)) {
+                        return std::string {""};
+                    }
+                }
+            }
+        }
+        auto key { (*ceto::mad(pattern)).classname() } ;
+        if ((std::dynamic_pointer_cast<const Identifier>((*ceto::mad(pattern)).func) != nullptr) && !_is_macro_param((*ceto::mad(pattern)).func, parameters)) {
+            key += ("." + (*ceto::mad_smartptr((*ceto::mad((*ceto::mad(pattern)).func)).name())).value());
+        }
+        return key;
+    }
+
 struct MacroScope : public ceto::object {
 
     MacroScope const * parent = nullptr; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(nullptr), std::remove_cvref_t<decltype(parent)>>);
 
     std::vector<std::shared_ptr<const MacroDefinition>> macro_definitions = std::vector<std::shared_ptr<const MacroDefinition>>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::shared_ptr<const MacroDefinition>>{}), std::remove_cvref_t<decltype(macro_definitions)>>);
 
+    std::unordered_map<std::string,std::vector<size_t>> dispatch_index = {};
+
         inline auto add_definition(const std::shared_ptr<const MacroDefinition>&  defn) -> void {
+            (*ceto::mad(ceto::bounds_check(this -> dispatch_index, macro_dispatch_key((*ceto::mad(defn)).pattern_node, (*ceto::mad(defn)).parameters)))).push_back((*ceto::mad(this -> macro_definitions)).size());
             (*ceto::mad(this -> macro_definitions)).push_back(defn);
         }
 
+        inline auto candidate_definitions(const std::shared_ptr<const Node>&  node) const -> std::vector<std::shared_ptr<const MacroDefinition>> {
+            std::vector<std::string> keys = std::vector<std::string>{std::string {""}, (*ceto::mad(node)).classname()}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::string>{std::string {""}, (*ceto::mad(node)).classname()}), std::remove_cvref_t<decltype(keys)>>);
+            if ((std::dynamic_pointer_cast<const Identifier>((*ceto::mad(node)).func) != nullptr)) {
+                (keys).push_back(((*ceto::mad(node)).classname() + ".") + (*ceto::mad_smartptr((*ceto::mad((*ceto::mad(node)).func)).name())).value());
+            }
+            std::vector<size_t> indices = std::vector<size_t>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<size_t>{}), std::remove_cvref_t<decltype(indices)>>);
+            for(const auto& key : keys) {
+                const auto found = (*ceto::mad(this -> dispatch_index)).find(key);
+                if (found != (*ceto::mad(this -> dispatch_index)).end()) {
+                    (*ceto::mad(indices)).insert((*ceto::mad(indices)).end(), (*ceto::mad(found -> second)).begin(), (*ceto::mad(found -> second)).end());
+                }
+            }
+            std::sort((*ceto::mad(indices)).rbegin(), (*ceto::mad(indices)).rend());
+            std::vector<std::shared_ptr<const MacroDefinition>> candidates = std::vector<std::shared_ptr<const MacroDefinition>>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::shared_ptr<const MacroDefinition>>{}), std::remove_cvref_t<decltype(candidates)>>);
+            for(const auto& i : indices) {
+                (candidates).push_back(ceto::bounds_check(this -> macro_definitions, i));
+            }
+            return candidates;
+        }
+
         inline auto enter_scope() const -> std::unique_ptr<MacroScope> {
             auto s = std::make_unique<MacroScope>();
             (*ceto::mad(s)).parent = this;
@@ -250,21 +316,69 @@ struct MacroScope : public ceto::object {
         return submatches;
     }
 
-    inline auto call_macro_impl(const std::shared_ptr<const MacroDefinition>&  definition,  const std::map<std::string,std::shared_ptr<const Node>> &  match) -> std::variant<std::shared_ptr<const Node>,ceto::macros::Skip> {
-        const auto handle = CETO_DLOPEN((*ceto::mad((*ceto::mad(definition)).dll_path)).c_str());
-        if (!handle) {
-            throw std::runtime_error("Failed to open macro dll: " + (*ceto::mad(definition)).dll_path);
+struct MacroLibraryCache : public ceto::object {
+
+    std::unordered_map<std::string,CETO_DLHANDLE> handles = {};
+
+    std::unordered_map<std::string,void *> functions = {};
+
+};
+
+    inline auto macro_library_cache() -> MacroLibraryCache & {
+        static auto cache { MacroLibraryCache() } ;
+        return cache;
+    }
+
+    inline auto macro_impl_function(const std::shared_ptr<const MacroDefinition>&  definition) -> void * {
+        auto && cache { macro_library_cache() } ;
+        const auto key = (((*ceto::mad(definition)).dll_path + ":") + (*ceto::mad(definition)).impl_function_name);
+        const auto found = (*ceto::mad((*ceto::mad(cache)).functions)).find(key);
+        if (found != (*ceto::mad((*ceto::mad(cache)).functions)).end()) {
+            return (found -> second);
+        }
+        if (!(*ceto::mad((*ceto::mad(cache)).handles)).contains((*ceto::mad(definition)).dll_path)) {
+            const auto handle = CETO_DLOPEN((*ceto::mad((*ceto::mad(definition)).dll_path)).c_str());
+            if (!handle) {
+                throw std::runtime_error("Failed to open macro dll: " + (*ceto::mad(definition)).dll_path);
+            }
+            ceto::bounds_check((*ceto::mad(cache)).handles, (*ceto::mad(definition)).dll_path) = handle;
         }
-        const auto fptr = CETO_DLSYM(handle, (*ceto::mad((*ceto::mad(definition)).impl_function_name)).c_str());
+        const auto fptr = CETO_DLSYM((*ceto::mad((*ceto::mad(cache)).handles)).at((*ceto::mad(definition)).dll_path), (*ceto::mad((*ceto::mad(definition)).impl_function_name)).c_str());
         if (!fptr) {
             throw std::runtime_error((("Failed to find symbol " + (*ceto::mad(definition)).impl_function_name) + " in dll ") + (*ceto::mad(definition)).dll_path);
         }
+        const auto f = reinterpret_cast<void *>(fptr);
+        ceto::bounds_check((*ceto::mad(cache)).functions, key) = f;
+        return f;
+    }
+
+    inline auto close_macro_libraries() -> void {
+        auto && cache { macro_library_cache() } ;
+        (*ceto::mad((*ceto::mad(cache)).functions)).clear();
+        for(  const auto& [dll_path, handle] : (*ceto::mad(cache)).handles) {
+            CETO_DLCLOSE(handle);
+        }
+        (*ceto::mad((*ceto::mad(cache)).handles)).clear();
+    }
+
+    inline auto call_compiled_macro_impl(const std::shared_ptr<const MacroDefinition>&  definition,  const std::map<std::string,std::shared_ptr<const Node>> &  match) -> std::variant<std::shared_ptr<const Node>,ceto::macros::Skip> {
+        if ((*ceto::mad(definition)).dll_ready_callback) {
+            (*ceto::mad(definition)).dll_ready_callback();
+        }
+        const auto fptr = macro_impl_function(definition);
         const auto f = reinterpret_cast<decltype(+[]( const std::map<std::string,std::shared_ptr<const Node>> &  m) -> std::shared_ptr<const Node> {
                 if constexpr (!std::is_void_v<decltype(nullptr)>&& !std::is_void_v<std::shared_ptr<const Node>>) { return nullptr; } else { static_cast<void>(nullptr); };
                 })>(fptr);
         return (*f)(match);
     }
 
+    inline auto call_macro_impl(const std::shared_ptr<const MacroDefinition>&  definition,  const std::map<std::string,std::shared_ptr<const Node>> &  match) -> std::variant<std::shared_ptr<const Node>,ceto::macros::Skip> {
+        if ((*ceto::mad(definition)).interpreted_impl) {
+            return (*ceto::mad(definition)).interpreted_impl(match);
+        }
+        return call_compiled_macro_impl(definition, match);
+    }
+
 struct MacroDefinitionVisitor : public BaseVisitor<MacroDefinitionVisitor> {
 
     std::function<void(std::shared_ptr<const MacroDefinition>, const std::unordered_map<std::shared_ptr<const Node>,std::shared_ptr<const Node>> &)> on_visit_definition;
@@ -273,30 +387,33 @@ struct MacroDefinitionVisitor : public BaseVisitor<MacroDefinitionVisitor> {
 
     std::unordered_map<std::shared_ptr<const Node>,std::shared_ptr<const Node>> replacements = {};
 
-    std::map<std::shared_ptr<const Node>,std::vector<std::shared_ptr<const MacroDefinition>>> skipped_definitions = {};
+    std::unordered_map<std::shared_ptr<const Node>,std::vector<std::shared_ptr<const MacroDefinition>>> skipped_definitions = {};
+
+    std::unordered_map<std::shared_ptr<const MacroDefinition>,size_t> skip_counts = {};
+
+    MacroDispatchStats dispatch_stats = {};
+
+    std::unordered_set<std::shared_ptr<const Node>> changed = {};
+
+    std::unordered_map<std::shared_ptr<const Node>,std::shared_ptr<const Node>> rebuilt = {};
 
         inline auto expand(const std::shared_ptr<const Node>&  node) -> auto {
             auto const * scope { (&(this -> current_scope)) -> get() } ;
-            while (scope) {                for(const auto& definition : [&]() -> decltype(auto) {
-                        static_assert(!(std :: is_reference_v<decltype((ceto::util::reversed(scope -> macro_definitions)))>));
-                        return ceto::util::reversed(scope -> macro_definitions);
-                        }()) {
-                    auto skip_definition { false } ;
-                    auto && skipped_definitions { (this -> skipped_definitions) } ;
-                    for(  const auto& [key, defns] : skipped_definitions) {
-                        if (ceto::util::contains(defns, definition)) {
-                            skip_definition = true;
-                            break;
-                        }
-                    }
-                    if (skip_definition) {
+            while (scope) {                const auto candidates = scope -> candidate_definitions(node);
+                (*ceto::mad(this -> dispatch_stats)).skipped += ((*ceto::mad(scope -> macro_definitions)).size() - (*ceto::mad(candidates)).size());
+                for(const auto& definition : candidates) {
+                    if ((*ceto::mad(this -> skip_counts)).contains(definition)) {
                         continue;
                     }
                     const auto match = macro_matches(node, (*ceto::mad(definition)).pattern_node, (*ceto::mad(definition)).parameters);
-                    if (match) {
+                    if (!match) {
+                        (*ceto::mad(this -> dispatch_stats)).misses += 1;
+                    } else {
+                        (*ceto::mad(this -> dispatch_stats)).hits += 1;
                         const auto result_variant = call_macro_impl(definition, (*ceto::mad_smartptr(match)).value());
                         if (std::holds_alternative<ceto::macros::Skip>(result_variant)) {
                             (*ceto::mad(ceto::bounds_check(this -> skipped_definitions, node))).push_back(definition);
+                            ceto::bounds_check(this -> skip_counts, definition) += 1;
                         } else {
                             const auto replacement = std::get<std::shared_ptr<const Node>>(result_variant);
                             if (replacement && (replacement != node)) {
@@ -312,10 +429,75 @@ struct MacroDefinitionVisitor : public BaseVisitor<MacroDefinitionVisitor> {
             return false;
         }
 
+        inline auto expanded(const std::shared_ptr<const Node>&  node) -> std::shared_ptr<const Node> {
+            const auto found = (*ceto::mad(this -> replacements)).find(node);
+            if (found != (*ceto::mad(this -> replacements)).end()) {
+                return this -> expanded(found -> second);
+            }
+            if (!(*ceto::mad(this -> changed)).contains(node)) {
+                return node;
+            }
+            const auto r = (*ceto::mad(this -> rebuilt)).find(node);
+            if (r != (*ceto::mad(this -> rebuilt)).end()) {
+                return (r -> second);
+            }
+            auto c { (*ceto::mad(node)).clone() } ;
+            if ((*ceto::mad(node)).func) {
+                (*ceto::mad(c)).func = this -> expanded((*ceto::mad(node)).func);
+            }
+            auto && node_args { (*ceto::mad(node)).args } ;
+            std::vector<std::shared_ptr<const Node>> args = std::vector<std::shared_ptr<const Node>>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::shared_ptr<const Node>>{}), std::remove_cvref_t<decltype(args)>>);
+            (*ceto::mad(args)).reserve((*ceto::mad(node_args)).size());
+            for(const auto& a : node_args) {
+                (args).push_back(this -> expanded(a));
+            }
+            (*ceto::mad(c)).args = args;
+            ceto::bounds_check(this -> rebuilt, node) = c;
+            return c;
+        }
+
+        inline auto reoffer(const std::shared_ptr<const Node>&  node) -> bool {
+            auto changed { ((*ceto::mad(node)).func && ((*ceto::mad(this -> replacements)).contains((*ceto::mad(node)).func) || (*ceto::mad(this -> changed)).contains((*ceto::mad(node)).func))) } ;
+            auto && args { (*ceto::mad(node)).args } ;
+            for(const auto& a : args) {
+                if (changed) {
+                    break;
+                }
+                changed = ((*ceto::mad(this -> replacements)).contains(a) || (*ceto::mad(this -> changed)).contains(a));
+            }
+            if (!changed) {
+                return false;
+            }
+            (*ceto::mad(this -> changed)).insert(node);
+            auto candidates { ((*ceto::mad(node)).func && (*ceto::mad(this -> replacements)).contains((*ceto::mad(node)).func)) } ;
+            auto const * scope { (&(this -> current_scope)) -> get() } ;
+            while (scope && !candidates) {                candidates = !(*ceto::mad(scope -> candidate_definitions(node))).empty();
+                scope = (scope -> parent);
+            }
+            if (!candidates) {
+                return false;
+            }
+            const auto e = this -> expanded(node);
+            const auto replaced = this -> expand(e);
+            this -> _cleanup_skipped(e);
+            if (replaced) {
+                ceto::bounds_check(this -> replacements, node) = e;
+            }
+            return replaced;
+        }
+
         inline auto _cleanup_skipped(const std::shared_ptr<const Node>&  node) -> void {
             const auto it = (*ceto::mad(this -> skipped_definitions)).find(node);
             if (it != (*ceto::mad(this -> skipped_definitions)).end()) {
-                (*ceto::mad(it -> second)).clear();
+                auto && defns { (it -> second) } ;
+                for(const auto& definition : defns) {
+                    const auto count = (*ceto::mad(this -> skip_counts)).find(definition);
+                    (count -> second) -= 1;
+                    if ((count -> second) == 0) {
+                        (*ceto::mad(this -> skip_counts)).erase(count);
+                    }
+                }
+                (*ceto::mad(this -> skipped_definitions)).erase(it);
             }
         }
 
@@ -331,6 +513,7 @@ struct MacroDefinitionVisitor : public BaseVisitor<MacroDefinitionVisitor> {
             for(const auto& arg : args) {
                 (*ceto::mad(arg)).accept((*this));
             }
+            this -> reoffer(node);
             this -> _cleanup_skipped(node);
         }
 
@@ -344,7 +527,7 @@ struct MacroDefinitionVisitor : public BaseVisitor<MacroDefinitionVisitor> {
             for(const auto& arg : args) {
                 (*ceto::mad(arg)).accept((*this));
             }
-            if ((*ceto::mad((*ceto::mad(node)).func)).name() != "defmacro") {
+            if (this -> reoffer(node) || ((*ceto::mad((*ceto::mad(node)).func)).name() != "defmacro")) {
                 return;
             }
             if ((*ceto::mad((*ceto::mad(node)).args)).size() < 2) {
@@ -403,6 +586,7 @@ struct MacroDefinitionVisitor : public BaseVisitor<MacroDefinitionVisitor> {
             for(const auto& arg : (*ceto::mad(node)).args) {
                 (*ceto::mad(arg)).accept((*this));
             }
+            this -> reoffer(node);
             (this -> current_scope) = std::move(outer);
             this -> _cleanup_skipped(node);
         }
@@ -413,9 +597,11 @@ struct MacroDefinitionVisitor : public BaseVisitor<MacroDefinitionVisitor> {
 
 };
 
-    inline auto expand_macros(const std::shared_ptr<const Module>&  node, const std::function<void(std::shared_ptr<const MacroDefinition>, const std::unordered_map<std::shared_ptr<const Node>,std::shared_ptr<const Node>> &)>  on_visit) -> std::unordered_map<std::shared_ptr<const Node>,std::shared_ptr<const Node>> {
+    inline auto expand_macros(const std::shared_ptr<const Module>&  node, const std::function<void(std::shared_ptr<const MacroDefinition>, const std::unordered_map<std::shared_ptr<const Node>,std::shared_ptr<const Node>> &)>  on_visit,  MacroDispatchStats &  dispatch_stats) -> std::unordered_map<std::shared_ptr<const Node>,std::shared_ptr<const Node>> {
         auto visitor { MacroDefinitionVisitor{on_visit} } ;
+        (*ceto::mad(visitor)).dispatch_stats = dispatch_stats;
         (*ceto::mad(node)).accept(visitor);
+        dispatch_stats = (*ceto::mad(visitor)).dispatch_stats;
         return (*ceto::mad(visitor)).replacements;
     }
 
@@ -14,7 +14,6 @@
 
 
 #include "ceto.h"
-//#include "ceto_private_boundscheck.donotedit.autogenerated.h"
 
 #include "ceto_private_listcomp.donotedit.autogenerated.h"
 ;
@@ -28,6 +27,10 @@
 ;
 #include <iostream>
 ;
+#include <string_view>
+;
+#include <unordered_map>
+;
 #include "ast.donotedit.autogenerated.h"
 ;
 // unsafe;
@@ -44,3 +47,800 @@
         (*ceto::mad(parser)).parse(str);
     }
 
+struct ParseMemo : public ceto::object {
+
+    std::shared_ptr<const Node> node;
+
+    size_t end;
+
+    explicit ParseMemo(std::shared_ptr<const Node> node, size_t end) : node(std::move(node)), end(end) {}
+
+    ParseMemo() = delete;
+
+};
+
+struct InfixLevel : public ceto::object {
+
+    std::string_view ops;
+
+    int arity;
+
+    bool right_associative;
+
+    explicit InfixLevel(std::string_view ops, int arity, bool right_associative) : ops(ops), arity(arity), right_associative(right_associative) {}
+
+    InfixLevel() = delete;
+
+};
+
+    inline auto infix_level(const int  level) -> InfixLevel {
+        if (level == 1) {
+            return InfixLevel{"&&", 2, false};
+        } else if ((level == 2)) {
+            return InfixLevel{"not * &", 1, true};
+        } else if ((level == 3)) {
+            return InfixLevel{"+ -", 1, true};
+        } else if ((level == 4)) {
+            return InfixLevel{"* / %", 2, false};
+        } else if ((level == 5)) {
+            return InfixLevel{"+ -", 2, false};
+        } else if ((level == 6)) {
+            return InfixLevel{"<< >>", 2, false};
+        } else if ((level == 7)) {
+            return InfixLevel{"<=>", 2, false};
+        } else if ((level == 8)) {
+            return InfixLevel{"== <= >= < > !=", 2, false};
+        } else if ((level == 9)) {
+            return InfixLevel{"&", 2, false};
+        } else if ((level == 10)) {
+            return InfixLevel{"^", 2, false};
+        } else if ((level == 11)) {
+            return InfixLevel{"|", 2, false};
+        } else if ((level == 12)) {
+            return InfixLevel{"and", 2, false};
+        } else if ((level == 13)) {
+            return InfixLevel{"or", 2, false};
+        } else if ((level == 14)) {
+            return InfixLevel{":", 2, true};
+        } else if ((level == 15)) {
+            return InfixLevel{"in", 2, false};
+        } else if ((level == 16)) {
+            return InfixLevel{"= += -= *= /= %= <<= >>= &= |= ^=", 2, true};
+        } else if ((level == 17)) {
+            return InfixLevel{"return yield", 1, true};
+        }
+        return InfixLevel{"...", 1, false};
+    }
+
+constexpr const int NUM_INFIX_LEVELS { 18 } ; static_assert(std::is_convertible_v<decltype(18), decltype(NUM_INFIX_LEVELS)>);
+constexpr const char TAB_CHAR { 9 } ; static_assert(std::is_convertible_v<decltype(9), decltype(TAB_CHAR)>);
+constexpr const char NEWLINE_CHAR { 10 } ; static_assert(std::is_convertible_v<decltype(10), decltype(NEWLINE_CHAR)>);
+constexpr const char FORMFEED_CHAR { 12 } ; static_assert(std::is_convertible_v<decltype(12), decltype(FORMFEED_CHAR)>);
+constexpr const char CARRIAGE_RETURN_CHAR { 13 } ; static_assert(std::is_convertible_v<decltype(13), decltype(CARRIAGE_RETURN_CHAR)>);
+constexpr const char SINGLE_QUOTE_CHAR { 39 } ; static_assert(std::is_convertible_v<decltype(39), decltype(SINGLE_QUOTE_CHAR)>);
+constexpr const char BACKSLASH_CHAR { 92 } ; static_assert(std::is_convertible_v<decltype(92), decltype(BACKSLASH_CHAR)>);
+constexpr const char TEMPLATE_DISAMBIGUATION_CHAR { 6 } ; static_assert(std::is_convertible_v<decltype(6), decltype(TEMPLATE_DISAMBIGUATION_CHAR)>);
+constexpr const char BLOCK_START_CHAR { 7 } ; static_assert(std::is_convertible_v<decltype(7), decltype(BLOCK_START_CHAR)>);
+    inline auto is_identifier_start(const char  c) -> bool {
+        return ((((c >= 'a') && (c <= 'z')) || ((c >= 'A') && (c <= 'Z'))) || (c == '_'));
+    }
+
+    inline auto is_identifier_char(const char  c) -> bool {
+        return (is_identifier_start(c) || ((c >= '0') && (c <= '9')));
+    }
+
+    inline auto is_keyword_char(const char  c) -> bool {
+        return (is_identifier_char(c) || (c == '$'));
+    }
+
+    inline auto is_whitespace(const char  c) -> bool {
+        return ((((c == ' ') || (c == TAB_CHAR)) || (c == NEWLINE_CHAR)) || (c == CARRIAGE_RETURN_CHAR));
+    }
+
+    inline auto make_scope_resolution_op(const std::string&  op, const std::shared_ptr<const Node>&  lhs, const std::shared_ptr<const Node>&  rhs, const SourceLoc&  source) -> std::shared_ptr<const Node> {
+        if (op == ".") {
+            return std::make_shared<const AttributeAccess>(op, std::vector {{lhs, rhs}}, source);
+        } else if ((op == "->")) {
+            return std::make_shared<const ArrowOp>(op, std::vector {{lhs, rhs}}, source);
+        }
+        return std::make_shared<const ScopeResolution>(op, std::vector {{lhs, rhs}}, source);
+    }
+
+    inline auto make_left_associative_bin_op(const std::string&  op, const std::shared_ptr<const Node>&  lhs, const std::shared_ptr<const Node>&  rhs, const SourceLoc&  source) -> std::shared_ptr<const Node> {
+        if (((op == ".") || (op == "->")) || (op == "::")) {
+            return make_scope_resolution_op(op, lhs, rhs, source);
+        } else if ((op == "|")) {
+            return std::make_shared<const BitwiseOrOp>(op, std::vector {{lhs, rhs}}, source);
+        } else if ((op == "==")) {
+            return std::make_shared<const EqualsCompareOp>(op, std::vector {{lhs, rhs}}, source);
+        }
+        return std::make_shared<const BinOp>(op, std::vector {{lhs, rhs}}, source);
+    }
+
+    inline auto make_right_associative_bin_op(const std::string&  op, const std::shared_ptr<const Node>&  lhs, const std::shared_ptr<const Node>&  rhs, const SourceLoc&  source) -> std::shared_ptr<const Node> {
+        if (op == ":") {
+            return std::make_shared<const TypeOp>(op, std::vector {{lhs, rhs}}, source);
+        } else if ((op == "=")) {
+            return std::make_shared<const Assign>(op, std::vector {{lhs, rhs}}, source);
+        }
+        return std::make_shared<const BinOp>(op, std::vector {{lhs, rhs}}, source);
+    }
+
+    inline auto unescape_string_literal(const std::string&  quoted) -> std::string {
+        auto s { quoted } ;
+        if ((*ceto::mad(s)).find(BACKSLASH_CHAR) != std::string::npos) {
+            s = ceto::util::string_replace(s, "\\t", std::string(1, TAB_CHAR));
+            s = ceto::util::string_replace(s, "\\n", std::string(1, NEWLINE_CHAR));
+            s = ceto::util::string_replace(s, "\\f", std::string(1, FORMFEED_CHAR));
+            s = ceto::util::string_replace(s, "\\r", std::string(1, CARRIAGE_RETURN_CHAR));
+            auto unescaped { std::string() } ;
+            size_t i { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(i)>);
+            while (i < (*ceto::mad(s)).size()) {                if (((ceto::bounds_check(s, i) == BACKSLASH_CHAR) && ((i + 1) < (*ceto::mad(s)).size())) && (ceto::bounds_check(s, i + 1) != NEWLINE_CHAR)) {
+                    i += 1;
+                }
+                unescaped += ceto::bounds_check(s, i);
+                i += 1;
+            }
+            s = unescaped;
+        }
+        const auto escaped_backslash = (std::string {"CETO_PRIVATE_ESCAPED_"} + "ESCAPED");
+        return ceto::util::string_replace(s, escaped_backslash, "\\");
+    }
+
+struct NativeParser : public ceto::object {
+
+    std::string text;
+
+    std::shared_ptr<const Source> source;
+
+    size_t pos { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(pos)>);
+
+    std::vector<int> char_offsets = std::vector<int>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<int>{}), std::remove_cvref_t<decltype(char_offsets)>>);
+
+    std::unordered_map<size_t,ParseMemo> infix_memo = {};
+
+    std::unordered_map<size_t,ParseMemo> scope_resolution_memo = {};
+
+    decltype(false) error = false;
+
+        inline auto loc(const size_t  p) const -> SourceLoc {
+            if ((*ceto::mad(this -> char_offsets)).empty()) {
+                return SourceLoc{this -> source, static_cast<int>(p)};
+            }
+            return SourceLoc{this -> source, ceto::bounds_check(this -> char_offsets, p)};
+        }
+
+        inline auto skip_whitespace() -> void {
+            while (((this -> pos) < (*ceto::mad(this -> text)).size()) && is_whitespace(ceto::bounds_check(this -> text, this -> pos))) {                (this -> pos) += 1;
+            }
+        }
+
+        inline auto at(const size_t  p, const std::string_view  s) const -> bool {
+            return ((*ceto::mad(this -> text)).compare(p, (*ceto::mad(s)).size(), s) == 0);
+        }
+
+        inline auto keyword_at(const size_t  p, const std::string_view  k) const -> bool {
+            const auto end = (p + (*ceto::mad(k)).size());
+            return ((this -> at(p, k) && ((end >= (*ceto::mad(this -> text)).size()) || !is_keyword_char(ceto::bounds_check(this -> text, end)))) && ((p == 0) || !is_keyword_char(ceto::bounds_check(this -> text, p - 1))));
+        }
+
+        inline auto literal(const std::string_view  s) -> bool {
+            const auto start = (this -> pos);
+            this -> skip_whitespace();
+            if (this -> at(this -> pos, s)) {
+                (this -> pos) += (*ceto::mad(s)).size();
+                return true;
+            }
+            (this -> pos) = start;
+            return false;
+        }
+
+        inline auto match_op(const std::string_view  ops) -> std::string_view {
+            const auto start = (this -> pos);
+            this -> skip_whitespace();
+            auto remaining { ops } ;
+            while (!(*ceto::mad(remaining)).empty()) {                const auto space = (*ceto::mad(remaining)).find(' ');
+                const auto op = (*ceto::mad(remaining)).substr(0, space);
+                auto matched { false } ;
+                if (is_identifier_start(ceto::bounds_check(op, 0))) {
+                    matched = this -> keyword_at(this -> pos, op);
+                } else {
+                    matched = this -> at(this -> pos, op);
+                }
+                if (matched) {
+                    (this -> pos) += (*ceto::mad(op)).size();
+                    return op;
+                }
+                if (space == std::string_view::npos) {
+                    break;
+                }
+                remaining = (*ceto::mad(remaining)).substr(space + 1);
+            }
+            (this -> pos) = start;
+            return std::string_view();
+        }
+
+        inline auto is_reserved_word(const size_t  p) const -> bool {
+            return (((this -> keyword_at(p, "not") || this -> keyword_at(p, "and")) || this -> keyword_at(p, "or")) || this -> keyword_at(p, "in"));
+        }
+
+        inline auto identifier(const bool  skip_whitespace) -> std::shared_ptr<const Node> {
+            const auto start = (this -> pos);
+            if (skip_whitespace) {
+                this -> skip_whitespace();
+            }
+            const auto p = (this -> pos);
+            if (((p >= (*ceto::mad(this -> text)).size()) || !is_identifier_start(ceto::bounds_check(this -> text, p))) || this -> is_reserved_word(p)) {
+                (this -> pos) = start;
+                return nullptr;
+            }
+            auto end { (p + 1) } ;
+            while ((end < (*ceto::mad(this -> text)).size()) && is_identifier_char(ceto::bounds_check(this -> text, end))) {                end += 1;
+            }
+            (this -> pos) = end;
+            return std::make_shared<const Identifier>((*ceto::mad(this -> text)).substr(p, end - p), this -> loc(p));
+        }
+
+        inline auto affix() -> std::shared_ptr<const Identifier> {
+            return std::dynamic_pointer_cast<const Identifier>(this -> identifier(false));
+        }
+
+        inline auto digits() -> bool {
+            const auto start = (this -> pos);
+            while ((((this -> pos) < (*ceto::mad(this -> text)).size()) && (ceto::bounds_check(this -> text, this -> pos) >= '0')) && (ceto::bounds_check(this -> text, this -> pos) <= '9')) {                (this -> pos) += 1;
+            }
+            return ((this -> pos) > start);
+        }
+
+        inline auto float_literal() -> std::shared_ptr<const Node> {
+            const auto start = (this -> pos);
+            this -> skip_whitespace();
+            const auto p = (this -> pos);
+            if (!this -> digits() || !this -> literal_here(".")) {
+                (this -> pos) = start;
+                return nullptr;
+            }
+            this -> digits();
+            const auto float_string = (*ceto::mad(this -> text)).substr(p, (this -> pos) - p);
+            return std::make_shared<const FloatLiteral>(float_string, this -> affix(), this -> loc(p));
+        }
+
+        inline auto integer_literal() -> std::shared_ptr<const Node> {
+            const auto start = (this -> pos);
+            this -> skip_whitespace();
+            const auto p = (this -> pos);
+            if (!this -> digits()) {
+                (this -> pos) = start;
+                return nullptr;
+            }
+            const auto integer_string = (*ceto::mad(this -> text)).substr(p, (this -> pos) - p);
+            return std::make_shared<const IntegerLiteral>(integer_string, this -> affix(), this -> loc(p));
+        }
+
+        inline auto char_literal(const char  c) -> bool {
+            const auto start = (this -> pos);
+            this -> skip_whitespace();
+            if (((this -> pos) < (*ceto::mad(this -> text)).size()) && (ceto::bounds_check(this -> text, this -> pos) == c)) {
+                (this -> pos) += 1;
+                return true;
+            }
+            (this -> pos) = start;
+            return false;
+        }
+
+        inline auto literal_here(const std::string_view  s) -> bool {
+            if (this -> at(this -> pos, s)) {
+                (this -> pos) += (*ceto::mad(s)).size();
+                return true;
+            }
+            return false;
+        }
+
+        inline auto string_literal(const char  quote) -> std::shared_ptr<const Node> {
+            const auto start = (this -> pos);
+            this -> skip_whitespace();
+            const auto p = (this -> pos);
+            const auto prefix = this -> affix();
+            if (((this -> pos) >= (*ceto::mad(this -> text)).size()) || (ceto::bounds_check(this -> text, this -> pos) != quote)) {
+                (this -> pos) = start;
+                return nullptr;
+            }
+            const auto body_start = ((this -> pos) + 1);
+            auto i { body_start } ;
+            while ((i < (*ceto::mad(this -> text)).size()) && (ceto::bounds_check(this -> text, i) != quote)) {                if (ceto::bounds_check(this -> text, i) == BACKSLASH_CHAR) {
+                    if ((i + 1) >= (*ceto::mad(this -> text)).size()) {
+                        break;
+                    }
+                    i += 1;
+                }
+                i += 1;
+            }
+            if ((i >= (*ceto::mad(this -> text)).size()) || (ceto::bounds_check(this -> text, i) != quote)) {
+                (this -> pos) = start;
+                return nullptr;
+            }
+            (this -> pos) = (i + 1);
+            const auto str = unescape_string_literal((*ceto::mad(this -> text)).substr(body_start, i - body_start));
+            const auto suffix = this -> affix();
+            return std::make_shared<const StringLiteral>(str, prefix, suffix, this -> loc(p));
+        }
+
+        inline auto infix_list(const bool  allow_trailing_comma) -> std::vector<std::shared_ptr<const Node>> {
+            std::vector<std::shared_ptr<const Node>> args = std::vector<std::shared_ptr<const Node>>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::shared_ptr<const Node>>{}), std::remove_cvref_t<decltype(args)>>);
+            const auto first = this -> infix();
+            if (!first) {
+                return args;
+            }
+            (args).push_back(first);
+            while (true) {                const auto save = (this -> pos);
+                if (!this -> literal(",")) {
+                    break;
+                }
+                const auto arg = this -> infix();
+                if (!arg) {
+                    (this -> pos) = save;
+                    break;
+                }
+                (args).push_back(arg);
+            }
+            if (allow_trailing_comma) {
+                this -> literal(",");
+            }
+            return args;
+        }
+
+        inline auto list_like(const std::string_view  open, const std::string_view  close, const bool  allow_trailing_comma) -> std::optional<std::pair<std::vector<std::shared_ptr<const Node>>,size_t>> {
+            const auto start = (this -> pos);
+            this -> skip_whitespace();
+            const auto p = (this -> pos);
+            if (!this -> literal(open)) {
+                (this -> pos) = start;
+                return std::nullopt;
+            }
+            const auto args = this -> infix_list(allow_trailing_comma);
+            if (!this -> literal(close)) {
+                (this -> pos) = start;
+                return std::nullopt;
+            }
+            return std::make_pair(args, p);
+        }
+
+        inline auto list_literal() -> std::shared_ptr<const Node> {
+            const auto parsed = this -> list_like("[", "]", true);
+            if (!parsed) {
+                return nullptr;
+            }
+            return std::make_shared<const ListLiteral>(parsed -> first, this -> loc(parsed -> second));
+        }
+
+        inline auto braced_literal() -> std::shared_ptr<const Node> {
+            const auto parsed = this -> list_like("{", "}", false);
+            if (!parsed) {
+                return nullptr;
+            }
+            return std::make_shared<const BracedLiteral>(parsed -> first, this -> loc(parsed -> second));
+        }
+
+        inline auto tuple_literal() -> std::shared_ptr<const Node> {
+            const auto start = (this -> pos);
+            this -> skip_whitespace();
+            const auto p = (this -> pos);
+            if (this -> literal("(")) {
+                const auto first = this -> infix();
+                if (first && this -> literal(",")) {
+                    auto args { this -> infix_list(true) } ;
+                    if (this -> literal(")")) {
+                        (*ceto::mad(args)).insert((*ceto::mad(args)).begin(), first);
+                        return std::make_shared<const TupleLiteral>(args, this -> loc(p));
+                    }
+                }
+            }
+            (this -> pos) = p;
+            if (this -> literal("(")) {
+                const auto first = this -> infix();
+                if (this -> literal(",") && this -> literal(")")) {
+                    std::vector<std::shared_ptr<const Node>> args = std::vector<std::shared_ptr<const Node>>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::shared_ptr<const Node>>{}), std::remove_cvref_t<decltype(args)>>);
+                    if (first) {
+                        (args).push_back(first);
+                    }
+                    return std::make_shared<const TupleLiteral>(args, this -> loc(p));
+                }
+            }
+            (this -> pos) = p;
+            if (this -> literal("(") && this -> literal(")")) {
+                return std::make_shared<const TupleLiteral>(std::vector<std::shared_ptr<const Node>>{}, this -> loc(p));
+            }
+            (this -> pos) = start;
+            return nullptr;
+        }
+
+        inline auto parenthesized_infix() -> std::shared_ptr<const Node> {
+            const auto start = (this -> pos);
+            if (!this -> literal("(")) {
+                return nullptr;
+            }
+            const auto expr = this -> infix();
+            if (!expr || !this -> literal(")")) {
+                (this -> pos) = start;
+                return nullptr;
+            }
+            return expr;
+        }
+
+        inline auto template_expression() -> std::shared_ptr<const Node> {
+            const auto start = (this -> pos);
+            this -> skip_whitespace();
+            const auto p = (this -> pos);
+            auto func { this -> identifier(true) } ;
+            if (!func) {
+                func = this -> parenthesized_infix();
+            }
+            if (!func || !this -> literal("<")) {
+                (this -> pos) = start;
+                return nullptr;
+            }
+            const auto args = this -> infix_list(false);
+            if (!this -> literal(">")) {
+                (this -> pos) = start;
+                return nullptr;
+            }
+            this -> char_literal(TEMPLATE_DISAMBIGUATION_CHAR);
+            return std::make_shared<const Template>(func, args, this -> loc(p));
+        }
+
+        inline auto non_numeric_atom() -> std::shared_ptr<const Node> {
+            auto node { this -> string_literal('"') } ;
+            if (!node) {
+                node = this -> string_literal(SINGLE_QUOTE_CHAR);
+            }
+            if (!node) {
+                node = this -> template_expression();
+            }
+            if (!node) {
+                node = this -> identifier(true);
+            }
+            if (!node) {
+                node = this -> list_literal();
+            }
+            if (!node) {
+                node = this -> tuple_literal();
+            }
+            if (!node) {
+                node = this -> braced_literal();
+            }
+            return node;
+        }
+
+        inline auto scope_resolution_operand() -> std::shared_ptr<const Node> {
+            const auto node = this -> non_numeric_atom();
+            if (node) {
+                return node;
+            }
+            return this -> parenthesized_infix();
+        }
+
+        inline auto scope_resolved_operand() -> std::shared_ptr<const Node> {
+            const auto start = (this -> pos);
+            this -> skip_whitespace();
+            const auto source = this -> loc(this -> pos);
+            auto lhs { this -> scope_resolution_operand() } ;
+            while (lhs) {                const auto save = (this -> pos);
+                if (!this -> literal("::")) {
+                    break;
+                }
+                const auto rhs = this -> scope_resolution_operand();
+                if (!rhs) {
+                    (this -> pos) = save;
+                    break;
+                }
+                lhs = make_scope_resolution_op("::", lhs, rhs, source);
+            }
+            if (!lhs) {
+                (this -> pos) = start;
+            }
+            return lhs;
+        }
+
+        inline auto scope_resolution() -> std::shared_ptr<const Node> {
+            const auto found = (*ceto::mad(this -> scope_resolution_memo)).find(this -> pos);
+            if (found != (*ceto::mad(this -> scope_resolution_memo)).end()) {
+                (this -> pos) = (*ceto::mad(found -> second)).end;
+                return (*ceto::mad(found -> second)).node;
+            }
+            const auto start = (this -> pos);
+            this -> skip_whitespace();
+            const auto source = this -> loc(this -> pos);
+            auto lhs { this -> scope_resolved_operand() } ;
+            while (lhs) {                const auto save = (this -> pos);
+                const auto op = this -> match_op(". ->");
+                if ((*ceto::mad(op)).empty()) {
+                    break;
+                }
+                const auto rhs = this -> scope_resolved_operand();
+                if (!rhs) {
+                    (this -> pos) = save;
+                    break;
+                }
+                lhs = make_scope_resolution_op(std::string(op), lhs, rhs, source);
+            }
+            if (!lhs) {
+                (this -> pos) = start;
+            }
+            (*ceto::mad_smartptr(this -> scope_resolution_memo)).emplace(start, ParseMemo{lhs, this -> pos});
+            return lhs;
+        }
+
+        inline auto call_args() -> std::optional<std::vector<std::shared_ptr<const Node>>> {
+            const auto start = (this -> pos);
+            if (!this -> literal("(")) {
+                return std::nullopt;
+            }
+            auto args { this -> non_block_args() } ;
+            while (true) {                const auto block = this -> block();
+                if (!block) {
+                    break;
+                }
+                ceto::append_or_push_back(args, block);
+                const auto more = this -> non_block_args();
+                (*ceto::mad(args)).insert((*ceto::mad(args)).end(), (*ceto::mad(more)).begin(), (*ceto::mad(more)).end());
+            }
+            if (!this -> literal(")")) {
+                (this -> pos) = start;
+                return std::nullopt;
+            }
+            return args;
+        }
+
+        inline auto non_block_args() -> std::vector<std::shared_ptr<const Node>> {
+            std::vector<std::shared_ptr<const Node>> args = std::vector<std::shared_ptr<const Node>>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::shared_ptr<const Node>>{}), std::remove_cvref_t<decltype(args)>>);
+            const auto arg = this -> infix();
+            if (arg) {
+                (args).push_back(arg);
+            }
+            while (this -> literal(",")) {                const auto next = this -> infix();
+                if (next) {
+                    (args).push_back(next);
+                }
+            }
+            return args;
+        }
+
+        inline auto block() -> std::shared_ptr<const Node> {
+            const auto start = (this -> pos);
+            if (!this -> literal(":") || !this -> char_literal(BLOCK_START_CHAR)) {
+                (this -> pos) = start;
+                return nullptr;
+            }
+            this -> skip_whitespace();
+            const auto p = (this -> pos);
+            std::vector<std::shared_ptr<const Node>> statements = std::vector<std::shared_ptr<const Node>>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::shared_ptr<const Node>>{}), std::remove_cvref_t<decltype(statements)>>);
+            while (true) {                const auto save = (this -> pos);
+                const auto statement = this -> infix();
+                if (!statement || !this -> literal(";")) {
+                    (this -> pos) = save;
+                    break;
+                }
+                while (this -> literal(";")) {                    ; // pass
+                }
+                (statements).push_back(statement);
+            }
+            if ((*ceto::mad(statements)).empty()) {
+                (this -> pos) = start;
+                return nullptr;
+            }
+            return std::make_shared<const Block>(statements, this -> loc(p));
+        }
+
+        inline auto call_like(const std::shared_ptr<const Node>&  func, const SourceLoc&  source) -> std::shared_ptr<const Node> {
+            const auto call_args = this -> call_args();
+            if (call_args) {
+                return std::make_shared<const Call>(func, (*ceto::mad_smartptr(call_args)).value(), source);
+            }
+            const auto array_access_args = this -> list_like("[", "]", false);
+            if (array_access_args) {
+                return std::make_shared<const ArrayAccess>(func, array_access_args -> first, source);
+            }
+            const auto braced_args = this -> list_like("{", "}", false);
+            if (braced_args) {
+                return std::make_shared<const BracedCall>(func, braced_args -> first, source);
+            }
+            return nullptr;
+        }
+
+        inline auto maybe_scope_resolved_call_like() -> std::shared_ptr<const Node> {
+            const auto start = (this -> pos);
+            this -> skip_whitespace();
+            const auto source = this -> loc(this -> pos);
+            auto result { this -> scope_resolution() } ;
+            if (!result) {
+                (this -> pos) = start;
+                return nullptr;
+            }
+            auto num_calls { 0 } ;
+            while (true) {                auto call { this -> call_like(result, source) } ;
+                if (!call) {
+                    break;
+                }
+                num_calls += 1;
+                const auto op_save = (this -> pos);
+                const auto op = this -> match_op(". -> ::");
+                if (!(*ceto::mad(op)).empty()) {
+                    const auto rhs = this -> scope_resolution();
+                    if (rhs) {
+                        call = make_scope_resolution_op(std::string(op), call, rhs, source);
+                    } else {
+                        (this -> pos) = op_save;
+                    }
+                }
+                result = call;
+            }
+            if (num_calls == 0) {
+                (this -> pos) = start;
+                return nullptr;
+            }
+            return result;
+        }
+
+        inline auto infix_operand() -> std::shared_ptr<const Node> {
+            auto node { this -> maybe_scope_resolved_call_like() } ;
+            if (!node) {
+                node = this -> scope_resolution();
+            }
+            if (!node) {
+                node = this -> float_literal();
+            }
+            if (!node) {
+                node = this -> integer_literal();
+            }
+            if (!node) {
+                const auto start = (this -> pos);
+                this -> skip_whitespace();
+                const auto p = (this -> pos);
+                if (this -> literal_here("...")) {
+                    node = std::make_shared<const Identifier>(std::string {"..."}, this -> loc(p));
+                } else {
+                    (this -> pos) = start;
+                }
+            }
+            if (!node) {
+                node = this -> parenthesized_infix();
+            }
+            return node;
+        }
+
+        inline auto infix_level_expr(const int  level) -> std::shared_ptr<const Node> {
+            if (level == 0) {
+                return this -> infix_operand();
+            }
+            const auto operators = infix_level(level);
+            const auto start = (this -> pos);
+            if (((*ceto::mad(operators)).arity == 1) && (*ceto::mad(operators)).right_associative) {
+                this -> skip_whitespace();
+                const auto p = (this -> pos);
+                const auto op = this -> match_op((*ceto::mad(operators)).ops);
+                if (!(*ceto::mad(op)).empty()) {
+                    const auto operand = this -> infix_level_expr(level);
+                    if (operand) {
+                        return std::make_shared<const UnOp>(std::string(op), std::vector {operand}, this -> loc(p));
+                    }
+                }
+                (this -> pos) = start;
+                return this -> infix_level_expr(level - 1);
+            }
+            auto lhs { this -> infix_level_expr(level - 1) } ;
+            if (!lhs) {
+                return nullptr;
+            }
+            const auto save_after_lhs = (this -> pos);
+            (this -> pos) = start;
+            this -> skip_whitespace();
+            const auto source = this -> loc(this -> pos);
+            (this -> pos) = save_after_lhs;
+            if ((*ceto::mad(operators)).arity == 1) {
+                const auto op = this -> match_op((*ceto::mad(operators)).ops);
+                if ((*ceto::mad(op)).empty()) {
+                    return lhs;
+                }
+                while (!(*ceto::mad(this -> match_op((*ceto::mad(operators)).ops))).empty()) {                    ; // pass
+                }
+                return std::make_shared<const LeftAssociativeUnOp>(std::string(op), std::vector {lhs}, source);
+            }
+            if ((*ceto::mad(operators)).right_associative) {
+                const auto save = (this -> pos);
+                const auto op = this -> match_op((*ceto::mad(operators)).ops);
+                if (!(*ceto::mad(op)).empty()) {
+                    const auto rhs = this -> infix_level_expr(level);
+                    if (rhs) {
+                        return make_right_associative_bin_op(std::string(op), lhs, rhs, source);
+                    }
+                }
+                (this -> pos) = save;
+                return lhs;
+            }
+            while (true) {                const auto save = (this -> pos);
+                const auto op = this -> match_op((*ceto::mad(operators)).ops);
+                if ((*ceto::mad(op)).empty()) {
+                    break;
+                }
+                const auto rhs = this -> infix_level_expr(level - 1);
+                if (!rhs) {
+                    (this -> pos) = save;
+                    break;
+                }
+                if (level == 1) {
+                    (this -> error) = true;
+                }
+                lhs = make_left_associative_bin_op(std::string(op), lhs, rhs, source);
+            }
+            return lhs;
+        }
+
+        inline auto infix() -> std::shared_ptr<const Node> {
+            const auto found = (*ceto::mad(this -> infix_memo)).find(this -> pos);
+            if (found != (*ceto::mad(this -> infix_memo)).end()) {
+                (this -> pos) = (*ceto::mad(found -> second)).end;
+                return (*ceto::mad(found -> second)).node;
+            }
+            const auto start = (this -> pos);
+            this -> skip_whitespace();
+            const auto p = (this -> pos);
+            const auto expr = this -> infix_level_expr(NUM_INFIX_LEVELS);
+            if (!expr) {
+                (this -> pos) = start;
+                (*ceto::mad_smartptr(this -> infix_memo)).emplace(start, ParseMemo{nullptr, start});
+                return nullptr;
+            }
+            const auto node = std::make_shared<const InfixWrapper_>(std::vector {expr}, this -> loc(p));
+            (*ceto::mad_smartptr(this -> infix_memo)).emplace(start, ParseMemo{node, this -> pos});
+            return node;
+        }
+
+        inline auto module() -> std::shared_ptr<const Node> {
+            this -> skip_whitespace();
+            const auto p = (this -> pos);
+            std::vector<std::shared_ptr<const Node>> statements = std::vector<std::shared_ptr<const Node>>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::shared_ptr<const Node>>{}), std::remove_cvref_t<decltype(statements)>>);
+            while (true) {                const auto save = (this -> pos);
+                const auto statement = this -> infix();
+                if (!statement || !this -> literal(";")) {
+                    (this -> pos) = save;
+                    break;
+                }
+                (statements).push_back(statement);
+            }
+            this -> skip_whitespace();
+            if (((*ceto::mad(statements)).empty() || ((this -> pos) != (*ceto::mad(this -> text)).size())) || (this -> error)) {
+                return nullptr;
+            }
+            return std::make_shared<const Module>(statements, this -> loc(p));
+        }
+
+    explicit NativeParser(const std::string&  text, const std::shared_ptr<const Source>&  source) : text(text), source(source) {
+            auto count { 0 } ;
+            size_t i { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(i)>);
+            while (i < (*ceto::mad(text)).size()) {                if (static_cast<unsigned char>(ceto::bounds_check(text, i)) >= 0x80) {
+                    (*ceto::mad(this -> char_offsets)).resize((*ceto::mad(text)).size() + 1);
+                    break;
+                }
+                i += 1;
+            }
+            if (!(*ceto::mad(this -> char_offsets)).empty()) {
+                i = 0;
+                while (i < (*ceto::mad(text)).size()) {                    ceto::bounds_check(this -> char_offsets, i) = count;
+                    if ((static_cast<unsigned char>(ceto::bounds_check(text, i)) & 0xC0) != 0x80) {
+                        count += 1;
+                    }
+                    i += 1;
+                }
+                ceto::bounds_check(this -> char_offsets, (*ceto::mad(text)).size()) = count;
+            }
+    }
+
+    NativeParser() = delete;
+
+};
+
+    inline auto parse_preprocessed(const std::string&  text, const std::shared_ptr<const Source>&  source) -> std::shared_ptr<const Node> {
+        auto parser { NativeParser{text, source} } ;
+        return (*ceto::mad(parser)).module();
+    }
+
@@ -0,0 +1,359 @@
+#pragma once
+
+#include <string>
+#include <cstdio>
+#include <cstdlib>
+#include <iostream>
+#include <fstream>
+#include <sstream>
+#include <functional>
+#include <cassert>
+#include <compare> // for <=>
+#include <thread>
+#include <optional>
+
+
+#include "ceto.h"
+
+#include "ceto_private_listcomp.donotedit.autogenerated.h"
+;
+#include "ceto_private_boundscheck.donotedit.autogenerated.h"
+;
+#include "ceto_private_convenience.donotedit.autogenerated.h"
+;
+#include "ceto_private_append_to_pushback.donotedit.autogenerated.h"
+;
+#include <string_view>
+;
+#include "parser.donotedit.autogenerated.h"
+;
+// unsafe;
+constexpr const int PREPROCESS_INDENT { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(PREPROCESS_INDENT)>);
+constexpr const int PREPROCESS_OPEN_PAREN { 1 } ; static_assert(std::is_convertible_v<decltype(1), decltype(PREPROCESS_OPEN_PAREN)>);
+constexpr const int PREPROCESS_SQUARE_OPEN { 2 } ; static_assert(std::is_convertible_v<decltype(2), decltype(PREPROCESS_SQUARE_OPEN)>);
+constexpr const int PREPROCESS_CURLY_OPEN { 3 } ; static_assert(std::is_convertible_v<decltype(3), decltype(PREPROCESS_CURLY_OPEN)>);
+constexpr const int PREPROCESS_SINGLE_QUOTE { 4 } ; static_assert(std::is_convertible_v<decltype(4), decltype(PREPROCESS_SINGLE_QUOTE)>);
+constexpr const int PREPROCESS_DOUBLE_QUOTE { 5 } ; static_assert(std::is_convertible_v<decltype(5), decltype(PREPROCESS_DOUBLE_QUOTE)>);
+constexpr const size_t PREPROCESS_TAB_WIDTH { 4 } ; static_assert(std::is_convertible_v<decltype(4), decltype(PREPROCESS_TAB_WIDTH)>);
+constexpr const char DOUBLE_QUOTE_CHAR { 34 } ; static_assert(std::is_convertible_v<decltype(34), decltype(DOUBLE_QUOTE_CHAR)>);
+constexpr const int PENDING_COLON_NONE { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(PENDING_COLON_NONE)>);
+constexpr const int PENDING_COLON_IN_LINE { 1 } ; static_assert(std::is_convertible_v<decltype(1), decltype(PENDING_COLON_IN_LINE)>);
+constexpr const int PENDING_COLON_IN_BLOCK { 2 } ; static_assert(std::is_convertible_v<decltype(2), decltype(PENDING_COLON_IN_BLOCK)>);
+    inline auto is_python_space(const char  c) -> bool {
+        return (((c == ' ') || ((c >= TAB_CHAR) && (c <= CARRIAGE_RETURN_CHAR))) || ((c >= static_cast<char>(28)) && (c <= static_cast<char>(31))));
+    }
+
+    inline auto is_python_blank(const std::string_view  s) -> bool {
+        size_t i { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(i)>);
+        while (i < (*ceto::mad(s)).size()) {            if (!is_python_space(ceto::bounds_check(s, i))) {
+                return false;
+            }
+            i += 1;
+        }
+        return true;
+    }
+
+    inline auto is_non_ascii_space_at(const std::string_view  s, const size_t  i) -> bool {
+        const auto lead = static_cast<unsigned char>(ceto::bounds_check(s, i));
+        if (((lead < 0xC2) || (lead > 0xE3)) || ((i + 1) >= (*ceto::mad(s)).size())) {
+            return false;
+        }
+        const auto second = static_cast<unsigned char>(ceto::bounds_check(s, i + 1));
+        if (lead == 0xC2) {
+            return ((second == 0x85) || (second == 0xA0));
+        }
+        if ((i + 2) >= (*ceto::mad(s)).size()) {
+            return false;
+        }
+        const auto third = static_cast<unsigned char>(ceto::bounds_check(s, i + 2));
+        if (lead == 0xE1) {
+            return ((second == 0x9A) && (third == 0x80));
+        } else if (((lead == 0xE2) && (second == 0x80))) {
+            return ((((third <= 0x8A) || (third == 0xA8)) || (third == 0xA9)) || (third == 0xAF));
+        } else if (((lead == 0xE2) && (second == 0x81))) {
+            return (third == 0x9F);
+        } else if ((lead == 0xE3)) {
+            return ((second == 0x80) && (third == 0x80));
+        }
+        return false;
+    }
+
+    inline auto elif_kludge_keyword_length(const std::string_view  line, const size_t  n) -> size_t {
+        if ((n > 0) && is_keyword_char(ceto::bounds_check(line, n - 1))) {
+            return static_cast<size_t>(0);
+        }
+        const auto rest = (*ceto::mad(line)).substr(n);
+        size_t length { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(length)>);
+        if (((*ceto::mad(rest)).rfind("elif", 0) == 0) || ((*ceto::mad(rest)).rfind("else", 0) == 0)) {
+            length = 4;
+        } else if (((*ceto::mad(rest)).rfind("except", 0) == 0)) {
+            length = 6;
+        }
+        if (((length > 0) && (length < (*ceto::mad(rest)).size())) && is_keyword_char(ceto::bounds_check(rest, length))) {
+            return static_cast<size_t>(0);
+        }
+        return length;
+    }
+
+struct NativePreprocessor : public ceto::object {
+
+    std::vector<int> parsing_stack = std::vector<int>{PREPROCESS_INDENT}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<int>{PREPROCESS_INDENT}), std::remove_cvref_t<decltype(parsing_stack)>>);
+
+    size_t open_angles { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(open_angles)>);
+
+    bool began_indent { false } ; static_assert(std::is_convertible_v<decltype(false), decltype(began_indent)>);
+
+    std::vector<std::string> blocks = std::vector<std::string>{std::string {""}}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::string>{std::string {""}}), std::remove_cvref_t<decltype(blocks)>>);
+
+    bool error { false } ; static_assert(std::is_convertible_v<decltype(false), decltype(error)>);
+
+    int pending_colon = PENDING_COLON_NONE; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(PENDING_COLON_NONE), std::remove_cvref_t<decltype(pending_colon)>>);
+
+    size_t pending_colon_block { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(pending_colon_block)>);
+
+    size_t pending_colon_pos { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(pending_colon_pos)>);
+
+        inline auto resolve_pending_colon( std::string &  line_to_write, const bool  insert) -> void {
+            if (insert && ((this -> pending_colon) == PENDING_COLON_IN_LINE)) {
+                (*ceto::mad(line_to_write)).insert(this -> pending_colon_pos, 1, ':');
+            } else if ((insert && ((this -> pending_colon) == PENDING_COLON_IN_BLOCK))) {
+                (*ceto::mad(ceto::bounds_check(this -> blocks, this -> pending_colon_block))).insert(this -> pending_colon_pos, 1, ':');
+            }
+            (this -> pending_colon) = PENDING_COLON_NONE;
+        }
+
+        inline auto current_indent() const -> size_t {
+            size_t count { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(count)>);
+            for(const auto& state : (this -> parsing_stack)) {
+                if (state == PREPROCESS_INDENT) {
+                    count += 1;
+                }
+            }
+            return ((count - 1) * PREPROCESS_TAB_WIDTH);
+        }
+
+        inline auto append_escaped(const std::string_view  source,  std::string &  out) -> void {
+            const auto escaped_backslash = (std::string {"CETO_PRIVATE_ESCAPED_"} + "ESCAPED");
+            const auto escaped_unicode = (std::string {"CETO_PRIVATE_ESCAPED_"} + "UNICODE");
+            size_t i { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(i)>);
+            while (i < (*ceto::mad(source)).size()) {                const auto c = ceto::bounds_check(source, i);
+                if ((c == BACKSLASH_CHAR) && ((i + 1) < (*ceto::mad(source)).size())) {
+                    const auto following = ceto::bounds_check(source, i + 1);
+                    if (following == BACKSLASH_CHAR) {
+                        out += escaped_backslash;
+                        i += 2;
+                        continue;
+                    } else if (((following == 'U') || (following == 'u'))) {
+                        out += escaped_unicode;
+                        i += 2;
+                        continue;
+                    }
+                }
+                if (is_non_ascii_space_at(source, i)) {
+                    (this -> error) = true;
+                    return;
+                }
+                out += c;
+                i += 1;
+            }
+        }
+
+        inline auto preprocess_line(const std::string_view  raw_line, const size_t  line_number) -> void {
+            auto length { (*ceto::mad(raw_line)).size() } ;
+            while ((length > 0) && is_python_space(ceto::bounds_check(raw_line, length - 1))) {                length -= 1;
+            }
+            if (length == 0) {
+                (*ceto::mad(this -> blocks)).back() += NEWLINE_CHAR;
+                return;
+            }
+            size_t indent { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(indent)>);
+            while (ceto::bounds_check(raw_line, indent) == ' ') {                indent += 1;
+            }
+            const auto line = (*ceto::mad(raw_line)).substr(indent, length - indent);
+            const auto curr = this -> current_indent();
+            if (((*ceto::mad(this -> parsing_stack)).back() == PREPROCESS_INDENT) && (ceto::bounds_check(line, 0) != '#')) {
+                if (indent < curr) {
+                    if ((this -> began_indent) || (((curr - indent) % PREPROCESS_TAB_WIDTH) != 0)) {
+                        (this -> error) = true;
+                        return;
+                    }
+                    auto diff { (curr - indent) } ;
+                    while (diff > 0) {                        if ((*ceto::mad(this -> parsing_stack)).back() != PREPROCESS_INDENT) {
+                            (this -> error) = true;
+                            return;
+                        }
+                        (*ceto::mad(this -> parsing_stack)).pop_back();
+                        diff -= PREPROCESS_TAB_WIDTH;
+                    }
+                } else if ((indent != curr)) {
+                    (this -> error) = true;
+                    return;
+                }
+            }
+            (*ceto::mad(this -> blocks)).back() += NEWLINE_CHAR;
+            (*ceto::mad((*ceto::mad(this -> blocks)).back())).append(indent, ' ');
+            auto line_to_write { std::string() } ;
+            auto colon_eol { false } ;
+            size_t n { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(n)>);
+            while (n < (*ceto::mad(line)).size()) {                const auto c = ceto::bounds_check(line, n);
+                const auto top = (*ceto::mad(this -> parsing_stack)).back();
+                if (((top == PREPROCESS_SINGLE_QUOTE) && (c != SINGLE_QUOTE_CHAR)) || ((top == PREPROCESS_DOUBLE_QUOTE) && (c != DOUBLE_QUOTE_CHAR))) {
+                    line_to_write += c;
+                    n += 1;
+                    continue;
+                }
+                if (c == BLOCK_START_CHAR) {
+                    (this -> error) = true;
+                    return;
+                }
+                if ((((((((this -> pending_colon) != PENDING_COLON_NONE) && (c != ' ')) && (c != TAB_CHAR)) && (c != CARRIAGE_RETURN_CHAR)) && (c != '#')) && (c != SINGLE_QUOTE_CHAR)) && (c != DOUBLE_QUOTE_CHAR)) {
+                    this -> resolve_pending_colon(line_to_write, c != ':');
+                }
+                if (c == '#') {
+                    break;
+                }
+                if (c == 'e') {
+                    const auto keyword_length = elif_kludge_keyword_length(line, n);
+                    if (keyword_length > 0) {
+                        const auto keyword = (*ceto::mad(line)).substr(n, keyword_length);
+                        if (keyword != "except") {
+                            line_to_write += ',';
+                        }
+                        line_to_write += keyword;
+                        if (keyword != "else") {
+                            (this -> pending_colon) = PENDING_COLON_IN_LINE;
+                            (this -> pending_colon_pos) = (*ceto::mad(line_to_write)).size();
+                        }
+                        colon_eol = false;
+                        n += keyword_length;
+                        continue;
+                    }
+                }
+                if (c == ':') {
+                    colon_eol = true;
+                } else if (!is_python_space(c)) {
+                    colon_eol = false;
+                }
+                auto write_template_end { false } ;
+                if (c == '(') {
+                    (*ceto::mad(this -> parsing_stack)).push_back(PREPROCESS_OPEN_PAREN);
+                } else if ((c == '[')) {
+                    (*ceto::mad(this -> parsing_stack)).push_back(PREPROCESS_SQUARE_OPEN);
+                } else if ((c == '{')) {
+                    (*ceto::mad(this -> parsing_stack)).push_back(PREPROCESS_CURLY_OPEN);
+                } else if ((((c == ')') || (c == ']')) || (c == '}'))) {
+                    const auto closed = (*ceto::mad(this -> parsing_stack)).back();
+                    (*ceto::mad(this -> parsing_stack)).pop_back();
+                    if (((((closed == PREPROCESS_OPEN_PAREN) && (c != ')')) || ((closed == PREPROCESS_SQUARE_OPEN) && (c != ']'))) || ((closed == PREPROCESS_CURLY_OPEN) && (c != '}'))) || (closed == PREPROCESS_INDENT)) {
+                        (this -> error) = true;
+                        return;
+                    }
+                } else if (((c == SINGLE_QUOTE_CHAR) || (c == DOUBLE_QUOTE_CHAR))) {
+                    const auto quote = [&]() {if (c == SINGLE_QUOTE_CHAR) {
+                        return PREPROCESS_SINGLE_QUOTE;
+                    } else {
+                        return PREPROCESS_DOUBLE_QUOTE;
+                    }}()
+;
+                    if (top != quote) {
+                        (*ceto::mad(this -> parsing_stack)).push_back(quote);
+                    } else if (!(((n > 0) && (ceto::bounds_check(line, n - 1) == BACKSLASH_CHAR)) && !((n > 1) && (ceto::bounds_check(line, n - 2) == BACKSLASH_CHAR)))) {
+                        (*ceto::mad(this -> parsing_stack)).pop_back();
+                    }
+                } else if ((c == '<')) {
+                    (this -> open_angles) += 1;
+                } else if (((c == '>') && ((this -> open_angles) > 0))) {
+                    (this -> open_angles) -= 1;
+                    auto ambiguous_chars_after_template_close { false } ;
+                    auto lookahead { (n + 1) } ;
+                    while (lookahead < (*ceto::mad(line)).size()) {                        const auto following = ceto::bounds_check(line, lookahead);
+                        if (is_python_space(following)) {
+                            lookahead += 1;
+                            continue;
+                        }
+                        if (following == '#') {
+                            break;
+                        }
+                        if (((following == '(') || (following == '[')) || (following == '{')) {
+                            write_template_end = true;
+                        }
+                        ambiguous_chars_after_template_close = true;
+                        break;
+                    }
+                    if (!ambiguous_chars_after_template_close) {
+                        write_template_end = true;
+                    }
+                }
+                if (write_template_end) {
+                    line_to_write += '>';
+                    line_to_write += TEMPLATE_DISAMBIGUATION_CHAR;
+                } else {
+                    line_to_write += c;
+                }
+                n += 1;
+            }
+            auto block_index { ((*ceto::mad(this -> blocks)).size() - 1) } ;
+            if (((*ceto::mad(this -> parsing_stack)).back() == PREPROCESS_OPEN_PAREN) && colon_eol) {
+                (*ceto::mad(this -> parsing_stack)).push_back(PREPROCESS_INDENT);
+                this -> resolve_pending_colon(line_to_write, true);
+                line_to_write += BLOCK_START_CHAR;
+                (this -> began_indent) = true;
+            } else {
+                (this -> began_indent) = false;
+                if (((*ceto::mad(this -> parsing_stack)).back() == PREPROCESS_INDENT) && !is_python_blank(line_to_write)) {
+                    this -> resolve_pending_colon(line_to_write, true);
+                    line_to_write += ';';
+                    if ((*ceto::mad(this -> parsing_stack)).size() == 1) {
+                        (*ceto::mad(this -> blocks)).push_back(std::string(line_number, NEWLINE_CHAR));
+                        block_index = ((*ceto::mad(this -> blocks)).size() - 2);
+                    }
+                    (this -> open_angles) = 0;
+                }
+            }
+            if ((this -> pending_colon) == PENDING_COLON_IN_LINE) {
+                (this -> pending_colon) = PENDING_COLON_IN_BLOCK;
+                (this -> pending_colon_block) = block_index;
+                (this -> pending_colon_pos) += (*ceto::mad(ceto::bounds_check(this -> blocks, block_index))).size();
+            }
+            ceto::bounds_check(this -> blocks, block_index) += line_to_write;
+        }
+
+        inline auto preprocess(const std::string&  source) -> std::optional<std::pair<std::string,std::vector<std::string>>> {
+            auto escaped { std::string() } ;
+            (*ceto::mad(escaped)).reserve((*ceto::mad(source)).size());
+            size_t start { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(start)>);
+            size_t line_number { 0 } ; static_assert(std::is_convertible_v<decltype(0), decltype(line_number)>);
+            while (start < (*ceto::mad(source)).size()) {                auto end { (*ceto::mad(source)).find(NEWLINE_CHAR, start) } ;
+                if (end == std::string::npos) {
+                    end = (*ceto::mad(source)).size();
+                }
+                const auto line_start = (*ceto::mad(escaped)).size();
+                this -> append_escaped((*ceto::mad(std::string_view(source))).substr(start, end - start), escaped);
+                if (this -> error) {
+                    return std::nullopt;
+                }
+                line_number += 1;
+                this -> preprocess_line((*ceto::mad(std::string_view(escaped))).substr(line_start), line_number);
+                if (this -> error) {
+                    return std::nullopt;
+                }
+                if (end < (*ceto::mad(source)).size()) {
+                    escaped += NEWLINE_CHAR;
+                }
+                start = (end + 1);
+            }
+            if ((*ceto::mad(this -> parsing_stack)).size() != 1) {
+                return std::nullopt;
+            }
+            auto unused { std::string() } ;
+            this -> resolve_pending_colon(unused, true);
+            return std::make_pair(escaped, this -> blocks);
+        }
+
+};
+
+    inline auto preprocess_source(const std::string&  source) -> std::optional<std::pair<std::string,std::vector<std::string>>> {
+        auto preprocessor { NativePreprocessor() } ;
+        return (*ceto::mad(preprocessor)).preprocess(source);
+    }
+
@@ -26,6 +26,8 @@
 ;
 #include <map>
 ;
+#include <unordered_map>
+;
 #include "ast.donotedit.autogenerated.h"
 ;
 #include "utility.donotedit.autogenerated.h"
@@ -172,7 +174,14 @@ using VariableDefinition::VariableDefinition;
         return false;
     }
 
+    inline auto is_numbered_within(const std::shared_ptr<const Node>&  root, const std::shared_ptr<const Node>&  node) -> auto {
+        return ((((*ceto::mad(root)).preorder_index >= 0) && ((*ceto::mad(node)).preorder_index >= (*ceto::mad(root)).preorder_index)) && ((*ceto::mad(node)).preorder_index < (*ceto::mad(root)).subtree_end));
+    }
+
     inline auto comes_before(const std::shared_ptr<const Node>&  root, const std::shared_ptr<const Node>&  before, const std::shared_ptr<const Node>&  after) -> std::optional<bool> {
+        if (is_numbered_within(root, before) && is_numbered_within(root, after)) {
+            return ((*ceto::mad(before)).preorder_index <= (*ceto::mad(after)).preorder_index);
+        }
         if (root == before) {
             return true;
         } else if ((root == after)) {
@@ -198,11 +207,11 @@ struct Scope : public ceto::shared_object, public std::enable_shared_from_this<S
 
     decltype(std::map<std::string,std::vector<std::shared_ptr<const Node>>>()) interfaces = std::map<std::string,std::vector<std::shared_ptr<const Node>>>();
 
-    std::vector<std::shared_ptr<const ClassDefinition>> class_definitions = std::vector<std::shared_ptr<const ClassDefinition>>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::shared_ptr<const ClassDefinition>>{}), std::remove_cvref_t<decltype(class_definitions)>>);
+    std::unordered_map<std::string,std::shared_ptr<const ClassDefinition>> class_definitions = {};
 
-    std::vector<std::shared_ptr<const VariableDefinition>> variable_definitions = std::vector<std::shared_ptr<const VariableDefinition>>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::shared_ptr<const VariableDefinition>>{}), std::remove_cvref_t<decltype(variable_definitions)>>);
+    std::unordered_map<std::string,std::vector<std::shared_ptr<const VariableDefinition>>> variable_definitions = {};
 
-    std::vector<std::shared_ptr<const FunctionDefinition>> function_definitions = std::vector<std::shared_ptr<const FunctionDefinition>>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::shared_ptr<const FunctionDefinition>>{}), std::remove_cvref_t<decltype(function_definitions)>>);
+    std::unordered_map<std::string,std::shared_ptr<const FunctionDefinition>> function_definitions = {};
 
     decltype(0) indent = 0;
 
@@ -223,18 +232,19 @@ struct Scope : public ceto::shared_object, public std::enable_shared_from_this<S
         }
 
         inline auto add_variable_definition(const std::shared_ptr<const Identifier>&  defined_node, const std::shared_ptr<const Node>&  defining_node) -> void {
+            auto && definitions { ceto::bounds_check(this -> variable_definitions, (*ceto::mad_smartptr((*ceto::mad(defined_node)).name())).value()) } ;
             auto parent { (*ceto::mad(defined_node)).parent() } ;
             while (parent) {                if (creates_new_variable_scope(parent)) {
                     const auto name = (*ceto::mad((*ceto::mad(parent)).func)).name();
                     if ((name == "class") || (name == "struct")) {
                         const auto defn = std::make_shared<const FieldDefinition>(defined_node, defining_node);
-                        (*ceto::mad(this -> variable_definitions)).push_back(defn);
+                        (*ceto::mad(definitions)).push_back(defn);
                     } else if ((((name == "def") || (name == "lambda")) || (name == "defmacro"))) {
                         const auto defn = std::make_shared<const ParameterDefinition>(defined_node, defining_node);
-                        (*ceto::mad(this -> variable_definitions)).push_back(defn);
+                        (*ceto::mad(definitions)).push_back(defn);
                     } else {
                         const auto defn = std::make_shared<const LocalVariableDefinition>(defined_node, defining_node);
-                        (*ceto::mad(this -> variable_definitions)).push_back(defn);
+                        (*ceto::mad(definitions)).push_back(defn);
                         std::cerr << "this is no good?\n";
                     }
                     return;
@@ -242,17 +252,17 @@ struct Scope : public ceto::shared_object, public std::enable_shared_from_this<S
                     const auto name = (*ceto::mad((*ceto::mad((*ceto::mad(parent)).parent())).func)).name();
                     if ((name == "class") || (name == "struct")) {
                         const auto defn = std::make_shared<const FieldDefinition>(defined_node, defining_node);
-                        (*ceto::mad(this -> variable_definitions)).push_back(defn);
+                        (*ceto::mad(definitions)).push_back(defn);
                     } else {
                         const auto defn = std::make_shared<const LocalVariableDefinition>(defined_node, defining_node);
-                        (*ceto::mad(this -> variable_definitions)).push_back(defn);
+                        (*ceto::mad(definitions)).push_back(defn);
                     }
                     return;
                 }
                 parent = (*ceto::mad(parent)).parent();
             }
             const auto defn = std::make_shared<const GlobalVariableDefinition>(defined_node, defining_node);
-            (*ceto::mad(this -> variable_definitions)).push_back(defn);
+            (*ceto::mad(definitions)).push_back(defn);
         }
 
         inline auto add_interface_method(const std::string&  interface_name, const std::shared_ptr<const Node>&  interface_method_def_node) -> void {
@@ -260,28 +270,34 @@ struct Scope : public ceto::shared_object, public std::enable_shared_from_this<S
         }
 
         inline auto add_class_definition(const std::shared_ptr<const ClassDefinition>&  class_definition) -> void {
-            (*ceto::mad(this -> class_definitions)).push_back(class_definition);
+            if (const auto name = (*ceto::mad((*ceto::mad(class_definition)).name_node)).name()) {
+                (*ceto::mad_smartptr(this -> class_definitions)).emplace((*ceto::mad_smartptr(name)).value(), class_definition);
+            }
         }
 
         inline auto add_function_definition(const std::shared_ptr<const FunctionDefinition>&  function_definition) -> void {
-            (*ceto::mad(this -> function_definitions)).push_back(function_definition);
+            if (const auto name = (*ceto::mad((*ceto::mad(function_definition)).function_name)).name()) {
+                (*ceto::mad_smartptr(this -> function_definitions)).emplace((*ceto::mad_smartptr(name)).value(), function_definition);
+            }
         }
 
         inline auto lookup_class(const std::shared_ptr<const Node>&  class_node) const -> std::shared_ptr<const ClassDefinition> {
             if (!(std::dynamic_pointer_cast<const Identifier>(class_node) != nullptr)) {
                 return nullptr;
             }
-            auto && class_definitions { (this -> class_definitions) } ;
-            for(const auto& c : class_definitions) {
-                if ((*ceto::mad((*ceto::mad(c)).name_node)).name() == (*ceto::mad(class_node)).name()) {
-                    return c;
-                }
+            return this -> lookup_class_named((*ceto::mad_smartptr((*ceto::mad(class_node)).name())).value());
+        }
+
+        inline auto lookup_class_named(const std::string&  name) const -> std::shared_ptr<const ClassDefinition> {
+            const auto found = (*ceto::mad(this -> class_definitions)).find(name);
+            if (found != (*ceto::mad(this -> class_definitions)).end()) {
+                return (found -> second);
             }
-            if ((*ceto::mad(this -> interfaces)).contains((*ceto::mad_smartptr((*ceto::mad(class_node)).name())).value())) {
+            if ((*ceto::mad(this -> interfaces)).contains(name)) {
                 return std::make_shared<const InterfaceDefinition>();
             }
             if (const auto s = (*ceto::mad(this -> _parent)).lock()) {
-                return (*ceto::mad(s)).lookup_class(class_node);
+                return (*ceto::mad(s)).lookup_class_named(name);
             }
             return nullptr;
         }
@@ -290,14 +306,16 @@ struct Scope : public ceto::shared_object, public std::enable_shared_from_this<S
             if (!(std::dynamic_pointer_cast<const Identifier>(function_name_node) != nullptr)) {
                 return nullptr;
             }
-            auto && function_definitions { (this -> function_definitions) } ;
-            for(const auto& f : function_definitions) {
-                if ((*ceto::mad((*ceto::mad(f)).function_name)).name() == (*ceto::mad(function_name_node)).name()) {
-                    return f;
-                }
+            return this -> lookup_function_named((*ceto::mad_smartptr((*ceto::mad(function_name_node)).name())).value());
+        }
+
+        inline auto lookup_function_named(const std::string&  name) const -> std::shared_ptr<const FunctionDefinition> {
+            const auto found = (*ceto::mad(this -> function_definitions)).find(name);
+            if (found != (*ceto::mad(this -> function_definitions)).end()) {
+                return (found -> second);
             }
             if (const auto s = (*ceto::mad(this -> _parent)).lock()) {
-                return (*ceto::mad(s)).lookup_function(function_name_node);
+                return (*ceto::mad(s)).lookup_function_named(name);
             }
             return nullptr;
         }
@@ -306,33 +324,40 @@ struct Scope : public ceto::shared_object, public std::enable_shared_from_this<S
             if (!(std::dynamic_pointer_cast<const Identifier>(var_node) != nullptr)) {
                 return {};
             }
+            return this -> find_defs_named(var_node, (*ceto::mad_smartptr((*ceto::mad(var_node)).name())).value(), find_all);
+        }
+
+        inline auto find_defs_named(const std::shared_ptr<const Node>&  var_node, const std::string&  name, const bool  find_all) const -> std::vector<std::shared_ptr<const VariableDefinition>> {
             std::vector<std::shared_ptr<const VariableDefinition>> results = std::vector<std::shared_ptr<const VariableDefinition>>{}; static_assert(ceto::is_non_aggregate_init_and_if_convertible_then_non_narrowing_v<decltype(std::vector<std::shared_ptr<const VariableDefinition>>{}), std::remove_cvref_t<decltype(results)>>);
-            auto && variable_definitions { (this -> variable_definitions) } ;
-            for(const auto& d : variable_definitions) {
-                if (((*ceto::mad((*ceto::mad(d)).defined_node)).name() == (*ceto::mad(var_node)).name()) && ((*ceto::mad(d)).defined_node != var_node)) {
-                    auto parent_block { (*ceto::mad((*ceto::mad(d)).defined_node)).parent() } ;
-                    while (true) {                        if ((std::dynamic_pointer_cast<const Module>(parent_block) != nullptr)) {
-                            break;
-                        }
-                        parent_block = (*ceto::mad(parent_block)).parent();
-                    }
-                    const auto defined_before = comes_before(parent_block, (*ceto::mad(d)).defined_node, var_node);
-                    if (defined_before && (*ceto::mad_smartptr(defined_before)).value()) {
-                        if (!find_all) {
-                            return std::vector {d};
+            const auto found = (*ceto::mad(this -> variable_definitions)).find(name);
+            if (found != (*ceto::mad(this -> variable_definitions)).end()) {
+                auto && variable_definitions { (found -> second) } ;
+                for(const auto& d : variable_definitions) {
+                    if ((*ceto::mad(d)).defined_node != var_node) {
+                        auto parent_block { (*ceto::mad((*ceto::mad(d)).defined_node)).parent() } ;
+                        while (true) {                            if ((std::dynamic_pointer_cast<const Module>(parent_block) != nullptr)) {
+                                break;
+                            }
+                            parent_block = (*ceto::mad(parent_block)).parent();
                         }
-                        (results).push_back(d);
-                        if (const auto assign = std::dynamic_pointer_cast<const Assign>((*ceto::mad(d)).defining_node)) {
-                            if (const auto ident = std::dynamic_pointer_cast<const Identifier>((*ceto::mad(assign)).rhs())) {
-                                const auto more = this -> find_defs(ident, find_all);
-                                (*ceto::mad(results)).insert((*ceto::mad(results)).end(), (*ceto::mad(more)).begin(), (*ceto::mad(more)).end());
+                        const auto defined_before = comes_before(parent_block, (*ceto::mad(d)).defined_node, var_node);
+                        if (defined_before && (*ceto::mad_smartptr(defined_before)).value()) {
+                            if (!find_all) {
+                                return std::vector {d};
+                            }
+                            (results).push_back(d);
+                            if (const auto assign = std::dynamic_pointer_cast<const Assign>((*ceto::mad(d)).defining_node)) {
+                                if (const auto ident = std::dynamic_pointer_cast<const Identifier>((*ceto::mad(assign)).rhs())) {
+                                    const auto more = this -> find_defs(ident, find_all);
+                                    (*ceto::mad(results)).insert((*ceto::mad(results)).end(), (*ceto::mad(more)).begin(), (*ceto::mad(more)).end());
+                                }
                             }
                         }
                     }
                 }
             }
             if (const auto s = (*ceto::mad(this -> _parent)).lock()) {
-                const auto more = (*ceto::mad(s)).find_defs(var_node, find_all);
+                const auto more = (*ceto::mad(s)).find_defs_named(var_node, name, find_all);
                 (*ceto::mad(results)).insert((*ceto::mad(results)).end(), (*ceto::mad(more)).begin(), (*ceto::mad(more)).end());
             }
             return results;
@@ -0,0 +1,206 @@
+import sys
+import os
+import re
+import subprocess
+from time import perf_counter
+
+import pytest
+
+
+# Timings are printed rather than asserted on. Run with e.g.
+#   CETO_BENCHMARKS=1 pytest -s tests/test_benchmarks.py
+
+pytestmark = pytest.mark.skipif(not os.environ.get("CETO_BENCHMARKS"), reason="set CETO_BENCHMARKS=1 to run the benchmarks")
+
+
+def _perf_message(output: str, name: str) -> float:
+    match = re.search("^" + re.escape(name) + r" time (\S+)$", output, re.MULTILINE)
+    assert match, name + " time not reported"
+    return float(match.group(1))
+
+
+def _transpile(path, env=None):
+    build_command = [sys.executable, "-m", "ceto", "-m", str(path)]
+    return subprocess.check_output(build_command, env=env).decode("utf8")
+
+
+def test_macro_skip_heavy(tmp_path):
+    # Every definition matches every call site and returns Skip, so each call
+    # is checked against every definition skipped so far in the enclosing
+    # expansions (the skipped_definitions bookkeeping in MacroDefinitionVisitor).
+    num_definitions = 40
+    num_calls = 200
+
+    source = "def (foo, x:\n    return x\n)\n\n"
+    for _ in range(num_definitions):
+        source += "defmacro (foo(x), x:\n    return ceto.macros.Skip()\n)\n\n"
+    source += "def (main:\n"
+    for i in range(num_calls):
+        source += f"    foo(foo(foo({i})))\n"
+    source += ")\n"
+
+    path = tmp_path / "macro_skip_heavy.ctp"
+    path.write_text(source)
+
+    env = dict(os.environ, CETO_MACRO_CACHE_DIR=str(tmp_path / "macro_cache"))
+
+    # first run builds (and caches) the macro dlls
+    _transpile(path, env)
+    output = _transpile(path, env)
+
+    print(f"macro expansion: {num_definitions} skipping definitions, {num_calls * 3} calls:",
+          _perf_message(output, "macro"), "s")
+
+
+def test_deep_include_graph(tmp_path):
+    # Each header includes the two before it (plus the standard library
+    # macro headers injected into every module), so the main module ends up
+    # splicing in every header.
+    num_headers = 150
+
+    for i in range(num_headers):
+        source = ""
+        for j in range(max(0, i - 2), i):
+            source += f"include (header{j})\n"
+        source += f"\ndef (func{i}, x:\n    return x + {i}\n)\n"
+        (tmp_path / f"header{i}.cth").write_text(source)
+
+    path = tmp_path / "deep_include_graph.ctp"
+    path.write_text(f"include (header{num_headers - 1})\n\ndef (main:\n    std.cout << func{num_headers - 1}(1)\n)\n")
+
+    env = dict(os.environ, CETO_MACRO_CACHE_DIR=str(tmp_path / "macro_cache"))
+
+    output = _transpile(path, env)
+    print(f"include expansion: {num_headers} headers (uncached):", _perf_message(output, "parse"), "s")
+
+    output = _transpile(path, env)
+    print(f"include expansion: {num_headers} headers (cached):", _perf_message(output, "parse"), "s")
+
+
+def test_preprocessor_throughput():
+    # The selfhost sources through the python preprocessor (plus the elif
+    # kludges) and the native one. (Each file separately: the blocks are
+    # padded with the newlines before them so the output grows with the
+    # square of the file length.)
+    from ceto.parser import CompilationContext, _preprocess
+
+    selfhost = os.path.join(os.path.dirname(__file__), os.pardir, "selfhost")
+    sources = []
+    for name in sorted(os.listdir(selfhost)):
+        if name.endswith(".cth") or name.endswith(".ctp"):
+            with open(os.path.join(selfhost, name), encoding="utf8") as f:
+                sources.append(f.read())
+    repeats = 5
+    megabytes = repeats * sum(len(s.encode("utf8")) for s in sources) / 1e6
+
+    def throughput(context):
+        results = []
+        start = perf_counter()
+        for _ in range(repeats):
+            results = [_preprocess(s, context) for s in sources]
+        return megabytes / (perf_counter() - start), results
+
+    python, python_results = throughput(CompilationContext(native_parser=False))
+    native, native_results = throughput(CompilationContext())
+
+    assert native_results == python_results
+    print(f"preprocessor ({megabytes:.1f} MB): python {python:.2f} MB/s, native {native:.2f} MB/s")
+
+
+def test_elif_heavy_parse():
+    # The same functions written with elif chains and with separate ifs.
+    # (The elif kludges were a pyparsing scan of every block, now they're part
+    # of preprocessing.)
+    from ceto.parser import CompilationContext, parse_string, _preprocess
+
+    num_functions = 50
+    num_branches = 20
+
+    def source(elif_heavy):
+        text = ""
+        for i in range(num_functions):
+            text += f"def (func{i}, x:\n"
+            for j in range(num_branches):
+                if not elif_heavy:
+                    text += f"    if (x == {j}:\n"
+                elif j == 0:
+                    text += f"    if (x == {j}:\n"
+                else:
+                    text += f"    elif x == {j}:\n"
+                text += f"        return {j}\n"
+                if not elif_heavy:
+                    text += "    )\n"
+            if elif_heavy:
+                text += "    else:\n        return -1\n    )\n"
+            else:
+                text += "    return -1\n"
+            text += ")\n\n"
+        return text
+
+    for elif_heavy in [False, True]:
+        text = source(elif_heavy)
+
+        start = perf_counter()
+        parse_string(text, CompilationContext())
+        parse_time = perf_counter() - start
+
+        start = perf_counter()
+        _preprocess(text, CompilationContext(native_parser=False))
+        preprocess_time = perf_counter() - start
+
+        print(f"{'elif heavy' if elif_heavy else 'without elif'} ({len(text) / 1e3:.0f} KB):",
+              f"parse {parse_time:.3f} s (python preprocessor {preprocess_time:.3f} s)")
+
+
+def test_many_locals_and_classes(monkeypatch, tmp_path):
+    # Thousands of classes and of locals in one function body, then every
+    # identifier looked up through the scopes semantic analysis built
+    # (Scope.find_defs, lookup_class and lookup_function). The classes are
+    # added to the module scope here, as codegen does.
+    from ceto.parser import parse
+    from ceto.semanticanalysis import macro_expansion, semantic_analysis
+    from ceto.abstractsyntaxtree import Identifier
+    from ceto.scope import ClassDefinition
+
+    monkeypatch.setenv("CETO_MACRO_CACHE_DIR", str(tmp_path / "macro_cache"))
+
+    num_classes = 1000
+    num_locals = 2000
+
+    source = ""
+    for i in range(num_classes):
+        source += f"class (Class{i}:\n    value: int\n)\n\n"
+    source += "def (main:\n    x0 = 0\n"
+    for i in range(1, num_locals):
+        source += f"    x{i} = x{i - 1} + Class{i % num_classes}(x{i // 2}).value\n"
+    source += f"    std.cout << x{num_locals - 1}\n)\n"
+
+    module = semantic_analysis(macro_expansion(parse(source)))
+
+    for class_node in module.args[:num_classes]:
+        module.scope.add_class_definition(ClassDefinition(class_node.args[0], class_node, False, False, False))
+
+    identifiers = []
+
+    def walk(node):
+        if isinstance(node, Identifier):
+            identifiers.append(node)
+        for a in node.args:
+            walk(a)
+        if node.func:
+            walk(node.func)
+
+    walk(module)
+
+    start = perf_counter()
+    found_variables = sum(1 for i in identifiers if i.scope.find_defs(i))
+    variables_time = perf_counter() - start
+
+    start = perf_counter()
+    found_classes = sum(1 for i in identifiers if i.scope.lookup_class(i))
+    found_functions = sum(1 for i in identifiers if i.scope.lookup_function(i))
+    classes_time = perf_counter() - start
+
+    assert found_variables >= num_locals and found_classes >= num_classes and found_functions
+    print(f"name lookup: {num_classes} classes, {num_locals} locals, {len(identifiers)} identifiers:",
+          f"find_defs {variables_time:.3f}s, lookup_class/lookup_function {classes_time:.3f}s")
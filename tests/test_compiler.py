@@ -4028,6 +4028,81 @@ def (map, values, fun:
     """)
 
 
+def test_macro_cache_key(tmp_path):
+    from ceto.semanticanalysis import macro_cache_key
+
+    header = tmp_path / "dep.donotedit.autogenerated.h"
+    header.write_text("int x = 0;")
+    code = '#include "dep.donotedit.autogenerated.h"\nint y = 0;'
+
+    key = macro_cache_key(code, "-O2", "c++", [str(tmp_path)])
+    assert key == macro_cache_key(code, "-O2", "c++", [str(tmp_path / "missing"), str(tmp_path)])
+    assert key != macro_cache_key(code, "-O0", "c++", [str(tmp_path)])
+    assert key != macro_cache_key(code + "\n", "-O2", "c++", [str(tmp_path)])
+
+    # a change to an included header must not reuse a stale dll
+    header.write_text("int x = 1;")
+    assert key != macro_cache_key(code, "-O2", "c++", [str(tmp_path)])
+
+
+def test_macro_index(tmp_path, monkeypatch):
+    from ceto.semanticanalysis import _record_macro_index, _lookup_macro_index, _macro_index_path
+
+    monkeypatch.setenv("CETO_MACRO_CACHE_DIR", str(tmp_path))
+    header = tmp_path / "dep.donotedit.autogenerated.h"
+    header.write_text("int x = 0;")
+    code = '#include "dep.donotedit.autogenerated.h"\nint y = 0;'
+
+    assert _lookup_macro_index("source") is None
+    _record_macro_index("source", "key", code, [str(tmp_path)])
+    assert _lookup_macro_index("source") == "key"
+    assert _lookup_macro_index("other source") is None
+
+    # a change to a header included by the generated code must not reuse a stale dll
+    header.write_text("int x = 1;")
+    assert _lookup_macro_index("source") is None
+
+    with open(_macro_index_path("source"), "w") as f:
+        f.write("{")
+    assert _lookup_macro_index("source") is None
+
+
+def test_selfhost_codegen(tmp_path):
+    path = tmp_path / "selfhost_codegen.ctp"
+    path.write_text(r"""
+class (Foo:
+    x: int
+)
+
+def (total, foos: [Foo]:
+    t: mut = 0
+    for (f in foos:
+        t += f.x
+    )
+    return t
+)
+
+def (main:
+    std.cout << total([Foo(1), Foo(2)])
+)
+""")
+    cpp_path = tmp_path / "selfhost_codegen.donotedit.autogenerated.cpp"
+
+    subprocess.check_output([sys.executable, "-m", "ceto", "-m", str(path)])
+    cpp = cpp_path.read_text()
+    assert "ceto::propagate_const<std::shared_ptr<const Foo>>" in cpp
+    assert "ceto::make_shared_propagate_const<const Foo>(1)" in cpp
+    assert "Container size changed during iteration" in cpp
+
+    # the form the selfhost headers are built from (the pybind bindings hold plain shared_ptrs)
+    subprocess.check_output([sys.executable, "-m", "ceto", "-m", "--_selfhost", str(path)])
+    cpp = cpp_path.read_text()
+    assert "propagate_const" not in cpp
+    assert "std::vector<std::shared_ptr<const Foo>>" in cpp
+    assert "std::make_shared<const Foo>(1)" in cpp
+    assert "for(const auto& f : foos) {" in cpp
+
+
 # https://stackoverflow.com/questions/28643534/is-there-a-way-in-python-to-execute-all-functions-in-a-file-without-explicitly-c/28644772#28644772
 # (sometimes want to bypass pytest for various reasons)
 def _run_all_tests(mod):
@@ -0,0 +1,195 @@
+import sys
+import os
+import re
+import subprocess
+import pytest
+
+from ceto.parser import parse
+from ceto.semanticanalysis import quote_expander
+from ceto.macrointerpreter import interpret_macro, MacroInterpreterError
+from ceto.abstractsyntaxtree import Identifier
+
+
+# Each test transpiles (-m) a program with its own macro cache and checks the
+# generated C++. Macros run in-process (ceto/macrointerpreter.py) unless
+# --compiledmacros is passed (or the interpreter can't handle one).
+
+
+def _transpile(tmp_path, name, source, *flags):
+    path = tmp_path / (name + ".ctp")
+    path.write_text(source)
+    env = dict(os.environ, CETO_MACRO_CACHE_DIR=str(tmp_path / "macro_cache"))
+    build_command = [sys.executable, "-m", "ceto", "-m", *flags, str(path)]
+    output = subprocess.check_output(build_command, env=env, stderr=subprocess.STDOUT).decode("utf8")
+    cpp = (tmp_path / (name + ".donotedit.autogenerated.cpp")).read_text()
+    return output, cpp
+
+
+def _main_body(cpp):
+    return cpp[cpp.index("auto main() -> int {"):]
+
+
+# The macro dll build currently fails: the private selfhost ast header uses
+# ceto::make_shared_propagate_const which include/ceto.h lacks.
+xfail_macro_dll = pytest.mark.xfail(raises=subprocess.CalledProcessError,
+                                    reason="macro dll builds fail (ceto::make_shared_propagate_const missing from ceto.h)")
+
+
+def _interpret(body, arg):
+    defmacro_node = parse("defmacro (twice(x), x:\n" + body + "\n)\n").args[0]
+    impl = interpret_macro(defmacro_node, ["x"], quote_expander(defmacro_node.args[-1]))
+    return impl({"x": arg})
+
+
+def test_optional_name(tmp_path):
+    # Node.name() is a std::optional<std::string> as in C++ (an empty one
+    # unless the node is an Identifier)
+    output, cpp = _transpile(tmp_path, "optional_name", r"""
+defmacro (twice(x), x:
+    if (x.name() == "nine":
+        return quote(9 + 9)
+    )
+    if (x.name().has_value() and x.name().value().starts_with("ten"):
+        return quote(10 + 10)
+    )
+    if (x.name() != "eleven" and x.name().value_or("") == "":
+        return quote(unquote(x) + unquote(x))
+    )
+    return quote(0)
+)
+
+def (main:
+    nine = 0
+    tenth = 0
+    eleven = 0
+    std.cout << twice(nine) << twice(tenth) << twice(2) << twice(eleven) << std.endl
+)
+""")
+
+    assert "not interpretable" not in output
+    assert "interpreter error" not in output
+    assert "((((std::cout << (9 + 9)) << (10 + 10)) << (2 + 2)) << 0) << std::endl;" in _main_body(cpp)
+
+
+def test_node_api_errors_are_interpreter_errors():
+    # raised as TypeError / AttributeError by the ast node api (a compile
+    # error in a dll) - the macro is compiled to a dll instead
+
+    # no constructor overload
+    with pytest.raises(MacroInterpreterError, match="can't construct Identifier"):
+        _interpret("    return Identifier(x, x)", Identifier("a"))
+
+    # wrong number of method args
+    with pytest.raises(MacroInterpreterError, match="can't call method clone"):
+        _interpret("    return x.clone(x)", Identifier("a"))
+
+    # method the node lacks
+    with pytest.raises(MacroInterpreterError, match="can't call method lhs"):
+        _interpret("    y = x.lhs()\n    return y", Identifier("a"))
+
+    # attribute the node lacks
+    with pytest.raises(MacroInterpreterError, match="Identifier has no attribute op"):
+        _interpret("    if (x.op == \"+\":\n        return x\n    )", Identifier("a"))
+
+
+def test_lambda_captures_when_created():
+    # as in C++ the lambda sees the value of y when it was defined
+    result = _interpret("""
+    y: mut = x
+    f = lambda(y)
+    y = Identifier("b")
+    return f()""", Identifier("a"))
+    assert result.name == "a"
+
+
+@xfail_macro_dll
+@pytest.mark.parametrize("flags", [[], ["--sharedmacrodll"]])
+def test_interpreter_error_falls_back_to_dll(tmp_path, flags):
+    # cloned_args isn't modelled by the interpreter but that's only known
+    # once the macro runs: the macro is compiled to a dll then (for the
+    # failing expansion and every later one).
+    output, cpp = _transpile(tmp_path, "interpreter_fallback", r"""
+defmacro (twice(x), x:
+    if (x.name() and x.name().value() == "nine":
+        return quote(9 + 9)
+    )
+    args = x.cloned_args()
+    return quote(unquote(x) + unquote(x))
+)
+
+def (main:
+    nine = 0
+    std.cout << twice(nine) << twice(2) << twice(3) << std.endl
+)
+""", *flags)
+
+    assert "not interpretable" not in output
+    assert output.count("macro compiled to a dll (interpreter error): unsupported method cloned_args") == 1
+    assert "(((std::cout << (9 + 9)) << (2 + 2)) << (3 + 3)) << std::endl;" in _main_body(cpp)
+
+
+# Uses every defmacro in include/*.cth (standard lib macros are included in
+# every module): array[index] and array.unsafe[index] (boundscheck.cth),
+# def (func_name<T>), def (destruct: pass) and scope (convenience.cth), and
+# the list comprehensions with and without an if (listcomp.cth, including
+# the if (True) and == special cases).
+bundled_macros_source = r"""
+class (Foo:
+    def (destruct:
+        pass
+    )
+)
+
+def (add<T>:inline, x: T, y: T:
+    return x + y
+)
+
+def (main:
+    v = [1, 2, 3]
+    f = lambda[ref](v[0])
+    scope (:
+        x = v[1] + v[2]
+        std.cout << x << f()
+    )
+    evens = [i * 2, for (i in v), if (i != 2)]
+    all = [i, for (i in v), if (True)]
+    same = [i, for (i in v), if (i == i)]
+    doubled = [i + i, for (i in v)]
+    std.cout << evens.size() << all.size() << same.size() << doubled.size() << add(1, 2) << std.endl
+    Foo()
+    unsafe (:
+        std.cout << v.unsafe[2]
+    )
+)
+"""
+
+
+def _without_gensyms(cpp):
+    # the interpreter's gensym names differ from the (per dll) C++ ones
+    return re.sub(r"ceto__private__(interpreted__)?ident__\d+", "GENSYM", cpp)
+
+
+def test_bundled_macros_interpretable(tmp_path):
+    output, cpp = _transpile(tmp_path, "bundled_macros", bundled_macros_source)
+
+    assert "not interpretable" not in output
+    assert "interpreter error" not in output
+    main = _main_body(cpp)
+    assert "ceto::bounds_check(v, 0)" in main
+    assert "CETO_UNSAFE_ARRAY_ACCESS(v, 2)" in main
+    assert "if constexpr (1) {" in main
+    assert "[&]() {" in main and "ceto__private__interpreted__ident__" in main
+
+
+@xfail_macro_dll
+def test_bundled_macros_both_engines(tmp_path):
+    interpreted_dir = tmp_path / "interpreted"
+    compiled_dir = tmp_path / "compiled"
+    interpreted_dir.mkdir()
+    compiled_dir.mkdir()
+
+    _, interpreted = _transpile(interpreted_dir, "bundled_macros", bundled_macros_source)
+    output, compiled = _transpile(compiled_dir, "bundled_macros", bundled_macros_source, "--compiledmacros")
+
+    assert "ceto__private__interpreted__ident__" not in compiled
+    assert _without_gensyms(interpreted) == _without_gensyms(compiled)
@@ -566,6 +566,307 @@ else:
 
 """)
 
+
+def test_source_locations_across_blocks():
+    source = r"""
+def (foo, x:
+
+    # comment
+    return x
+)
+
+class (Bar:
+    y: int
+)
+"""
+    p = parse(source)
+    foo_def, bar_def = p.args
+    foo_body = foo_def.args[-1]
+    assert foo_def.args[0].source.loc == source.index("foo")
+    assert foo_body.args[0].args[0].source.loc == source.index("x\n)")
+    assert bar_def.args[0].source.loc == source.index("Bar")
+
+
+def test_native_parser_matches_pyparsing():
+    from ceto.parser import CompilationContext
+
+    source = r"""
+def (main:
+    x: mut:std.vector<int> = [1, 2, 3,]
+    y = x[0] + -x.at(1) * (2 + 3) / 4 % *p
+    t = (1,)
+    e = ()
+    z = "s\"é\n"s + u8'c' + 1.5f + 10u
+    s = std.map<int, std.string> {}
+    p = &x->y::z
+    if (not x.empty() and y >= 3:
+        f(args...)
+    elif y <=> 2 == 0 or y in x:
+        lambda[x](a: int, b, return a | b ^ c & d)
+    )
+    for (i in x: pass)
+    z <<= 1
+    return
+)
+"""
+    native = parse(source)
+    assert parse(source, CompilationContext(native_parser=False)).ast_repr() == native.ast_repr()
+
+
+def test_native_preprocessor_matches_python():
+    from ceto.parser import CompilationContext, _preprocess
+    from ceto.preprocessor import PreprocessorError
+
+    source = r"""
+def (main:  # elif else
+    x = "elif \"else\" \\ é" + 'except'
+    s = "multi
+        line"
+    y: std.vector<std.vector<int>> = f<int>(1) < 2 > (3)
+    if (x: pass elif y: pass else: pass)
+    try (f():
+        pass
+    except x:
+        pass
+    except:
+        pass
+    )
+    if (x:
+        pass
+    elif (y, "z"):
+        pass
+    elif: z
+        pass
+    else:
+        pass
+    )
+    do_elif(z.else, elif_)
+)
+
+class (Foo:
+    a: int
+)
+"""
+    native = _preprocess(source, CompilationContext())
+    assert native == _preprocess(source, CompilationContext(native_parser=False))
+    assert len(native[1]) == 2
+
+    # (the python preprocessor reports the error)
+    with pytest.raises(PreprocessorError):
+        _preprocess("def (foo:\n    pass\n", CompilationContext())
+
+
+def test_bounded_packrat_cache(monkeypatch):
+    import ceto.parser
+
+    source = r"""
+def (main:
+    x = [[[1, 2], (3, 4)], foo<bar>(baz[0])]
+    if (x.size() > 2 and not x.empty():
+        std.cout << x[0][0][1] << std.endl
+    )
+)
+"""
+    native = parse(source)
+
+    cache = ceto.parser.PackratCache(50)
+    monkeypatch.setattr(ceto.parser, "_packrat_cache", cache)
+    monkeypatch.setattr(ceto.parser.pp.ParserElement, "packrat_cache", cache)
+
+    assert parse(source, ceto.parser.CompilationContext(native_parser=False, packrat_cache_size=50)).ast_repr() == native.ast_repr()
+    assert cache.cache.hits > 0
+    assert cache.peak_entries == 50
+    assert len(cache) == 0
+
+
+def test_packrat_cache_size_per_context(monkeypatch):
+    import ceto.parser
+    from ceto.parser import CompilationContext
+
+    source = "def (main:\n    x = [[[1, 2], (3, 4)], foo<bar>(baz[0])]\n)\n"
+
+    # installed by the first parse (and restored afterwards)
+    monkeypatch.setattr(ceto.parser, "_packrat_cache", None)
+    monkeypatch.setattr(ceto.parser.pp.ParserElement, "packrat_cache", ceto.parser.pp.ParserElement.packrat_cache)
+
+    parse(source, CompilationContext(native_parser=False, packrat_cache_size=50))
+    cache = ceto.parser._packrat_cache
+    assert cache.peak_entries == 50
+
+    # 0: unbounded
+    parse(source, CompilationContext(native_parser=False, packrat_cache_size=0))
+    assert ceto.parser._packrat_cache is cache
+    assert cache.size is None
+    assert cache.peak_entries > 50
+
+    cache.cache.update((i, None) for i in range(100))
+    ceto.parser._install_packrat_cache(20)
+    assert cache.size == 20
+    assert len(cache) == 20
+
+
+def test_serialized_ast_roundtrip():
+    from ceto.parser import serialize_ast, deserialize_ast
+
+    source = r"""
+def (main:
+    x: mut:std.vector<int> = [1, 2, 3]
+    s = u8"a\"b\n"s + 'c' + 1.5f + 10u
+    p = &x->y::z
+    t = std.map<int, std.string> {}
+    if (not x.empty() and x[0] >= 3:
+        f(args...)
+    )
+    return (x,)
+)
+"""
+    p = parse(source)
+    data = serialize_ast(p)
+    loaded = deserialize_ast(data)
+
+    assert loaded.ast_repr() == p.ast_repr()
+    assert loaded.args[0].args[0].source.loc == p.args[0].args[0].source.loc
+
+    # truncated or wrong version: reparse
+    assert deserialize_ast(data[:-4]) is None
+    assert deserialize_ast(data[:4] + b"\xff" + data[5:]) is None
+    assert deserialize_ast(b"") is None
+
+
+def test_serialized_ast_definitions():
+    from ceto.parser import serialize_ast, load_serialized_ast
+
+    p = parse(r"""
+include <vector>
+
+def (helper, x:
+    return x + 1
+)
+
+def (other, x:
+    return helper(x) * 2
+) : int
+
+class (Foo(Base):
+    a: int
+)
+""")
+    serialized = load_serialized_ast(serialize_ast(p))
+    assert serialized.valid
+    assert serialized.num_definitions() == 4
+    assert [serialized.definition_name(i) for i in range(4)] == ["", "helper", "other", "Foo"]
+    assert "helper" in serialized.referenced_names(2)
+    assert "Base" in serialized.referenced_names(3)
+
+    other = serialized.load_definition(2)
+    assert other.ast_repr() == p.args[2].ast_repr()
+    assert serialized.load().ast_repr() == p.ast_repr()
+
+    # truncated: the tables are checked up front, the definitions when loaded
+    truncated = load_serialized_ast(serialize_ast(p)[:-4])
+    assert truncated.load_definition(3) is None
+    assert truncated.load() is None
+    assert not load_serialized_ast(serialize_ast(p)[:8]).valid
+
+def test_include_resolver(tmp_path):
+    from ceto.parser import _IncludeResolver
+
+    first = tmp_path / "first"
+    second = tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+    (first / "a.cth").write_text("")
+    (second / "a.cth").write_text("")
+    (second / "b.cth").write_text("")
+    dirs = [str(first), str(second), str(tmp_path / "missing")]
+
+    resolver = _IncludeResolver()
+    assert resolver.find("a.cth", dirs) == str(first)
+    assert resolver.find("b.cth", dirs) == str(second)
+    assert resolver.find("c.cth", dirs) is None
+
+    # listed once per build
+    (first / "b.cth").write_text("")
+    assert resolver.find("b.cth", dirs) == str(second)
+    resolver.written(str(first / "b.cth"))
+    assert resolver.find("b.cth", dirs) == str(first)
+
+    index_path = str(tmp_path / "includes.json")
+    resolver.save_index(index_path)
+
+    resolver = _IncludeResolver()
+    resolver.load_index(index_path)
+    assert resolver.find("b.cth", dirs) == str(first)
+
+    (tmp_path / "includes.json").write_text("{")
+    resolver = _IncludeResolver()
+    resolver.load_index(index_path)
+    assert resolver.find("b.cth", dirs) == str(first)
+
+
+def test_concurrent_parse(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from ceto.parser import CompilationContext
+
+    (tmp_path / "hdr.cth").write_text("def (twice, x:\n    return x * 2\n)\n")
+
+    def source(i):
+        return f"include (hdr)\n\ndef (main:\n    x = twice({i}) + [{i}, ({i},)].size()\n)\n"
+
+    def parse_source(i, native_parser):
+        # (separate contexts: hdr is included by each)
+        context = CompilationContext(filename=str(tmp_path / f"main{i}.ctp"), native_parser=native_parser)
+        return parse(source(i), context)
+
+    expected = [parse_source(i, True).ast_repr() for i in range(8)]
+    assert "twice" in expected[0]
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = pool.map(parse_source, range(8), [i % 2 == 0 for i in range(8)])
+        assert [r.ast_repr() for r in results] == expected
+
+    header_def = parse_source(0, True).args[0]
+    assert header_def.source.header_file_cth == str(tmp_path / "hdr.cth")
+
+
+def test_corrupt_parse_cache(tmp_path):
+    from ceto.parser import CompilationContext
+
+    (tmp_path / "hdr.cth").write_text("def (twice, x:\n    return x * 2\n)\n")
+    source = "include (hdr)\n\ndef (main:\n    x = twice(1)\n)\n"
+
+    def parse_source():
+        return parse(source, CompilationContext(filename=str(tmp_path / "main.ctp"))).ast_repr()
+
+    expected = parse_source()
+    [cache_path] = tmp_path.glob("*.cetoast")
+
+    # not valid utf-8: the header is parsed again (and the cache rewritten)
+    cache_path.write_bytes(cache_path.read_bytes().replace(b"twice", b"\xffwice"))
+    assert parse_source() == expected
+    assert b"\xffwice" not in cache_path.read_bytes()
+
+
+def test_parse_jobs():
+    from ceto.parser import CompilationContext, _preprocess, _parse_blocks
+
+    block = "def (foo, x:\n    return [x, (x,)]\n)\n"
+    source = block + "\nclass (Bar:\n    y: int\n)\n\n" + block + "\n" + block
+
+    serial = parse(source, CompilationContext(parse_jobs=1))
+    parallel = parse(source, CompilationContext(parse_jobs=2))
+    assert len(parallel.args) == 4
+    assert parallel.ast_repr(preserve_source_loc=True, ceto_evalable=False) == serial.ast_repr(preserve_source_loc=True, ceto_evalable=False)
+    assert parallel.args[2].args[0].source.loc == source.index("foo", len(block))
+
+    # identical preprocessed blocks each get their own parse
+    foo_block, bar_block = _preprocess(block + "class (Bar:\n    y: int\n)\n", CompilationContext())[1]
+    blocks = [foo_block, bar_block, foo_block]
+    modules = _parse_blocks(blocks, CompilationContext(parse_jobs=2))
+    assert [m.ast_repr() for m in modules] == [m.ast_repr() for m in _parse_blocks(blocks, CompilationContext())]
+    assert modules[0] is not modules[2]
+
+
 # test_array_dict()
 # test_call_array_access()
 # test_non_left_recursive_impl()
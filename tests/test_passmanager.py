@@ -0,0 +1,42 @@
+import pytest
+
+from ceto.parser import parse
+
+
+def test_pass_manager_fusion():
+    from ceto.semanticanalysis import (OneLinerExpander, AssignToNamedParameter, RemoveRedundantParentheses,
+        basic_semantic_analysis_passes, one_liner_expander, assign_to_named_parameter,
+        warn_and_remove_redundant_parenthesese, build_types, build_parents)
+    from ceto.passmanager import Pass, PassManager, fuse
+
+    passes = [OneLinerExpander(), AssignToNamedParameter(), RemoveRedundantParentheses()] + basic_semantic_analysis_passes()
+    assert [[p.name for p in g] for g in fuse(passes)] == [
+        ["one_liner_expander", "assign_to_named_parameter"],
+        ["warn_and_remove_redundant_parenthesese"],
+        ["build_types", "build_parents", "number_nodes"],
+        ["ScopeVisitor"],
+        ["ImplicitLambdaCaptureVisitor"]]
+
+    class Early(Pass):
+        name = "early"
+        requires = ("late",)
+
+    class Late(Pass):
+        name = "late"
+
+    with pytest.raises(ValueError):
+        fuse([Early(), Late()])
+
+    source = r"""
+def (foo, x: int, y = 1:
+    l = lambda(z, z + x)
+    if (x: return (y))
+    f(a = 1, b = 2)
+    return l(x)
+)
+"""
+    fused = PassManager(passes[:5])
+    one_walk_each = build_parents(build_types(warn_and_remove_redundant_parenthesese(assign_to_named_parameter(one_liner_expander(parse(source))))))
+    assert fused.run(parse(source)).ast_repr() == one_walk_each.ast_repr()
+    messages = fused.perf_messages()
+    assert len(messages) == 6 and "(3 walks)" in messages[-1]
@@ -0,0 +1,171 @@
+from ceto.parser import parse
+
+import threading
+
+
+def test_preorder_comes_before():
+    from ceto.semanticanalysis import build_parents, number_nodes
+    from ceto.scope import comes_before
+    from ceto.abstractsyntaxtree import Identifier
+
+    p = build_parents(parse(r"""
+def (foo, x:
+    y = x + 1
+    if (y > 2:
+        z = y
+    elif y:
+        z = [y, x]
+    )
+    return z
+)
+"""))
+
+    nodes = []
+
+    def walk(node):
+        nodes.append(node)
+        for a in node.args:
+            walk(a)
+        if node.func:
+            walk(node.func)
+
+    walk(p)
+    expected = [[comes_before(p, a, b) for b in nodes] for a in nodes]
+
+    number_nodes(p)
+    assert [[comes_before(p, a, b) for b in nodes] for a in nodes] == expected
+    assert [n.preorder_index for n in nodes] == list(range(p.preorder_index, p.subtree_end))
+
+    # not numbered with the tree: walks (and doesn't find) it
+    detached = Identifier("y")
+    assert comes_before(p, detached, nodes[-1]) is False
+    assert comes_before(p, detached, Identifier("z")) is None
+
+    # an earlier numbering of a subtree doesn't count for a later root
+    block = p.args[0].args[-1]
+    number_nodes(block)
+    assert comes_before(p, block.args[0], block.args[-1]) is True
+    assert comes_before(p, block.args[-1], block.args[0]) is False
+
+
+def test_resolved_definitions(monkeypatch, tmp_path):
+    from ceto import semanticanalysis
+    from ceto.semanticanalysis import macro_expansion, semantic_analysis, find_defs, find_def
+    from ceto.abstractsyntaxtree import Identifier
+
+    monkeypatch.setenv("CETO_MACRO_CACHE_DIR", str(tmp_path / "macro_cache"))
+
+    m = semantic_analysis(macro_expansion(parse(r"""
+def (foo, x:
+    y = x + 1
+    z = y
+    for (i in [1, 2]:
+        z = z + i
+    )
+    return z
+)
+""")))
+
+    identifiers = []
+
+    def walk(node):
+        if isinstance(node, Identifier) and node.scope:
+            identifiers.append(node)
+        for a in node.args:
+            walk(a)
+        if node.func:
+            walk(node.func)
+
+    walk(m)
+    assert all(i in semanticanalysis.resolved.definitions for i in identifiers)
+    for i in identifiers:
+        assert list(find_defs(i)) == list(i.scope.find_defs(i))
+        assert find_def(i) == i.scope.find_def(i)
+    returned_z = [i for i in identifiers if i.name == "z"][-1]
+    assert [d.defined_node.name for d in find_defs(returned_z)] == ["z", "y"]  # z = y then y = x + 1
+
+    # created after semantic analysis: looked up
+    new = Identifier("z")
+    new.scope = identifiers[-1].scope
+    assert new not in semanticanalysis.resolved.definitions
+    assert find_def(new) is None
+
+    # an analysis in another thread doesn't touch this one's results
+    thread = threading.Thread(target=lambda: semantic_analysis(macro_expansion(parse("def (bar:\n    pass\n)\n"))))
+    thread.start()
+    thread.join()
+    assert all(i in semanticanalysis.resolved.definitions for i in identifiers)
+
+    # a second analysis doesn't keep the first one's results
+    semantic_analysis(macro_expansion(parse("def (bar:\n    pass\n)\n")))
+    assert not any(i in semanticanalysis.resolved.definitions for i in identifiers)
+
+
+def test_compile_node_drops_resolved_definitions(monkeypatch, tmp_path):
+    # (the nodes must be freed before close_macro_libraries)
+    from ceto import semanticanalysis
+    from ceto.compiler import compile_node
+
+    monkeypatch.setenv("CETO_MACRO_CACHE_DIR", str(tmp_path / "macro_cache"))
+
+    code, module = compile_node(parse("def (foo, x:\n    y = x + 1\n    return y\n)\n"))
+    assert "auto foo(" in code
+    assert not semanticanalysis.resolved.definitions
+
+
+def test_reanalyze_rewritten_regions(monkeypatch, tmp_path):
+    from ceto.semanticanalysis import macro_expansion, semantic_analysis, find_def
+    from ceto.abstractsyntaxtree import Identifier, Call, ArrayAccess, Assign, AttributeAccess
+
+    monkeypatch.setenv("CETO_MACRO_CACHE_DIR", str(tmp_path / "macro_cache"))
+
+    perf_messages = []
+    m = semantic_analysis(macro_expansion(parse(r"""
+class (Foo:
+    items: [int]
+
+    def (bar, x:
+        for (i in self.items:
+            self.baz(i)
+        )
+        unsafe(:
+            y = x
+            z = y
+        )
+    )
+
+    def (baz, i:
+        pass
+    )
+)
+""")), perf_messages)
+
+    assert "of 2 rewritten regions" in perf_messages[-1]
+
+    nodes = []
+
+    def walk(node, parent):
+        assert node.parent is parent
+        nodes.append(node)
+        for a in node.args:
+            walk(a, node)
+        if node.func:
+            walk(node.func, node)
+
+    for a in m.args:
+        walk(a, m)
+    assert all(n.scope for n in nodes)
+
+    ban_lambda = [n for n in nodes if isinstance(n, Call) and isinstance(n.func, ArrayAccess) and n.func.func.name == "lambda"]
+    assert len(ban_lambda) == 1
+    unsafe_if = [n for n in nodes if isinstance(n, Call) and n.func.name == "if"]
+    assert len(unsafe_if) == 1
+    assert unsafe_if[0].args[1].scope.parent == unsafe_if[0].args[0].scope
+
+    # definitions made inside (and outside) a rewritten region are found
+    x, y = [n for n in nodes if isinstance(n, Identifier) and isinstance(n.parent, Assign) and n.parent.rhs is n]
+    assert find_def(x).defined_node.parent.func.name == "def"
+    assert find_def(y).defined_node.parent.lhs.name == "y"
+    iterable = [n for n in nodes if isinstance(n, Identifier) and n.name == "items" and isinstance(n.parent, AttributeAccess)]
+    assert len(iterable) == 2  # the iterable and its clone in the ban lambda
+    assert all(i.scope.in_function_body for i in iterable)